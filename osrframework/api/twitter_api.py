@@ -23,7 +23,6 @@
 import argparse
 import json
 import time
-import tweepy #https://github.com/tweepy/tweepy
 import csv
 
 import osrframework.utils.config_api_keys as api_keys
@@ -53,6 +52,8 @@ class TwitterAPIWrapper(APIWrapper):
         '''
             :return: A tweepy.API object that performs the queries
         '''
+        import tweepy #https://github.com/tweepy/tweepy
+
         #authorize twitter, initialize tweepy
         auth = tweepy.OAuthHandler(self.consumer_key, self.consumer_secret)
         auth.set_access_token(self.access_key, self.access_secret)
@@ -704,6 +705,8 @@ class TwitterAPIWrapper(APIWrapper):
 
             :return:    User.                        
         '''
+        import tweepy #https://github.com/tweepy/tweepy
+
         # Connecting to the API
         api = self._connectToAPI()
 
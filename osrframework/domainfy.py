@@ -34,9 +34,9 @@ import argparse
 import datetime as dt
 import json
 import os
+import random
 import signal
-import socket
-import whois
+import string
 
 # global issues for multiprocessing
 from multiprocessing import Process, Queue, Pool
@@ -49,9 +49,14 @@ import osrframework.domains.brand_tld as brand_tld
 import osrframework.domains.other_subdomains as other_subdomains
 
 import osrframework.utils.banner as banner
+import osrframework.utils.checkpoint as checkpoint
 import osrframework.utils.platform_selection as platform_selection
 import osrframework.utils.configuration as configuration
 import osrframework.utils.general as general
+import osrframework.utils.resolver as resolver
+import osrframework.utils.sinks as sinks
+import osrframework.utils.task_runner as task_runner
+import osrframework.utils.whois_stage as whois_stage
 
 # Defining the TLD dictionary based on <https://en.wikipedia.org/wiki/List_of_Internet_top-level_domains>
 TLD = {}
@@ -68,6 +73,13 @@ TLD["brand"] = brand_tld.tld
 # Brand TLD
 TLD["other"] = other_subdomains.tld
 
+# Random labels resolved in each TLD to learn whether it resolves any name
+WILDCARD_PROBES = 2
+# Wildcard answers of the TLDs already probed in this run
+_WILDCARDS = {}
+# Work of the whois stage of the last run
+_WHOIS_STATS = {}
+
 def getNumberTLD():
     """
     Counting the total number of TLD being processed.
@@ -90,6 +102,10 @@ def getWhoisInfo(domain):
     --------
         dict: A dictionary containing the result as an i3visio entity with its
             `value`, `type` and `attributes`.
+
+    Raises:
+    -------
+        WhoisThrottledError: If the whois server refused to answer.
     """
     new = []
 
@@ -103,7 +119,19 @@ def getWhoisInfo(domain):
     except:
         pass
 
-    info = whois.whois(domain)
+    # It is only imported if --whois is used
+    import whois
+
+    try:
+        info = whois.whois(domain)
+    except whois.parser.PywhoisError as e:
+        # The parser raises the text of the answers it does not understand
+        if whois_stage.isThrottled(e):
+            raise whois_stage.WhoisThrottledError(str(e))
+        raise
+
+    if whois_stage.isThrottled(info.text):
+        raise whois_stage.WhoisThrottledError(info.text)
 
     if info.status == None:
         raise Exception("UnknownDomainError: " + domain + " could not be resolved.")
@@ -230,32 +258,118 @@ def isBlackListed(ipv4):
     else:
         return False
 
-def pool_function(domain, launchWhois = False):
+
+def getRandomLabel(length=20):
     """
-    Wrapper for being able to launch all the threads of getPageWrapper.
+    Method that generates a label that is surely not registered.
 
     Args:
     -----
-        domain: We receive the parameters as a dictionary.
+        length: The number of characters of the label.
+
+    Returns:
+    --------
+        str: A random string of lowercase letters and digits.
+    """
+    return "".join(random.choice(string.ascii_lowercase + string.digits) for i in range(length))
+
+
+def probeWildcards(tlds, maxInFlight=1000):
+    """
+    Method that learns which TLDs resolve any name.
+
+    Some registries resolve every name under their TLD, so every candidate
+    would be found there. Each TLD is probed once per run with a few random
+    labels and the addresses returned for them are the wildcard answers of
+    the TLD.
+
+    Args:
+    -----
+        tlds: List of tlds, e. g. [".com", ".i3visio.com"].
+        maxInFlight: Maximum number of queries waiting for an answer.
+
+    Returns:
+    --------
+        dict: The set of wildcard addresses of each tld. It is empty if the
+            tld does not resolve the random labels.
+    """
+    probes = {}
+    for tld in set(tlds):
+        if tld not in _WILDCARDS:
+            for i in range(WILDCARD_PROBES):
+                probes[getRandomLabel() + tld] = tld
+
+    answers = dict([(tld, set()) for tld in probes.values()])
+    for name, addresses, error in resolver.getResolver().resolveMany(probes.keys(), "A", maxInFlight=maxInFlight):
+        if addresses:
+            answers[probes[name]].update(addresses)
+    _WILDCARDS.update(answers)
+    return dict([(tld, _WILDCARDS[tld]) for tld in tlds])
+
+
+def isWildcard(domain, addresses, wildcards):
+    """
+    Method that checks if a domain only resolves to the wildcard answers of
+    its tld.
+
+    Args:
+    -----
+        domain: The domain as a dictionary.
+        addresses: The list of IPv4 addresses of the domain.
+        wildcards: The wildcard addresses of each tld as returned by
+            `probeWildcards`.
+
+    Returns:
+    --------
+        bool: It returns whether the domain is a false positive.
+    """
+    tldWildcards = wildcards.get(domain["tld"])
+    return bool(addresses) and bool(tldWildcards) and set(addresses) <= tldWildcards
+
+def getDomainResult(domain, addresses, launchWhois=False, wildcards={}, whoisInfo=None, error=None):
+    """
+    Method that builds the result of a domain once it has been resolved.
+
+    Args:
+    -----
+        domain: The domain as a dictionary.
         ```
         {
-            "domain" : ".com",
-            "type" : "global"
+            "domain" : "i3visio.com",
+            "type" : "global",
+            "tld": ".com"
         }
         ```
+        addresses: The list of IPv4 addresses of the domain. It is empty if
+            the domain does not exist and None if it could not be resolved.
         launchWhois: Whether the whois info will be launched.
+        wildcards: The wildcard addresses of each tld as returned by
+            `probeWildcards`.
+        whoisInfo: The whois info of the domain already recovered as returned
+            by `getWhoisInfo`. If provided, no whois query is launched.
+        error: The reason why the domain could not be resolved, if so.
     Returns:
     --------
         dict: A dictionary containing the following values:
-        `{"platform" : str(domain), "status": "DONE", "data": aux}`
+        `{"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "DONE", "data": aux}`
+        The domains that could not be resolved also carry the `error`.
     """
-    is_valid = True
     try:
-        ipv4 = socket.gethostbyname(domain["domain"])
+        if addresses == None:
+            # The name servers did not answer, so it is unknown whether the
+            # domain exists
+            return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "ERROR", "data": {}, "error": str(error)}
+        if not addresses:
+            # The domain does not exist
+            return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "ERROR", "data": {}}
+        if isWildcard(domain, addresses, wildcards):
+            # The tld resolves any name
+            return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "WILDCARD", "data": {}}
+        ipv4 = addresses[0]
 
         # Check if this ipv4 normally throws false positives
         if isBlackListed(ipv4):
-            return {"platform" : str(domain), "status": "ERROR", "data": {}}
+            return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "ERROR", "data": {}}
 
         #If we arrive here... The domain exists!!
         aux = {}
@@ -265,7 +379,9 @@ def pool_function(domain, launchWhois = False):
 
         # Performing whois info and adding if necessary
         try:
-            if domain["type"] != "global" and launchWhois:
+            if whoisInfo != None:
+                aux["attributes"] = list(whoisInfo)
+            elif domain["type"] != "global" and launchWhois:
                 aux["attributes"] = getWhoisInfo(domain["domain"])
         except Exception as e:
             # If something happened... Well, we'll return an empty attributes array.
@@ -292,12 +408,62 @@ def pool_function(domain, launchWhois = False):
 
         aux["attributes"].append(tmp)
 
-        return {"platform" : str(domain), "status": "DONE", "data": aux}
+        return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "DONE", "data": aux}
     except Exception as e:
-        return {"platform" : str(domain), "status": "ERROR", "data": {}}
+        return {"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "ERROR", "data": {}}
 
 
-def performSearch(domains=[], nThreads=16, launchWhois=False):
+def pool_function(domain, launchWhois = False, wildcards={}):
+    """
+    Wrapper for being able to launch all the threads of getPageWrapper.
+
+    Args:
+    -----
+        domain: We receive the parameters as a dictionary.
+        ```
+        {
+            "domain" : ".com",
+            "type" : "global"
+        }
+        ```
+        launchWhois: Whether the whois info will be launched.
+        wildcards: The wildcard addresses of each tld as returned by
+            `probeWildcards`.
+    Returns:
+    --------
+        dict: A dictionary containing the following values:
+        `{"platform" : str(domain), "query": domain["domain"], "tld": domain["tld"], "status": "DONE", "data": aux}`
+    """
+    try:
+        addresses = resolver.getResolver().resolve(domain["domain"], "A")
+        error = None
+    except Exception as e:
+        addresses = None
+        error = e
+    return getDomainResult(domain, addresses, launchWhois, wildcards, error=error)
+
+
+def resolveDomain(domain):
+    """
+    Method that resolves a domain in a thread of the pool.
+
+    Args:
+    -----
+        domain: The domain as a dictionary.
+
+    Returns:
+    --------
+        tuple: The domain, the list of its IPv4 addresses, empty if it does
+            not exist, and the error if it could not be resolved, in which
+            case the addresses are None.
+    """
+    try:
+        return domain, resolver.getResolver().resolve(domain["domain"], "A"), None
+    except Exception as e:
+        return domain, None, e
+
+
+def performSearch(domains=[], nThreads=16, launchWhois=False, journal=None, done={}, sink=None, engine="async", maxInFlight=1000, detectWildcards=True, whoisPerServer=2, whoisCacheTtl=30 * 24 * 3600):
     """
     Method to perform the mail verification process.
 
@@ -306,6 +472,25 @@ def performSearch(domains=[], nThreads=16, launchWhois=False):
         domains: List of domains to check.
         nThreads: Number of threads to use.
         launchWhois: Sets if whois queries will be launched.
+        journal: The <checkpoint.Journal> where each domain is stored as soon
+            as it is checked.
+        done: A dictionary with the domains checked by a previous run as
+            returned by <checkpoint.Journal.load>. They are not checked again
+            and their results are added to the ones of this run.
+        sink: The <sinks.SinkGroup> where the domains are written as soon as
+            they are found.
+        engine: The way in which the domains are resolved: async (all the
+            queries are sent at once over UDP from a single thread) or threads
+            (a blocking query per thread).
+        maxInFlight: Maximum number of queries waiting for an answer at the
+            same time when using the async engine.
+        detectWildcards: Whether the tlds are probed with random names to
+            discard the domains that only resolve to their wildcard answers.
+        whoisPerServer: Maximum number of whois queries running at the same
+            time against the same whois server.
+        whoisCacheTtl: Seconds during which the whois info of a domain is
+            recovered from the cache instead of querying the server. 0
+            disables the cache.
 
     Returns
     -------
@@ -320,57 +505,101 @@ def performSearch(domains=[], nThreads=16, launchWhois=False):
     if len(domains) == 0:
         return results
 
-    # If the process is executed by the current app, we use the Processes. It is faster than pools.
-    if nThreads <= 0 or nThreads > len(domains):
-        nThreads = len(domains)
-
-    # Launching the Pool
-    # ------------------
-    # Example catched from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
-    try:
-        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-        pool = Pool(nThreads)
-        signal.signal(signal.SIGINT, original_sigint_handler)
-    except ValueError:
-        # To avoid: ValueError: signal only works in main thread
-        pool = Pool(nThreads)
-
+    tasks = []
     poolResults = []
-    try:
-        def log_result(result):
-            # This is called whenever foo_pool(i) returns a result.
-            # result_list is modified only by the main process, not the pool workers.
-            poolResults.append(result)
-
-        for d in domains:
+    for d in domains:
+        if (d["domain"], d["tld"]) in done:
+            # Recovering the domains checked before the run was stopped
+            poolResults.append(done[(d["domain"], d["tld"])])
+            if sink != None and done[(d["domain"], d["tld"])]["data"] != {}:
+                sink.write(done[(d["domain"], d["tld"])]["data"])
+        else:
             # We need to create all the arguments that will be needed
-            parameters = ( d, launchWhois, )
-            pool.apply_async (pool_function, args= parameters, callback = log_result )
+            tasks.append(( d, launchWhois, ))
+
+    # Domains of this run already checked
+    processed = set()
+
+    def storeResult(result):
+        poolResults.append(result)
+        # The domains that could not be resolved are checked again on resume
+        isDone = result.get("error") == None
+        if isDone:
+            processed.add((result["query"], result["tld"]))
+        if journal != None:
+            journal.append(result["query"], result["tld"], result, done=isDone)
+        if sink != None and result["data"] != None and result["data"] != {}:
+            sink.write(result["data"])
+
+    # The whois info is recovered in the background while the rest of the
+    # domains are resolved
+    stage = None
+    if launchWhois and tasks:
+        stage = whois_stage.WhoisStage(
+            getWhoisInfo,
+            nThreads=nThreads,
+            maxPerServer=whoisPerServer,
+            cache=whois_stage.getWhoisCache() if whoisCacheTtl > 0 else None,
+            ttl=whoisCacheTtl
+        )
+
+    def storeWhoisResults(block=False):
+        for name, (d, addresses), info in stage.getResults(block=block):
+            storeResult(getDomainResult(d, addresses, wildcards=wildcards, whoisInfo=info))
+
+    def storeAnswer(d, addresses, error):
+        if stage != None and addresses and d["type"] != "global" and not isWildcard(d, addresses, wildcards) and not isBlackListed(addresses[0]):
+            stage.submit(d["domain"], (d, addresses))
+        else:
+            storeResult(getDomainResult(d, addresses, wildcards=wildcards, error=error))
+        if stage != None:
+            storeWhoisResults()
 
-        # Waiting for results to be finished
-        while len(poolResults) < len(domains):
-            pass
-        # Closing normal termination
-        pool.close()
+    runner = None
+    wildcards = {}
+    try:
+        if detectWildcards and tasks:
+            wildcards.update(probeWildcards([d["tld"] for d, whois in tasks], maxInFlight=maxInFlight))
+
+        if engine == "async":
+            # Domains waiting for their answer by name
+            byName = {}
+            for d, whois in tasks:
+                byName.setdefault(d["domain"].lower(), []).append(d)
+            for name, addresses, error in resolver.getResolver().resolveMany([d["domain"] for d, whois in tasks], "A", maxInFlight=maxInFlight):
+                storeAnswer(byName[name.lower()].pop(0), addresses, error)
+        else:
+            # Threads share the answers cached by the resolver
+            runner = task_runner.TaskRunner(resolveDomain, nThreads=nThreads, useThreads=True)
+            for d, addresses, error in runner.run([(d, ) for d, whois in tasks]):
+                storeAnswer(d, addresses, error)
+
+        # Waiting for the whois info of the last domains
+        while stage != None and stage.getPending() > 0:
+            storeWhoisResults(block=True)
     except KeyboardInterrupt:
         print(general.warning("\nProcess manually stopped by the user. Terminating workers.\n"))
-        pool.terminate()
+        if runner != None:
+            runner.terminate()
         print(general.warning("The following domains were not processed:"))
         pending_tld = ""
-        for d in domains:
-            processed = False
-            for processedDomain in poolResults:
-                if str(d) == processedDomain["platform"]:
-                    processed = True
-                    break
-            if not processed:
+        for d, whois in tasks:
+            if (d["domain"], d["tld"]) not in processed:
                 print(general.warning("\t- " + str(d["domain"])))
                 pending_tld += " " + str(d["tld"])
         print(general.warning("[!] If you want to relaunch the app with these domains you can always run the command with: "))
         print(general.warning("\t domainfy.py ... -t none -u " + pending_tld))
         print(general.warning("[!] If you prefer to avoid these platforms you can manually evade them for whatever reason with: "))
         print(general.warning("\t domainfy.py ... -x " + pending_tld))
-    pool.join()
+    finally:
+        if stage != None:
+            stage.close()
+            _WHOIS_STATS.clear()
+            _WHOIS_STATS.update(stage.stats)
+
+    failed = [r["query"] for r in poolResults if r.get("error") != None]
+    if failed:
+        print(general.warning("[!] " + str(len(failed)) + " domain(s) could not be resolved as the name servers did not answer." + (" They will be checked again if the run is resumed with --resume." if journal != None else "")))
 
     # Processing the results
     # ----------------------
@@ -444,21 +673,52 @@ visit """ + general.LICENSE_URL + "\n"
             print(str(startTime) + "\tTrying to identify the existence of " + general.emphasis(str(len(domains))) + " domain(s)... Relax!\n")
             print(general.emphasis("\tPress <Ctrl + C> to stop...\n"))
 
+        # Storing each domain as soon as it is checked so as to be able to
+        # resume the run if it is stopped
+        journalHeader = None
+        if args.output_folder != None:
+            if not os.path.exists(args.output_folder):
+                os.makedirs(args.output_folder)
+            journalHeader = os.path.join(args.output_folder, args.file_header)
+        try:
+            journal, done = checkpoint.getJournal("domainfy", resume=args.resume, fileHeader=journalHeader, queries=[d["domain"] for d in domains])
+        except (IOError, ValueError) as e:
+            print(general.error("ERROR: the journal could not be opened. " + str(e)))
+            return results
+
+        # Writing the domains as soon as they are found
+        sink = None
+        if journalHeader != None:
+            sink = sinks.getSinks(journalHeader, args.stream)
+
+        # Resolving the domains with the answers cached by the previous runs
+        dns = resolver.getResolver(nameservers=args.nameservers, ttl=args.dns_cache_ttl, negativeTtl=args.dns_negative_ttl)
+
         # Perform searches, using different Threads
-        results = performSearch(domains, args.threads, args.whois)
+        results = performSearch(domains, args.threads, args.whois, journal=journal, done=done, sink=sink, engine=args.engine, maxInFlight=args.max_in_flight, detectWildcards=not args.avoid_wildcard_detection, whoisPerServer=args.whois_per_server, whoisCacheTtl=args.whois_cache_ttl)
+        if journal != None:
+            journal.close()
+        if sink != None:
+            sink.close()
 
         # Trying to store the information recovered
         if args.output_folder != None:
             if not os.path.exists(args.output_folder):
                 os.makedirs(args.output_folder)
-            # Grabbing the results
+            # Grabbing the results from the stream when it is available
+            profiles = results
+            if sink.getPath("jsonl") != None:
+                profiles = list(sinks.readJsonLines(sink.getPath("jsonl")))
             fileHeader = os.path.join(args.output_folder, args.file_header)
             for ext in args.extension:
                 # Generating output files
-                general.exportUsufy(results, ext, fileHeader)
+                general.exportUsufy(profiles, ext, fileHeader)
 
         # Showing the information gathered if requested
         if not args.quiet:
+            print("DNS cache:\t" + general.emphasis(resolver.getStatsSummary(dns.getStats())) + "\n")
+            if args.whois and _WHOIS_STATS:
+                print("Whois:\t\t" + general.emphasis(whois_stage.getStatsSummary(_WHOIS_STATS)) + "\n")
             print("A summary of the results obtained are shown in the following table:\n")
             try:
                 print(general.success(general.usufyToTextExport(results)))
@@ -471,6 +731,11 @@ visit """ + general.LICENSE_URL + "\n"
             for ext in args.extension:
                 # Showing the output files
                 print("\t" + general.emphasis(fileHeader + "." + ext))
+            if journal != None:
+                print("\t" + general.emphasis(journal.path))
+            if sink != None:
+                for s in sink.sinks:
+                    print("\t" + general.emphasis(s.fPath))
 
         # Showing the execution time...
         if not args.quiet:
@@ -511,7 +776,17 @@ def getParser():
     groupProcessing.add_argument('-t', '--tlds',  metavar='<tld_type>',  nargs='+', choices=["all", "none"] + TLD.keys(), action='store', help='List of tld types where the nick will be looked for.', required=False, default=DEFAULT_VALUES["tlds"])
     groupProcessing.add_argument('-u', '--user_defined',  metavar='<new_tld>',  nargs='+', action='store', help='Additional TLD that will be searched.', required=False, default = DEFAULT_VALUES["user_defined"])
     groupProcessing.add_argument('-x', '--exclude', metavar='<domain>', nargs='+', required=False, default=excludeList, action='store', help="select the domains to be avoided. The format should include the initial '.'.")
+    groupProcessing.add_argument('--resume', metavar='<journal>', required=False, default=None, action='store', help='path to the journal of a previous run that was stopped. The domains already checked are not checked again and their results are added to the output files. By default, the journal is stored next to the output files as <file_header>.journal.jsonl.')
+    groupProcessing.add_argument('--stream', metavar='<format>', nargs='+', choices=sorted(sinks.SINKS.keys()), required=False, default=DEFAULT_VALUES.get("stream", ["jsonl"]), action='store', help='formats of the files where the domains are written as soon as they are found: jsonl (a JSON entity per line) and csv (a row per attribute). They are stored next to the output files as <file_header>.stream.<format> and the jsonl stream is used to generate the output files. Default: jsonl.')
+    groupProcessing.add_argument('--engine', metavar='<engine>', choices=['async', 'threads'], required=False, default=DEFAULT_VALUES.get("engine", "async"), action='store', help='the way in which the domains are resolved: async (all the queries are sent at once over UDP from a single thread, default) or threads (a blocking query in each thread).')
+    groupProcessing.add_argument('--max_in_flight', metavar='<number>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("max_in_flight", 1000)), help='maximum number of DNS queries waiting for an answer at the same time when using the async engine. Default: 1000.')
+    groupProcessing.add_argument('--nameservers', metavar='<host[:port]>', nargs='+', required=False, default=DEFAULT_VALUES.get("nameservers", []), action='store', help='name servers used to resolve the domains, e. g. a local resolver such as 127.0.0.1:5353. By default, the ones in /etc/resolv.conf.')
+    groupProcessing.add_argument('--dns_cache_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("dns_cache_ttl", 3600)), help='maximum seconds during which a DNS answer is cached in memory and on disk. 0 to resolve every domain again. Default: 3600.')
+    groupProcessing.add_argument('--dns_negative_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("dns_negative_ttl", 600)), help='seconds during which a domain that does not exist is cached. Default: 600.')
+    groupProcessing.add_argument('--avoid_wildcard_detection', required=False, action='store_true', default=False, help='tells the program not to probe each tld with random names to discard the domains that only resolve to the answers given for any name.')
     groupProcessing.add_argument('--whois', required=False, action='store_true', default=False, help='tells the program to launch whois queries.')
+    groupProcessing.add_argument('--whois_per_server', metavar='<num>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("whois_per_server", 2)), help='maximum number of whois queries running at the same time against the same whois server. Default: 2.')
+    groupProcessing.add_argument('--whois_cache_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("whois_cache_ttl", 2592000)), help='seconds during which the whois info of a domain is recovered from the cache instead of querying the whois server. Set it to 0 to query every domain again. Default: 2592000 (30 days).')
 
     # Getting a sample header for the output files
     groupProcessing.add_argument('-F', '--file_header', metavar='<alternative_header_file>', required=False, default=DEFAULT_VALUES["file_header"], action='store', help='Header for the output filenames to be generated. If None was provided the following will be used: profiles.<extension>.' )
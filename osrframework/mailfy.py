@@ -46,9 +46,14 @@ import validate_email
 
 import osrframework.thirdparties.haveibeenpwned_com.hibp as hibp
 import osrframework.utils.banner as banner
+import osrframework.utils.checkpoint as checkpoint
 import osrframework.utils.platform_selection as platform_selection
 import osrframework.utils.configuration as configuration
 import osrframework.utils.general as general
+import osrframework.utils.resolver as resolver
+import osrframework.utils.smtp_verifier as smtp_verifier
+import osrframework.utils.sinks as sinks
+import osrframework.utils.task_runner as task_runner
 
 # Pending
 #188.com", "21cn.cn", "popo.163.com", "vip.126.com", "vip.163.com", "vip.188.com"
@@ -291,7 +296,7 @@ def pool_function(args):
         A dictionary representing whether the verification was ended
         successfully. The format is as follows:
         ```
-        {"platform": "str(domain["value"])", "status": "DONE", "data": aux}
+        {"platform": "str(domain["value"])", "query": email, "status": "DONE", "data": aux}
         ```
     """
     is_valid = True
@@ -305,8 +310,24 @@ def pool_function(args):
         print(general.warning("WARNING. An error was found when performing the search. You can omit this message.\n" + str(e)))
         is_valid = False
 
+    return getVerificationResult(args, is_valid)
+
+
+def getVerificationResult(e, is_valid):
+    """
+    Method that builds the result of the verification of an email.
+
+    Args:
+    -----
+        e: The email verified.
+        is_valid: Whether the email exists.
+
+    Returns:
+    --------
+        A dictionary as returned by pool_function.
+    """
+    email, alias, domain = getMoreInfo(e)
     if is_valid:
-        email, alias, domain = getMoreInfo(args)
         aux = {}
         aux["type"] = "i3visio.profile"
         aux["value"] = domain["value"] + " - " + alias["value"]
@@ -315,12 +336,12 @@ def pool_function(args):
         aux["attributes"].append(alias)
         aux["attributes"].append(domain)
 
-        return {"platform": str(domain["value"]), "status": "DONE", "data": aux}
+        return {"platform": str(domain["value"]), "query": e, "status": "DONE", "data": aux}
     else:
-        return {"platform": str(domain["value"]), "status": "DONE", "data": {}}
+        return {"platform": str(domain["value"]), "query": e, "status": "DONE", "data": {}}
 
 
-def performSearch(emails=[], nThreads=16, secondsBeforeTimeout=5):
+def performSearch(emails=[], nThreads=16, secondsBeforeTimeout=None, journal=None, done={}, sink=None, engine="smtp", sessionsPerHost=2):
     """
     Method to perform the mail verification process.
 
@@ -328,34 +349,27 @@ def performSearch(emails=[], nThreads=16, secondsBeforeTimeout=5):
     -----
         emails: list of emails to be verified.
         nThreads: the number of threads to be used. Default: 16 threads.
-        secondsBeforeTimeout: number of seconds to wait before raising a
-            timeout. Default: 5 seconds.
+        secondsBeforeTimeout: number of seconds to wait for the whole list of
+            emails. The emails not verified by then are discarded. Default:
+            None, which waits for all of them.
+        journal: The <checkpoint.Journal> where each verification is stored
+            as soon as it is completed.
+        done: A dictionary with the verifications completed by a previous
+            run as returned by <checkpoint.Journal.load>. They are not
+            launched again and their results are added to the ones of this
+            run.
+        sink: The <sinks.SinkGroup> where the emails verified are written as
+            soon as they are found.
+        engine: The way in which the emails are verified: "smtp" (grouping
+            them by mail server and reusing the SMTP sessions) or "emailahoy"
+            (a new session for each email).
+        sessionsPerHost: Maximum number of SMTP sessions opened at the same
+            time with each mail server when using the smtp engine.
 
     Returns:
     --------
         The results collected.
     """
-    # Getting starting time
-    _startTime = time.time()
-
-    def hasRunOutOfTime(oldEpoch):
-        """
-        Function that checks if a given time has passed.
-
-        It verifies whether the oldEpoch has passed or not by checking if the
-        seconds passed are greater.
-
-        Arguments
-        ---------
-            oldepoch: Seconds passed since 1970 as returned by `time.time()`.
-
-        Returns
-        -------
-            A boolean representing whether it has run out of time.
-        """
-        now = time.time()
-        return now - oldEpoch >= secondsBeforeTimeout
-
     results = []
     args = []
 
@@ -368,64 +382,69 @@ def performSearch(emails=[], nThreads=16, secondsBeforeTimeout=5):
     if len(args) == 0:
         return results
 
-    # If the process is executed by the current app, we use the Processes. It is faster than pools.
-    if nThreads <= 0 or nThreads > len(args):
-        nThreads = len(args)
-
-    # Launching the Pool
-    # ------------------
-    # Example catched from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
-    try:
-        original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-        pool = Pool(nThreads)
-        signal.signal(signal.SIGINT, original_sigint_handler)
-    except ValueError:
-        # To avoid: ValueError: signal only works in main thread
-        pool = Pool(nThreads)
-
+    tasks = []
     poolResults = []
-    try:
-        def log_result(result):
-            # This is called whenever foo_pool(i) returns a result.
-            # result_list is modified only by the main process, not the pool workers.
-            poolResults.append(result)
-
-        for m in emails:
+    for m in emails:
+        key = (m, m.split("@")[1])
+        if key in done:
+            # Recovering the verifications completed before the run was stopped
+            poolResults.append(done[key])
+            if sink != None and done[key]["data"] != {}:
+                sink.write(done[key]["data"])
+        else:
             # We need to create all the arguments that will be needed
-            parameters = ( m, )
-            pool.apply_async (pool_function, args= parameters, callback = log_result )
+            tasks.append(( m, ))
+
+    def storeResult(result, isDone=True):
+        poolResults.append(result)
+        if journal != None:
+            journal.append(result["query"], result["platform"], result, done=isDone)
+        if sink != None and result["data"] != None and result["data"] != {}:
+            sink.write(result["data"])
+
+    if engine == "smtp":
+        # The emails of each mail server are verified in batches
+        verifier = smtp_verifier.SMTPVerifier(sessionsPerHost=sessionsPerHost)
+        tasks = verifier.getTasks([t[0] for t in tasks], nThreads)
+        runner = verifier.getRunner(nThreads=nThreads, secondsBeforeTimeout=secondsBeforeTimeout)
+    else:
+        runner = task_runner.TaskRunner(pool_function, nThreads=nThreads, secondsBeforeTimeout=secondsBeforeTimeout)
 
-        # Waiting for results to be finished or time to pass
-        while len(poolResults) < len(emails) and not hasRunOutOfTime(_startTime):
-            pass
+    def getPendingEmails():
+        pendingEmails = []
+        for parameters in runner.getPending():
+            if engine == "smtp":
+                pendingEmails += parameters[1]
+            else:
+                pendingEmails.append(parameters[0])
+        return pendingEmails
 
-        # Closing normal termination
-        pool.close()
+    try:
+        for result in runner.run(tasks):
+            if engine == "smtp":
+                # The emails that could not be checked are retried if resumed
+                for email, outcome, code in result:
+                    storeResult(getVerificationResult(email, outcome == smtp_verifier.FOUND), isDone=outcome != smtp_verifier.UNKNOWN)
+            else:
+                storeResult(result)
+
+        if runner.timedOut:
+            print(general.warning("[!] The time given to mailfy has run out. " + str(len(getPendingEmails())) + " email(s) were not verified."))
     except KeyboardInterrupt:
         print(general.warning("\n[!] Process manually stopped by the user. Terminating workers.\n"))
-        pool.terminate()
+        runner.terminate()
 
         pending = ""
 
-        print(general.warning("[!] The following platforms were not processed:"))
-        for m in emails:
-            processed = False
-            for result in poolResults:
-                if str(m) in json.dumps(result["data"]):
-                    processed = True
-                    break
-            if not processed:
-                print("\t- " + str(p))
-                pending += " " + str(m)
+        print(general.warning("[!] The following emails were not processed:"))
+        for e in getPendingEmails():
+            print("\t- " + str(e))
+            pending += " " + str(e)
 
         print("\n")
-        print(general.warning("If you want to relaunch the app with these platforms you can always run the command with: "))
-        print("\t mailfy.py ... -p " + general.emphasis(pending))
+        print(general.warning("If you want to relaunch the app with these emails you can always run the command with: "))
+        print("\t mailfy.py ... -m " + general.emphasis(pending))
         print("\n")
-        print(general.warning("If you prefer to avoid these platforms you can manually evade them for whatever reason with: "))
-        print("\t mailfy.py ... -x " + general.emphasis(pending))
-        print("\n")
-    pool.join()
 
     # Processing the results
     # ----------------------
@@ -435,8 +454,6 @@ def performSearch(emails=[], nThreads=16, secondsBeforeTimeout=5):
         if data != None and data != {}:
             results.append(data)
 
-    pool.close()
-
     return results
 
 
@@ -498,13 +515,39 @@ be used instead. Verification may be slower though."""))
 
         startTime= dt.datetime.now()
 
+        journal = None
+        sink = None
+        journalHeader = None
+        if args.output_folder != None:
+            if not os.path.exists(args.output_folder):
+                os.makedirs(args.output_folder)
+            journalHeader = os.path.join(args.output_folder, args.file_header)
+            # Writing the results as soon as they are found
+            sink = sinks.getSinks(journalHeader, args.stream)
+
         if not args.is_leaked:
+            # Storing each verification as soon as it is completed so as to
+            # be able to resume the run if it is stopped
+            try:
+                journal, done = checkpoint.getJournal("mailfy", resume=args.resume, fileHeader=journalHeader, queries=emails)
+            except (IOError, ValueError) as e:
+                print(general.error("ERROR: the journal could not be opened. " + str(e)))
+                if sink != None:
+                    sink.close()
+                return results
+
             # Showing the execution time...
             if not args.quiet:
                 print(str(startTime) +"\tStarting search in " + general.emphasis(str(len(emails))) + " different emails:\n"+ json.dumps(emails, indent=2, sort_keys=True) + "\n")
                 print(general.emphasis("\tPress <Ctrl + C> to stop...\n"))
+            # The MX records are resolved with the answers cached by the
+            # previous runs
+            dns = resolver.getResolver(nameservers=args.nameservers, ttl=args.dns_cache_ttl, negativeTtl=args.dns_negative_ttl)
+
             # Perform searches, using different Threads
-            tmp = performSearch(emails, args.threads)
+            tmp = performSearch(emails, args.threads, args.timeout, journal=journal, done=done, sink=sink, engine=args.engine, sessionsPerHost=args.sessions_per_host)
+            if journal != None:
+                journal.close()
 
             # We make a strict copy of the object
             results = list(tmp)
@@ -536,6 +579,8 @@ be used instead. Verification may be slower though."""))
                         # leak contains a i3visio.platform built by HIBP
                         new["attributes"].append(leak)
                         results.append(new)
+                        if sink != None:
+                            sink.write(new)
                 else:
                     if not args.quiet:
                         print(general.warning("\t" + query + " has NOT been found on any leak yet."))
@@ -569,16 +614,20 @@ be used instead. Verification may be slower though."""))
                         # leak contains a i3visio.platform built by HIBP
                         new["attributes"].append(leak)
                         results.append(new)
+                        if sink != None:
+                            sink.write(new)
 
         # Trying to store the information recovered
         if args.output_folder != None:
-            if not os.path.exists(args.output_folder):
-                os.makedirs(args.output_folder)
-            # Grabbing the results
+            sink.close()
+            # Grabbing the results from the stream when it is available
+            profiles = results
+            if sink.getPath("jsonl") != None:
+                profiles = list(sinks.readJsonLines(sink.getPath("jsonl")))
             fileHeader = os.path.join(args.output_folder, args.file_header)
             for ext in args.extension:
                 # Generating output files
-                general.exportUsufy(results, ext, fileHeader)
+                general.exportUsufy(profiles, ext, fileHeader)
 
         # Showing the information gathered if requested
         if not args.quiet:
@@ -591,6 +640,11 @@ be used instead. Verification may be slower though."""))
             for ext in args.extension:
                 # Showing the output files
                 print(general.emphasis("\t" + fileHeader + "." + ext))
+            if journal != None:
+                print(general.emphasis("\t" + journal.path))
+            if sink != None:
+                for s in sink.sinks:
+                    print(general.emphasis("\t" + s.fPath))
 
         # Showing the execution time...
         if not args.quiet:
@@ -598,6 +652,8 @@ be used instead. Verification may be slower though."""))
             print("\n" + str(endTime) +"\tFinishing execution...\n")
             print("Total time used:\t" + general.emphasis(str(endTime-startTime)))
             print("Average seconds/query:\t" + general.emphasis(str((endTime-startTime).total_seconds()/len(emails))) +" seconds\n")
+            if not args.is_leaked and args.engine == "smtp":
+                print("DNS cache:\t" + general.emphasis(resolver.getStatsSummary(dns.getStats())) + "\n")
 
         if not args.quiet:
             # Urging users to place an issue on Github...
@@ -637,6 +693,14 @@ def getParser():
     # Getting a sample header for the output files
     groupProcessing.add_argument('-F', '--file_header', metavar='<alternative_header_file>', required=False, default=DEFAULT_VALUES["file_header"], action='store', help='Header for the output filenames to be generated. If None was provided the following will be used: profiles.<extension>.' )
     groupProcessing.add_argument('-T', '--threads', metavar='<num_threads>', required=False, action='store', default = int(DEFAULT_VALUES["threads"]), type=int, help='write down the number of threads to be used (default 16). If 0, the maximum number possible will be used, which may make the system feel unstable.')
+    groupProcessing.add_argument('--resume', metavar='<journal>', required=False, default=None, action='store', help='path to the journal of a previous run that was stopped. The emails already verified are not checked again and their results are added to the output files. By default, the journal is stored next to the output files as <file_header>.journal.jsonl.')
+    groupProcessing.add_argument('--stream', metavar='<format>', nargs='+', choices=sorted(sinks.SINKS.keys()), required=False, default=DEFAULT_VALUES.get("stream", ["jsonl"]), action='store', help='formats of the files where the emails are written as soon as they are found: jsonl (a JSON entity per line) and csv (a row per attribute). They are stored next to the output files as <file_header>.stream.<format> and the jsonl stream is used to generate the output files. Default: jsonl.')
+    groupProcessing.add_argument('--engine', metavar='<engine>', choices=['emailahoy', 'smtp'], required=False, default=DEFAULT_VALUES.get("engine", "smtp"), action='store', help='the way in which the emails are verified: smtp (grouping them by mail server and sending many of them in each SMTP session, default) or emailahoy (a new SMTP session for each email).')
+    groupProcessing.add_argument('--sessions_per_host', metavar='<number>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("sessions_per_host", 2)), help='maximum number of SMTP sessions opened at the same time with each mail server by the smtp engine. Default: 2.')
+    groupProcessing.add_argument('--nameservers', metavar='<host[:port]>', nargs='+', required=False, default=DEFAULT_VALUES.get("nameservers", []), action='store', help='name servers used to resolve the mail servers, e. g. a local resolver such as 127.0.0.1:5353. By default, the ones in /etc/resolv.conf.')
+    groupProcessing.add_argument('--dns_cache_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("dns_cache_ttl", 3600)), help='maximum seconds during which a DNS answer is cached in memory and on disk. 0 to resolve every domain again. Default: 3600.')
+    groupProcessing.add_argument('--dns_negative_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("dns_negative_ttl", 600)), help='seconds during which a domain that does not exist is cached. Default: 600.')
+    groupProcessing.add_argument('--timeout', metavar='<seconds>', required=False, action='store', default=None, type=int, help='seconds given to the whole verification process. The emails not verified by then are discarded. By default, mailfy waits for all of them.')
     groupProcessing.add_argument('--is_leaked', required=False, default=False, action='store_true', help='Defines whether mailfy.py should search for leaked emails instead of verifying them.')
     groupProcessing.add_argument('--quiet', required=False, action='store_true', default=False, help='tells the program not to show anything.')
 
@@ -36,6 +36,7 @@ import json
 import os
 
 import osrframework.utils.banner as banner
+import osrframework.utils.browser as browser
 import osrframework.utils.platform_selection as platform_selection
 import osrframework.utils.configuration as configuration
 import osrframework.utils.general as general
@@ -58,10 +59,7 @@ def processPhoneList(platformNames=[], numbers=[], excludePlatformNames=[]):
     results = []
     for num in numbers:
         for pla in platforms:
-            # This returns a json.txt!
-            entities = pla.getInfo(query=num, process = True, mode="phonefy")
-            if entities != {}:
-                results+=json.loads(entities)
+            results += pla.query(query=num, process = True, mode="phonefy")
     return results
 
 def main(args):
@@ -96,6 +94,8 @@ visit """ + general.LICENSE_URL + "\n"
     if args.license:
         general.showLicense()
     else:
+        # Using the response cache as requested
+        browser.setCacheEnabled(args.cache)
         # Showing the execution time...
         startTime= dt.datetime.now()
         #TODO: Get the number searchable platforms in this context
@@ -174,6 +174,8 @@ def getParser():
     groupProcessing.add_argument('-F', '--file_header', metavar='<alternative_header_file>', required=False, default=DEFAULT_VALUES["file_header"], action='store', help='Header for the output filenames to be generated. If None was provided the following will be used: profiles.<extension>.' )
     groupProcessing.add_argument('--quiet', required=False, action='store_true', default=False, help='tells the program not to show anything.')
     groupProcessing.add_argument('-w', '--web_browser', required=False, action='store_true', help='opening the URIs returned in the default web browser.')
+    groupProcessing.add_argument('--cache', dest='cache', required=False, action='store_const', const=True, default=None, help='recover the pages from the local response cache while they are valid, storing the new ones. Default: the cache option in browser.cfg.')
+    groupProcessing.add_argument('--no-cache', dest='cache', required=False, action='store_const', const=False, help='download all the pages again without using the local response cache.')
     groupProcessing.add_argument('-x', '--exclude', metavar='<platform>', choices=listAll, nargs='+', required=False, default=excludeList, action='store', help='select the platforms that you want to exclude from the processing.')
 
 
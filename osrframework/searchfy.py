@@ -36,6 +36,7 @@ import json
 import os
 
 import osrframework.utils.banner as banner
+import osrframework.utils.browser as browser
 import osrframework.utils.platform_selection as platform_selection
 import osrframework.utils.configuration as configuration
 import osrframework.utils.general as general
@@ -62,10 +63,7 @@ def performSearch(platformNames=[], queries=[], process=False, excludePlatformNa
     results = []
     for q in queries:
         for pla in platforms:
-            # This returns a json.txt!
-            entities = pla.getInfo(query=q, process = process, mode="searchfy")
-            if entities != "[]":
-                results += json.loads(entities)
+            results += pla.query(query=q, process = process, mode="searchfy")
     return results
 
 
@@ -101,6 +99,8 @@ visit """ + general.LICENSE_URL + "\n"
     if args.license:
         general.showLicense()
     else:
+        # Using the response cache as requested
+        browser.setCacheEnabled(args.cache)
         # Showing the execution time...
         startTime= dt.datetime.now()
         print(str(startTime) + "\tStarting search in different platform(s)... Relax!\n")
@@ -191,6 +191,8 @@ def getParser():
     groupProcessing.add_argument('-p', '--platforms', metavar='<platform>', choices=listAll, nargs='+', required=False, default=DEFAULT_VALUES["platforms"] ,action='store', help='select the platforms where you want to perform the search amongst the following: ' + str(listAll) + '. More than one option can be selected.')
     groupProcessing.add_argument('--process', required=False, default =False ,action='store_true', help='whether to process the info in the profiles recovered. NOTE: this would be much slower.')
     groupProcessing.add_argument('-w', '--web_browser', required=False, action='store_true', help='opening the URIs returned in the default web browser.')
+    groupProcessing.add_argument('--cache', dest='cache', required=False, action='store_const', const=True, default=None, help='recover the pages from the local response cache while they are valid, storing the new ones. Default: the cache option in browser.cfg.')
+    groupProcessing.add_argument('--no-cache', dest='cache', required=False, action='store_const', const=False, help='download all the pages again without using the local response cache.')
     groupProcessing.add_argument('-x', '--exclude', metavar='<platform>', choices=listAll, nargs='+', required=False, default=excludeList, action='store', help='select the platforms that you want to exclude from the processing.')
 
     # About options
@@ -38,7 +38,10 @@ import logging
 import os
 # Preparing to capture interruptions smoothly
 import signal
+import sqlite3
+import time
 import traceback
+import urlparse
 
 colorama.init(autoreset=True)
 
@@ -49,9 +52,15 @@ from multiprocessing import Process, Queue, Pool
 import osrframework.utils.platform_selection as platform_selection
 import osrframework.utils.configuration as configuration
 import osrframework.utils.banner as banner
-import osrframework.utils.benchmark as benchmark
 import osrframework.utils.browser as browser
+import osrframework.utils.checkpoint as checkpoint
 import osrframework.utils.general as general
+import osrframework.utils.health as health
+import osrframework.utils.negative_cache as negative_cache
+import osrframework.utils.rate_limiter as rate_limiter
+import osrframework.utils.sinks as sinks
+import osrframework.utils.task_runner as task_runner
+import osrframework.utils.telemetry as telemetry
 
 from osrframework.utils.general import error, warning, success, info, title, emphasis
 
@@ -162,9 +171,9 @@ def fuzzUsufy(fDomains = None, fFuzzStruct = None):
     return res
 
 
-def getPageWrapper(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload = True, outQueue=None):
+def getPageWrapper(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload = True, outQueue=None, stats=None):
     """
-    Method that wraps the call to the getInfo. Before it was getUserPage.
+    Method that wraps the call to the query. Before it was getUserPage.
 
     Args:
     -----
@@ -177,6 +186,8 @@ def getPageWrapper(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload
             downloaded (stored in this version).
         outQueue: Queue where the information will be stored.
         maltego: Parameter to tell usufy.py that he has been invoked by Malego.
+        stats: Dictionary to be filled with the attempts, retries and outcome
+            of the request.
 
     Returns:
     --------
@@ -188,7 +199,7 @@ def getPageWrapper(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload
     logger.debug("\tLooking for profiles in " + str(p) + "...")
     #res = p.getUserPage(nick, rutaDescarga, avoidProcessing = avoidProcessing, avoidDownload = avoidDownload)
     try:
-        res = p.getInfo(query=nick, mode="usufy", process=True)#rutaDescarga, avoidProcessing = avoidProcessing, avoidDownload = avoidDownload)
+        res = p.query(query=nick, mode="usufy", process=True, stats=stats)#rutaDescarga, avoidProcessing = avoidProcessing, avoidDownload = avoidDownload)
 
         if res != []:
             if outQueue != None:
@@ -202,6 +213,8 @@ def getPageWrapper(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload
         return []
     except:
         print(general.error("ERROR: something happened when processing " + str(p) +". You may like to deactivate this wrapper if the error persist."))
+        if stats != None:
+            stats["outcome"] = "exception"
         return []
 
 
@@ -212,16 +225,188 @@ def pool_function(p, nick, rutaDescarga, avoidProcessing = True, avoidDownload =
     Args:
     -----
         args: We receive the parameters for getPageWrapper as a tuple.
+
+    Returns:
+    --------
+        A dictionary with the platform, the nick, the status, the data found,
+        the stats of the request (attempts, retries, failures retried and
+        outcome) and the telemetry record of the check.
     """
+    stats = {}
+    start = time.time()
     try:
-        res = getPageWrapper(p, nick, rutaDescarga, avoidProcessing, avoidDownload, outQueue)
-        return {"platform" : str(p), "status": "DONE", "data": res}
+        res = getPageWrapper(p, nick, rutaDescarga, avoidProcessing, avoidDownload, outQueue, stats=stats)
+        status = "DONE"
     except Exception as e:
         print(general.error("\tERROR: " + str(p)))
-        return {"platform" : str(p), "status": "ERROR", "data": []}
+        res = []
+        status = "ERROR"
+    record = telemetry.getRecord(str(p), nick, res, stats, start, time.time(), status=status)
+    return {"platform" : str(p), "nick": nick, "status": status, "data": res, "stats": stats, "telemetry": record}
+
+
+def getPlatformHost(platform):
+    """
+    Method that recovers the host queried by a platform in usufy mode.
+
+    Args:
+    -----
+        platform: A <Platform> object.
+
+    Returns:
+    --------
+        str: The host of the usufy URL of the platform or, if it does not
+            have one, the name of the platform.
+    """
+    try:
+        host = urlparse.urlparse(platform.url["usufy"]).netloc
+    except (AttributeError, KeyError, TypeError):
+        host = ""
+    return host or str(platform)
+
+
+def processNickListThreads(nicks, platforms, rutaDescarga="./", avoidProcessing=True, avoidDownload=True, nThreads=12, skip=None, journal=None, maxPerHost=0, sink=None):
+    """
+    Process a list of nicks running every nick-platform check in one process.
+
+    Instead of creating a new pool of processes for each nick, all the
+    checks are launched from a single pool of threads shared by the whole
+    list. The <Platform> objects are shared by the threads so they are not
+    pickled for each and every task.
+
+    The whole nick-platform matrix is scheduled at once: the checks are taken
+    from each host in turns and only maxPerHost of them query the same host at
+    the same time, so a slow platform does not stop the checks of the next
+    nicks in the rest of them.
+
+    Args:
+    -----
+        nicks: List of nicks to process.
+        platforms: List of <Platform> objects to be processed.
+        rutaDescarga: Local file where saving the obtained information.
+        avoidProcessing: A boolean var that defines whether the profiles will
+            NOT be processed.
+        avoidDownload: A boolean var that defines whether the profiles will NOT
+            be downloaded.
+        nThreads: Maximum number of checks being performed at the same time.
+        skip: Set of tuples (platform name, nick) that will not be checked.
+        journal: The <checkpoint.Journal> where each check is stored as soon
+            as it is completed.
+        maxPerHost: Maximum number of checks querying the same host at the
+            same time. If 0, there is no limit.
+        sink: The <sinks.SinkGroup> where the profiles are written as soon
+            as they are found.
+
+    Returns:
+    --------
+        A dictionary where the key is the nick and the value the list of
+        results as returned by pool_function.
+    """
+    skip = skip or set()
+    tasks = []
+    for nick in nicks:
+        for plat in platforms:
+            if (str(plat), nick) not in skip:
+                tasks.append((plat, nick, rutaDescarga, avoidProcessing, avoidDownload, ))
+
+    poolResults = {}
+    for nick in nicks:
+        poolResults[nick] = []
+
+    hosts = dict([(str(plat), getPlatformHost(plat)) for plat in platforms])
+    runner = task_runner.TaskRunner(pool_function, nThreads=nThreads, useThreads=True, getKey=lambda parameters: hosts[str(parameters[0])], maxPerKey=maxPerHost)
+    try:
+        # The results come unordered, but each of them carries its own nick
+        for result in runner.run(tasks):
+            poolResults[result["nick"]].append(result)
+            storeResult(result, journal, sink)
+    except KeyboardInterrupt:
+        print(general.warning("\n[!] Process manually stopped by the user. Terminating workers.\n"))
+        runner.terminate()
+        pending = {}
+        for parameters in runner.getPending():
+            nick = parameters[1]
+            pending[nick] = pending.get(nick, "") + " " + str(parameters[0]).lower()
+        for nick in nicks:
+            if nick in pending:
+                print(general.warning("[!] The following platforms were not processed for '" + nick + "':"))
+                print("\t usufy.py -n " + nick + " -p " + general.emphasis(pending[nick]))
+        print("\n")
+    return poolResults
+
+
+def storeResult(result, journal=None, sink=None):
+    """
+    Method that stores a check as soon as it is completed.
+
+    The checks that failed are stored in the journal as not done so as to
+    launch them again if the run is resumed. If the profiles are written to a
+    jsonl stream, they are dropped from the result once written so that they
+    are not kept in memory until the end of the run.
+
+    Args:
+    -----
+        result: The dictionary returned by pool_function.
+        journal: The <checkpoint.Journal> of the run or None.
+        sink: The <sinks.SinkGroup> where the profiles found are written or
+            None.
+    """
+    if journal != None:
+        journal.append(result["nick"], result["platform"], result, done=result["telemetry"]["outcome"] != telemetry.ERROR)
+    if sink != None and result["data"] != None:
+        sink.writeAll(result["data"])
+        if sink.getPath("jsonl") != None:
+            # They will be read back from the stream
+            result["data"] = None
+
+
+def sortProfilesByNick(profiles, nicks):
+    """
+    Method that groups a list of profiles per nick keeping their order.
+
+    Args:
+    -----
+        profiles: A list of i3visio profiles.
+        nicks: The list of nicks in the order of the output.
+
+    Returns:
+    --------
+        list: The profiles of the first nick, then the ones of the second...
+            The profiles without a known alias are left at the end.
+    """
+    position = dict([(nick, i) for i, nick in enumerate(nicks)])
+
+    def getPosition(profile):
+        for a in profile.get("attributes", []):
+            if a["type"] == "i3visio.alias" and a["value"] in position:
+                return position[a["value"]]
+        return len(nicks)
+
+    return sorted(profiles, key=getPosition)
+
+
+def getProfilesFromPoolResults(poolResults):
+    """
+    Method that recovers the profiles found from the results of pool_function.
+
+    Args:
+    -----
+        poolResults: List of dictionaries as returned by pool_function.
+
+    Returns:
+    --------
+        list: A list of i3visio profiles.
+    """
+    profiles = []
+    for serArray in poolResults:
+        data = serArray["data"]
+        # We need to check if the results are not None
+        if data != None:
+            profiles += data
+    return profiles
 
 
-def processNickList(nicks, platforms=None, rutaDescarga="./", avoidProcessing=True, avoidDownload=True, nThreads=12, maltego=False, verbosity=1, logFolder="./logs"):
+def processNickList(nicks, platforms=None, rutaDescarga="./", avoidProcessing=True, avoidDownload=True, nThreads=12, maltego=False, verbosity=1, logFolder="./logs", engine="threads", telemetryRecords=None, negativeCacheTTL=0, journal=None, done=None, maxPerHost=0, sink=None):
     """
     Process a list of nicks to check whether they exist.
 
@@ -237,75 +422,171 @@ def processNickList(nicks, platforms=None, rutaDescarga="./", avoidProcessing=Tr
             NOT be processed.
         avoidDownload: A boolean var that defines whether the profiles will NOT
             be downloaded.
+        nThreads: Maximum number of checks performed at the same time: the
+            threads of the single pool with the threads engine or the
+            processes of the pool of each nick with the pool engine.
         maltego: A parameter to tell usufy.py that he has been invoked by Malego.
         verbosity: The level of verbosity to be used.
         logFolder: The path to the log folder.
+        engine: The way in which the checks are launched: "threads" (a single
+            pool of threads for all the nicks and platforms) or "pool" (a pool
+            of processes for each nick).
+        telemetryRecords: A list where the telemetry records of each check are
+            appended.
+        negativeCacheTTL: Seconds during which a nick not found in a platform
+            is not checked again. 0 to check all of them.
+        journal: The <checkpoint.Journal> where each check is stored as soon
+            as it is completed.
+        done: A dictionary with the checks completed by a previous run as
+            returned by <checkpoint.Journal.load>. They are not launched again
+            and their results are added to the ones of this run.
+        maxPerHost: Maximum number of checks querying the same host at the
+            same time when using the threads engine. If 0, there is no limit.
+        sink: The <sinks.SinkGroup> where the profiles are written as soon
+            as they are found, including the ones resumed.
 
     Returns:
     --------
         A dictionary where the key is the nick and the value another dictionary
         where the keys are the social networks and the value is the
-        corresponding URL.
+        corresponding URL. If the sink has a jsonl stream, the profiles are
+        not kept in memory and must be read from it with
+        <sinks.readJsonLines>.
     """
     osrframework.utils.logger.setupLogger(loggerName="osrframework.usufy", verbosity=verbosity, logFolder=logFolder)
     logger = logging.getLogger("osrframework.usufy")
 
     if platforms == None:
         platforms = platform_selection.getAllPlatformNames("usufy")
+    done = done or {}
+
+    # The workers forked from now on will share the limits and the retry
+    # budgets of each platform
+    rate_limiter.getRateLimiter()
+    rate_limiter.getRetryBudget()
 
     # Defining the output results variable
     res = []
+    # Results of all the checks launched
+    allResults = []
+
+    # Skipping the nicks that were not found in the last runs
+    skip = set()
+    if negativeCacheTTL > 0:
+        try:
+            skip = negative_cache.getNegativeCache().getNotFound([str(plat) for plat in platforms], nicks, mode="usufy", ttl=negativeCacheTTL)
+        except sqlite3.Error, e:
+            logger.warning("The negative cache could not be read: " + str(e))
+        logger.info("Skipping " + str(len(skip)) + " check(s) not found in the last " + str(negativeCacheTTL) + " seconds.")
+
+    # Recovering the checks completed before the run was stopped
+    resumed = []
+    platformNames = set([str(plat) for plat in platforms])
+    for nick in nicks:
+        for name in platformNames:
+            if (nick, name) in done:
+                result = done[(nick, name)]
+                result["telemetry"]["resumed"] = True
+                resumed.append(result)
+                skip.add((name, nick))
+    if resumed != []:
+        logger.info("Resuming " + str(len(resumed)) + " check(s) completed in a previous run.")
+        if sink != None:
+            sink.writeAll(getProfilesFromPoolResults(resumed))
+            if sink.getPath("jsonl") != None:
+                for result in resumed:
+                    result["data"] = None
+
+    if engine == "threads":
+        logger.info("Looking for " + str(len(nicks)) + " nick(s) in " + str(len(platforms)) + " different platforms using up to " + str(nThreads) + " threads...")
+        poolResults = processNickListThreads(nicks, platforms, rutaDescarga, avoidProcessing, avoidDownload, nThreads, skip=skip, journal=journal, maxPerHost=maxPerHost, sink=sink)
+        for nick in nicks:
+            allResults += poolResults[nick]
+    else:
+        processNickListPool(nicks, platforms, rutaDescarga, avoidProcessing, avoidDownload, nThreads, skip=skip, allResults=allResults, journal=journal, sink=sink)
+
+    # Grouping the results per nick, including the resumed ones
+    position = dict([(nick, i) for i, nick in enumerate(nicks)])
+    allResults = sorted(resumed + allResults, key=lambda result: position[result["nick"]])
+    res = getProfilesFromPoolResults(allResults)
+
+    if telemetryRecords != None:
+        telemetryRecords += [result["telemetry"] for result in allResults]
+
+    if negativeCacheTTL > 0:
+        # Only the answers received in this run are stored
+        checked = [(r["platform"], r["nick"], r["telemetry"]["outcome"] == telemetry.FOUND) for r in allResults if r["telemetry"]["outcome"] != telemetry.ERROR and not r["telemetry"]["cached"] and not r["telemetry"].get("resumed")]
+        try:
+            negative_cache.getNegativeCache().record(checked, mode="usufy")
+            # The results older than the TTL will never be used again
+            negative_cache.getNegativeCache().purge(negativeCacheTTL)
+        except sqlite3.Error, e:
+            logger.warning("The negative cache could not be updated: " + str(e))
+    return res
+
+
+def processNickListPool(nicks, platforms, rutaDescarga="./", avoidProcessing=True, avoidDownload=True, nThreads=12, skip=None, allResults=None, journal=None, sink=None):
+    """
+    Process a list of nicks launching a pool of processes for each nick.
+
+    Args:
+    -----
+        nicks: List of nicks to process.
+        platforms: List of <Platform> objects to be processed.
+        rutaDescarga: Local file where saving the obtained information.
+        avoidProcessing: A boolean var that defines whether the profiles will
+            NOT be processed.
+        avoidDownload: A boolean var that defines whether the profiles will NOT
+            be downloaded.
+        nThreads: Maximum number of processes of each pool.
+        skip: Set of tuples (platform name, nick) that will not be checked.
+        allResults: A list where the results as returned by pool_function are
+            appended.
+        journal: The <checkpoint.Journal> where each check is stored as soon
+            as it is completed.
+        sink: The <sinks.SinkGroup> where the profiles are written as soon
+            as they are found.
+
+    Returns:
+    --------
+        list: A list of i3visio profiles.
+    """
+    logger = logging.getLogger("osrframework.usufy")
+
+    skip = skip or set()
+    res = []
     # Processing the whole list of terms...
     for nick in nicks:
-        logger.info("Looking for '" + nick + "' in " + str(len(platforms)) + " different platforms:\n" +str( [ str(plat) for plat in platforms ] ) )
+        nickPlatforms = [plat for plat in platforms if (str(plat), nick) not in skip]
+        if nickPlatforms == []:
+            continue
+        logger.info("Looking for '" + nick + "' in " + str(len(nickPlatforms)) + " different platforms:\n" +str( [ str(plat) for plat in nickPlatforms ] ) )
 
         # If the process is executed by the current app, we use the Processes. It is faster than pools.
-        if nThreads <= 0 or nThreads > len(platforms):
-            nThreads = len(platforms)
-        logger.info("Launching " + str(nThreads) + " different threads...")
+        nickThreads = nThreads
+        if nickThreads <= 0 or nickThreads > len(nickPlatforms):
+            nickThreads = len(nickPlatforms)
+        logger.info("Launching a pool of " + str(nickThreads) + " different processes...")
 
-        # Using threads in a pool if we are not running the program in main
-        # Example catched from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
-        try:
-            original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
-            pool = Pool(nThreads)
-            signal.signal(signal.SIGINT, original_sigint_handler)
-        except ValueError:
-            # To avoid: ValueError: signal only works in main thread
-            pool = Pool(nThreads)
+        tasks = []
+        for plat in nickPlatforms:
+            # We need to create all the arguments that will be needed
+            tasks.append(( plat, nick, rutaDescarga, avoidProcessing, avoidDownload, ))
 
+        runner = task_runner.TaskRunner(pool_function, nThreads=nickThreads)
         poolResults = []
         try:
-            def log_result(result):
-                # This is called whenever foo_pool(i) returns a result.
-                # result_list is modified only by the main process, not the pool workers.
+            for result in runner.run(tasks):
                 poolResults.append(result)
-
-            for plat in platforms:
-                # We need to create all the arguments that will be needed
-                parameters = ( plat, nick, rutaDescarga, avoidProcessing, avoidDownload, )
-                pool.apply_async (pool_function, args= parameters, callback = log_result )
-
-            # Waiting for results to be finished
-            while len(poolResults) < len(platforms):
-                pass
-
-            # Closing normal termination
-            pool.close()
+                storeResult(result, journal, sink)
         except KeyboardInterrupt:
             print(general.warning("\n[!] Process manually stopped by the user. Terminating workers.\n"))
-            pool.terminate()
+            runner.terminate()
             print(general.warning("[!] The following platforms were not processed:"))
             pending = ""
-            for p in platforms:
-                processed = False
-                for processedPlatform in poolResults:
-                    if str(p) == processedPlatform["platform"]:
-                        processed = True
-                        break
-                if not processed:
-                    print("\t- " + str(p))
-                    pending += " " + str(p).lower()
+            for parameters in runner.getPending():
+                print("\t- " + str(parameters[0]))
+                pending += " " + str(parameters[0]).lower()
             print("\n")
             print(general.warning("If you want to relaunch the app with these platforms you can always run the command with: "))
             print("\t usufy.py ... -p " + general.emphasis(pending))
@@ -313,21 +594,12 @@ def processNickList(nicks, platforms=None, rutaDescarga="./", avoidProcessing=Tr
             print(general.warning("If you prefer to avoid these platforms you can manually evade them for whatever reason with: "))
             print("\t usufy.py ... -x " + general.emphasis(pending))
             print("\n")
-        pool.join()
-
-        profiles = []
 
         # Processing the results
         # ----------------------
-        for serArray in poolResults:
-            data = serArray["data"]
-            # We need to recover the results and check if they are not an empty json or None
-            if data != None:
-                array = json.loads(data)
-                for r in array:
-                    if r != "{}":
-                        profiles.append(r)
-        res+=profiles
+        res += getProfilesFromPoolResults(poolResults)
+        if allResults != None:
+            allResults += poolResults
     return res
 
 
@@ -373,9 +645,22 @@ visit """ + general.LICENSE_URL + "\n"
         res = fuzzUsufy(args.fuzz, args.fuzz_config)
         logger.info("Recovered platforms:\n" + str(res))
     else:
+        # Storing the decisions of the user on the platforms in quarantine
+        for override in args.quarantine_override:
+            try:
+                platform, value = override.split(":")
+                if value not in [health.INCLUDE, health.EXCLUDE, health.AUTO]:
+                    raise ValueError(value)
+            except ValueError:
+                print(general.error("ERROR: the override '" + override + "' is not valid. Use <platform>:<include|exclude|auto>."))
+                continue
+            for p in platform_selection.getPlatformsByName(platformNames=[platform.lower()], mode="usufy", useHealth=False):
+                health.getHealthStore().setOverride(str(p), value)
+                logger.info("The quarantine of " + str(p) + " is set to: " + value)
+
         logger.debug("Recovering the list of platforms to be processed...")
         # Recovering the list of platforms to be launched
-        listPlatforms = platform_selection.getPlatformsByName(platformNames=args.platforms, tags=args.tags, mode="usufy", excludePlatformNames=args.exclude)
+        listPlatforms = platform_selection.getPlatformsByName(platformNames=args.platforms, tags=args.tags, mode="usufy", excludePlatformNames=args.exclude, useHealth=not args.ignore_quarantine)
         logger.debug("Platforms recovered.")
 
         if args.info:
@@ -402,6 +687,18 @@ visit """ + general.LICENSE_URL + "\n"
                     infoTags += "\t\t" + (t + ": ").ljust(16, ' ') + str(tags[t]) + "  time(s)\n"
                 logger.info(infoTags)
                 return infoTags
+            elif args.info == 'list_quarantined':
+                infoQuarantined = "Listing the platforms in quarantine:\n"
+                quarantined = health.getHealthStore().getQuarantined()
+                for p in sorted(quarantined.keys()):
+                    entry = quarantined[p]
+                    if entry["override"] == health.EXCLUDE:
+                        reason = "excluded by the user"
+                    else:
+                        reason = str(entry["failedRuns"]) + " failed run(s), next probe at " + str(dt.datetime.fromtimestamp(entry["probeAt"]))
+                    infoQuarantined += "\t\t" + (p + ": ").ljust(16, ' ') + reason + "\n"
+                logger.info(infoQuarantined)
+                return infoQuarantined
             else:
                 pass
 
@@ -409,6 +706,7 @@ visit """ + general.LICENSE_URL + "\n"
         elif args.benchmark:
             logger.warning("The benchmark mode may last some minutes as it will be performing similar queries to the ones performed by the program in production. ")
             logger.info("Launching the benchmarking tests...")
+            import osrframework.utils.benchmark as benchmark
             platforms = platform_selection.getAllPlatformNames("usufy")
             res = benchmark.doBenchmark(platforms)
             strTimes = ""
@@ -451,9 +749,22 @@ visit """ + general.LICENSE_URL + "\n"
                 except:
                     logger.error("ERROR: there has been an error when opening the file that stores the nicks.\tPlease, check the existence of this file.")
 
+            # Using the response cache as requested
+            browser.setCacheEnabled(args.cache)
+
             # Definning the results
             res = []
+            # Telemetry records of each check
+            records = []
+
+            # The nicks not found recently are only skipped when the caches
+            # are enabled
+            negativeCacheTTL = args.negative_cache_ttl if browser.isCacheEnabled() else 0
 
+            # Probing again the platforms in quarantine in the background
+            health.startProbing(platform_selection.getPlatformsToProbe("usufy"), mode="usufy")
+
+            journalHeader = None
             if args.output_folder != None:
                 # if Verifying an output folder was selected
                 logger.debug("Preparing the output folder...")
@@ -461,16 +772,44 @@ visit """ + general.LICENSE_URL + "\n"
                     if not os.path.exists(args.output_folder):
                         logger.warning("The output folder \'" + args.output_folder + "\' does not exist. The system will try to create it.")
                         os.makedirs(args.output_folder)
+                    journalHeader = os.path.join(args.output_folder, args.file_header)
+
+            # Storing each check as soon as it is completed so as to be able
+            # to resume the run if it is stopped
+            try:
+                journal, done = checkpoint.getJournal("usufy", resume=args.resume, fileHeader=journalHeader, queries=nicks)
+            except (IOError, ValueError) as e:
+                print(general.error("ERROR: the journal could not be opened. " + str(e)))
+                return res
+
+            # Writing the profiles as soon as they are found
+            sink = None
+            if journalHeader != None and args.extension:
+                sink = sinks.getSinks(journalHeader, args.stream)
+
+            if args.output_folder != None:
                 # Launching the process...
-                res = processNickList(nicks, listPlatforms, args.output_folder, avoidProcessing = args.avoid_processing, avoidDownload = args.avoid_download, nThreads=args.threads, verbosity= args.verbose, logFolder=args.logfolder)
+                res = processNickList(nicks, listPlatforms, args.output_folder, avoidProcessing = args.avoid_processing, avoidDownload = args.avoid_download, nThreads=args.threads, verbosity= args.verbose, logFolder=args.logfolder, engine=args.engine, telemetryRecords=records, negativeCacheTTL=negativeCacheTTL, journal=journal, done=done, maxPerHost=args.max_per_host, sink=sink)
 
             else:
                 try:
-                    res = processNickList(nicks, listPlatforms, nThreads=args.threads, verbosity= args.verbose, logFolder=args.logfolder)
+                    res = processNickList(nicks, listPlatforms, nThreads=args.threads, verbosity= args.verbose, logFolder=args.logfolder, engine=args.engine, telemetryRecords=records, negativeCacheTTL=negativeCacheTTL, journal=journal, done=done, maxPerHost=args.max_per_host, sink=sink)
                 except Exception as e:
                     print(general.error("Exception grabbed when processing the nicks: " + str(e)))
                     print(general.error(traceback.print_stack()))
 
+            if journal != None:
+                journal.close()
+            if sink != None:
+                sink.close()
+                # The profiles were streamed instead of kept in memory
+                if sink.getPath("jsonl") != None:
+                    res = sortProfilesByNick(sinks.readJsonLines(sink.getPath("jsonl")), nicks)
+
+            # Learning which platforms are slow or failing for the next runs.
+            # The checks resumed were already seen by the previous run.
+            health.getHealthStore().recordRun(telemetry.getSummary([r for r in records if not r.get("resumed")]))
+
             logger.info("Listing the results obtained...")
             # We are going to iterate over the results...
             strResults = "\t"
@@ -541,6 +880,9 @@ visit """ + general.LICENSE_URL + "\n"
                         # Generating output files
                         general.exportUsufy(res, ext, fileHeader)
 
+                    # Storing the telemetry of each check
+                    telemetry.writeRecords(records, fileHeader + ".telemetry.jsonl")
+
             # Generating the Maltego output
             if args.maltego:
                 general.listToMaltego(res)
@@ -558,6 +900,18 @@ visit """ + general.LICENSE_URL + "\n"
                 for ext in args.extension:
                     # Showing the output files
                     print("\t" + general.emphasis(fileHeader + "." + ext))
+                if args.extension:
+                    print("\t" + general.emphasis(fileHeader + ".telemetry.jsonl"))
+                if journal != None:
+                    print("\t" + general.emphasis(journal.path))
+                if sink != None:
+                    for s in sink.sinks:
+                        print("\t" + general.emphasis(s.fPath))
+
+                if args.telemetry:
+                    now = dt.datetime.now()
+                    print("\n" + str(now) + "\tThe telemetry of each platform is shown in the following table:\n")
+                    print(telemetry.getSummaryTable(telemetry.getSummary(records)))
 
                 # Showing the execution time...
                 endTime= dt.datetime.now()
@@ -588,7 +942,7 @@ def getParser():
     # Defining the mutually exclusive group for the main options
     groupMainOptions = parser.add_mutually_exclusive_group(required=True)
     # Adding the main options
-    groupMainOptions.add_argument('--info', metavar='<action>', choices=['list_platforms', 'list_tags'], action='store', help='select the action to be performed amongst the following: list_platforms (list the details of the selected platforms), list_tags (list the tags of the selected platforms). Afterwards, it exists.')
+    groupMainOptions.add_argument('--info', metavar='<action>', choices=['list_platforms', 'list_quarantined', 'list_tags'], action='store', help='select the action to be performed amongst the following: list_platforms (list the details of the selected platforms), list_quarantined (list the platforms skipped because they kept failing in previous runs), list_tags (list the tags of the selected platforms). Afterwards, it exists.')
     groupMainOptions.add_argument('--license', required=False, action='store_true', default=False, help='shows the AGPLv3+ license and exists.')
     groupMainOptions.add_argument('-b', '--benchmark',  action='store_true', default=False, help='perform the benchmarking tasks.')
     groupMainOptions.add_argument('-f', '--fuzz', metavar='<path_to_fuzzing_list>', action='store', type=argparse.FileType('r'), help='this option will try to find usufy-like URLs. The list of fuzzing platforms in the file should be (one per line): <BASE_DOMAIN>\t<VALID_NICK>')
@@ -600,6 +954,8 @@ def getParser():
     groupPlatforms = parser.add_argument_group('Platform selection arguments', 'Criteria for selecting the platforms where performing the search.')
     groupPlatforms.add_argument('-p', '--platforms', metavar='<platform>', choices=platOptions, nargs='+', required=False, default=DEFAULT_VALUES["platforms"], action='store', help='select the platforms where you want to perform the search amongst the following: ' + str(platOptions) + '. More than one option can be selected.')
     groupPlatforms.add_argument('-t', '--tags', metavar='<tag>', default = [], nargs='+', required=False, action='store', help='select the list of tags that fit the platforms in which you want to perform the search. More than one option can be selected.')
+    groupPlatforms.add_argument('--ignore_quarantine', required=False, action='store_true', default=False, help='process the platforms in quarantine as well. By default, the platforms that failed in the last runs are skipped unless they are selected by name.')
+    groupPlatforms.add_argument('--quarantine_override', metavar='<platform>:<decision>', nargs='+', required=False, default=[], action='store', help='store a decision on the quarantine of a platform: include (never skip it), exclude (always skip it) or auto (let usufy decide). E.g.: --quarantine_override twitter:include.')
     groupPlatforms.add_argument('-x', '--exclude', metavar='<platform>', choices=platOptions, nargs='+', required=False, default=excludeList, action='store', help='select the platforms that you want to exclude from the processing.')
 
     # Configuring the processing options
@@ -609,12 +965,20 @@ def getParser():
     groupProcessing.add_argument('--fuzz_config',  metavar='<path_to_fuzz_list>', action='store', type=argparse.FileType('r'), help='path to the fuzzing config details. Wildcards such as the domains or the nicknames should come as: <DOMAIN>, <USERNAME>.')
     groupProcessing.add_argument('--nonvalid', metavar='<not_valid_characters>', required=False, default = '\\|<>=', action='store', help="string containing the characters considered as not valid for nicknames." )
     groupProcessing.add_argument('-e', '--extension', metavar='<sum_ext>', nargs='+', choices=['csv', 'gml', 'json', 'mtz', 'ods', 'png', 'txt', 'xls', 'xlsx' ], required=False, default=DEFAULT_VALUES["extension"], action='store', help='output extension for the summary files. Default: xls.')
+    groupProcessing.add_argument('--cache', dest='cache', required=False, action='store_const', const=True, default=None, help='recover the pages from the local response cache while they are valid, storing the new ones. Default: the cache option in browser.cfg.')
+    groupProcessing.add_argument('--no-cache', dest='cache', required=False, action='store_const', const=False, help='download all the pages again without using the local response cache.')
+    groupProcessing.add_argument('--negative_cache_ttl', metavar='<seconds>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("negative_cache_ttl", 259200)), help='seconds during which a nick not found in a platform is not checked again when the response cache is enabled with --cache or in browser.cfg. 0 to check all of them. Default: 259200 (3 days).')
+    groupProcessing.add_argument('--engine', metavar='<engine>', choices=['pool', 'threads'], required=False, default=DEFAULT_VALUES.get("engine", "threads"), action='store', help='the engine used to launch the checks: threads (a single pool of threads scheduling all the nicks and platforms, default) or pool (a pool of processes per nick).')
+    groupProcessing.add_argument('--max_per_host', metavar='<number>', required=False, action='store', type=int, default=int(DEFAULT_VALUES.get("max_per_host", 4)), help='maximum number of checks querying the same host at the same time with the threads engine. 0 for no limit. Default: 4.')
     groupProcessing.add_argument('-L', '--logfolder', metavar='<path_to_log_folder', required=False, default = './logs', action='store', help='path to the log folder. If none was provided, ./logs is assumed.')
     groupProcessing.add_argument('-m', '--maltego', required=False, action='store_true', help='parameter specified to let usufy.py know that he has been launched by a Maltego Transform.')
     groupProcessing.add_argument('-o', '--output_folder', metavar='<path_to_output_folder>', required=False, default=DEFAULT_VALUES["output_folder"], action='store', help='output folder for the generated documents. While if the paths does not exist, usufy.py will try to create; if this argument is not provided, usufy will NOT write any down any data. Check permissions if something goes wrong.')
     groupProcessing.add_argument('-w', '--web_browser', required=False, action='store_true', help='opening the uris returned in the default web browser.')
     # Getting a sample header for the output files
     groupProcessing.add_argument('-F', '--file_header', metavar='<alternative_header_file>', required=False, default=DEFAULT_VALUES["file_header"], action='store', help='Header for the output filenames to be generated. If None was provided the following will be used: profiles.<extension>.' )
+    groupProcessing.add_argument('--resume', metavar='<journal>', required=False, default=None, action='store', help='path to the journal of a previous run that was stopped. The checks already completed are not launched again and their results are added to the output files. By default, the journal is stored next to the output files as <file_header>.journal.jsonl.')
+    groupProcessing.add_argument('--stream', metavar='<format>', nargs='+', choices=sorted(sinks.SINKS.keys()), required=False, default=DEFAULT_VALUES.get("stream", ["jsonl"]), action='store', help='formats of the files where the profiles are written as soon as they are found: jsonl (a JSON entity per line) and csv (a row per attribute). They are stored next to the output files as <file_header>.stream.<format> and the jsonl stream is used to generate the output files. Default: jsonl.')
+    groupProcessing.add_argument('--telemetry', required=False, action='store_true', default=False, help='showing a table with the checks, outcomes and average timings of each platform at the end. The telemetry of each check is always stored next to the output files.')
     groupProcessing.add_argument('-T', '--threads', metavar='<num_threads>', required=False, action='store', default=int(DEFAULT_VALUES["threads"]), type=int, help='write down the number of threads to be used (default 32). If 0, the maximum number possible will be used, which may make the system feel unstable.')
 
     # About options
@@ -18,6 +18,20 @@
 #
 ##################################################################################
 
+import argparse
+import BaseHTTPServer
+import collections
+import heapq
+import json
+import os
+import random
+import shutil
+import signal
+import SocketServer
+import subprocess
+import sys
+import tempfile
+import threading
 import time
 # global issues
 from multiprocessing import Pool
@@ -88,3 +102,1595 @@ def doBenchmark(plats):
 		print str(i) + "\t" + str(res[i]) + "\n"
 	
 	return res
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+	'''
+		Handler of the stand-in server. Any path ending in a nick that starts
+		with "found" returns a profile and anything else a not found page.
+		A share of the first requests to each path fail with a 503 or a 429.
+	'''
+	# Keeping the connections alive as most of the platforms do
+	protocol_version = "HTTP/1.1"
+	# Sending each response at once to avoid waiting for delayed ACKs
+	wbufsize = -1
+	disable_nagle_algorithm = True
+
+	def do_GET(self):
+		with self.server.lock:
+			self.server.active += 1
+			self.server.maxActive = max(self.server.maxActive, self.server.active)
+		try:
+			self._answer()
+		finally:
+			with self.server.lock:
+				self.server.active -= 1
+
+	def _answer(self):
+		self.server.hits.append((self.path.split("/")[1], time.time()))
+		time.sleep(self.server.delay)
+		nick = self.path.split("/")[-1]
+		if self.path not in self.server.failed and self.server.random.random() < self.server.failureRate:
+			# Transient failures of an overloaded platform
+			self.server.failed.add(self.path)
+			status = self.server.random.choice([429, 503])
+			self.send_response(status)
+			if status == 429:
+				self.send_header("Retry-After", "0")
+			self.send_header("Content-Length", "0")
+			self.end_headers()
+			return
+		# The scripts and footers that usually follow the contents
+		padding = "<script>var x = 0;</script>" * (self.server.padding / 27)
+		if nick.startswith("found"):
+			body = "<html><title>" + nick + "</title><p class=\"name\">" + nick.upper() + "</p>" + padding + "</html>"
+		else:
+			body = "<html><title>Oops</title>" + "<p>Nothing here</p>" * 100 + "<p>This user does not exist</p>" + padding + "</html>"
+		self.send_response(200)
+		self.send_header("Content-Type", "text/html")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		if self.server.chunkDelay:
+			# Simulating a slow link
+			for i in range(0, len(body), 16384):
+				self.wfile.write(body[i:i + 16384])
+				self.wfile.flush()
+				time.sleep(self.server.chunkDelay)
+		else:
+			self.wfile.write(body)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+	'''
+		A local HTTP server that plays the role of the platforms.
+	'''
+	daemon_threads = True
+
+	def handle_error(self, request, client_address):
+		# The clients close the connections of the downloads they stop
+		pass
+
+
+def startStandInServer(delay=0.05, padding=0, chunkDelay=0, failureRate=0):
+	'''
+		Launching a stand-in server in a random local port.
+
+		:param delay:	Seconds that the server waits before answering.
+		:param padding:	Bytes appended to each page after the contents.
+		:param chunkDelay:	Seconds that the server waits after sending each
+			chunk of 16KB.
+		:param failureRate:	Share of the paths whose first request fails.
+
+		:return:	The <StandInServer> running in the background.
+	'''
+	server = StandInServer(("127.0.0.1", 0), StandInHandler)
+	server.delay = delay
+	server.padding = padding
+	server.chunkDelay = chunkDelay
+	server.failureRate = failureRate
+	# Paths that have already failed once
+	server.failed = set()
+	server.random = random.Random(0)
+	# Tuples (first folder of the path, time) of each request received
+	server.hits = []
+	# Requests being answered now and highest number of them at once
+	server.lock = threading.Lock()
+	server.active = 0
+	server.maxActive = 0
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server
+
+
+def getStandInPlatforms(server, nPlatforms=20):
+	'''
+		Creating <Platform> objects that point to the stand-in server.
+
+		:param server:	The <StandInServer> to be queried.
+		:param nPlatforms:	Number of platforms to be created.
+
+		:return:	A list of <Platform> objects.
+	'''
+	from osrframework.utils.platforms import Platform
+
+	platforms = []
+	for i in range(nPlatforms):
+		p = Platform("StandIn" + str(i), ["benchmark"])
+		p.isValidMode["usufy"] = True
+		p.url["usufy"] = "http://127.0.0.1:" + str(server.server_address[1]) + "/standin" + str(i) + "/<usufy>"
+		p.notFoundText["usufy"] = ["This user does not exist"]
+		p.fieldsRegExp["usufy"] = {
+			"i3visio.fullname": {"start": "<p class=\"name\">", "end": "</p>"},
+			"@title": "<title>([^<]+)</title>"
+		}
+		platforms.append(p)
+	return platforms
+
+
+def doEngineBenchmark(nNicks=10, nPlatforms=20, nThreads=16, delay=0.05):
+	'''
+		Comparing the usufy engines against a local stand-in server.
+
+		:param nNicks:	Number of nicks to be checked.
+		:param nPlatforms:	Number of platforms to be checked for each nick.
+		:param nThreads:	Number of threads to be used by each engine.
+		:param delay:	Seconds that the stand-in server takes to answer.
+
+		:return:	A dictionary with the seconds consumed by each engine and the
+			CPU seconds consumed by the process coordinating the workers.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+
+	server = startStandInServer(delay)
+	platforms = getStandInPlatforms(server, nPlatforms)
+	nicks = []
+	for i in range(nNicks):
+		if i % 3 == 0:
+			nicks.append("found" + str(i))
+		else:
+			nicks.append("nobody" + str(i))
+
+	res = {}
+	found = {}
+	for engine in ["pool", "threads"]:
+		print "Testing the '" + engine + "' engine with " + str(nNicks) + " nicks and " + str(nPlatforms) + " platforms..."
+		t0 = time.time()
+		c0 = sum(os.times()[:2])
+		profiles = usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, engine=engine)
+		c1 = sum(os.times()[:2])
+		t1 = time.time()
+		res[engine] = t1 - t0
+		res[engine + "_cpu"] = c1 - c0
+		found[engine] = sorted([json.dumps(p, sort_keys=True) for p in profiles])
+		print engine + "\t" + str(res[engine]) + " seconds\t" + str(res[engine + "_cpu"]) + " CPU seconds\t" + str(len(profiles)) + " profiles\n"
+	browser.closeSessions()
+	server.shutdown()
+
+	res["same_results"] = found["pool"] == found["threads"]
+	return res
+
+
+def doConnectionBenchmark(nRequests=200, delay=0):
+	'''
+		Comparing the connections opened when the sessions are reused against
+		opening a new session for each request.
+
+		:param nRequests:	Number of requests to be sent.
+		:param delay:	Seconds that the stand-in server takes to answer.
+
+		:return:	A dictionary with the seconds consumed, the requests sent and
+			the new connections opened in each case.
+	'''
+	import osrframework.utils.browser as browser
+
+	server = startStandInServer(delay)
+	url = "http://127.0.0.1:" + str(server.server_address[1]) + "/standin/nobody"
+
+	res = {}
+	for reuse in [False, True]:
+		browser.closeSessions()
+		stats = {"requests": 0, "new_connections": 0}
+		t0 = time.time()
+		for i in range(nRequests):
+			if not reuse:
+				# This is what happened when each Browser had its own connections
+				for k, v in browser.getConnectionStats().items():
+					stats[k] += v
+				browser.closeSessions()
+			browser.Browser().recoverURL(url)
+		for k, v in browser.getConnectionStats().items():
+			stats[k] += v
+		t1 = time.time()
+
+		if reuse:
+			case = "reused_sessions"
+		else:
+			case = "new_sessions"
+		stats["seconds"] = t1 - t0
+		res[case] = stats
+		print case + "\t" + str(stats["seconds"]) + " seconds\t" + str(stats["requests"]) + " requests\t" + str(stats["new_connections"]) + " new connections\n"
+	browser.closeSessions()
+	server.shutdown()
+	return res
+
+
+def doBrowserBenchmark(nBrowsers=1000):
+	'''
+		Comparing the construction of Browser objects when browser.cfg is parsed
+		once per process against parsing it for every Browser.
+
+		:param nBrowsers:	Number of Browser objects to be created.
+
+		:return:	A dictionary with the microseconds consumed by each
+			construction in each case.
+	'''
+	import osrframework.utils.browser as browser
+
+	res = {}
+	for cached in [False, True]:
+		browser.getBrowserSettings(forceReload=True)
+		t0 = time.time()
+		for i in range(nBrowsers):
+			if not cached:
+				# This is what happened when each Browser read the file
+				browser.getBrowserSettings(forceReload=True)
+			browser.Browser()
+		t1 = time.time()
+
+		if cached:
+			case = "cached_settings"
+		else:
+			case = "parsed_settings"
+		res[case] = (t1 - t0) * 1000000.0 / nBrowsers
+		print case + "\t" + str(res[case]) + " microseconds per Browser\n"
+	return res
+
+
+def doStreamingBenchmark(nRequests=50, padding=500000, chunkDelay=0.001):
+	'''
+		Comparing the download of not found pages when it is stopped as soon
+		as the not found clue appears against reading the whole page.
+
+		:param nRequests:	Number of pages to be recovered.
+		:param padding:	Bytes that follow the not found clue in each page.
+		:param chunkDelay:	Seconds that the server waits after sending each
+			chunk of 16KB.
+
+		:return:	A dictionary with the seconds consumed, the bytes read and
+			the results of somethingFound in each case.
+	'''
+	import osrframework.utils.browser as browser
+
+	server = startStandInServer(0, padding, chunkDelay)
+	platform = getStandInPlatforms(server, 1)[0]
+
+	res = {}
+	for stop in [False, True]:
+		browser.closeSessions()
+		stats = {"bytes": 0, "found": 0}
+		t0 = time.time()
+		for i in range(nRequests):
+			i3Browser = browser.Browser()
+			url, nick = platform.createURL("nobody" + str(i), mode="usufy")
+			if stop:
+				data = i3Browser.recoverURL(url, stopMarkers=platform.notFoundText["usufy"])
+			else:
+				data = i3Browser.recoverURL(url)
+			stats["bytes"] += len(data)
+			if platform.somethingFound(data, mode="usufy"):
+				stats["found"] += 1
+		t1 = time.time()
+
+		if stop:
+			case = "stopped_downloads"
+		else:
+			case = "whole_downloads"
+		stats["seconds"] = t1 - t0
+		res[case] = stats
+		print case + "\t" + str(stats["seconds"]) + " seconds\t" + str(stats["bytes"]) + " bytes\t" + str(stats["found"]) + " found\n"
+	browser.closeSessions()
+	server.shutdown()
+	return res
+
+
+def legacyExtractFields(platform, data, mode="usufy"):
+	'''
+		The extraction of the fields performed by processData up to 0.17.4,
+		used as the reference of doExtractionBenchmark.
+
+		:param platform:	The <Platform> whose fields are extracted.
+		:param data:	The page to be processed.
+		:param mode:	Mode to be executed.
+
+		:return:	A list of the entities found.
+	'''
+	import re
+
+	info = []
+	for field in platform.fieldsRegExp[mode].keys():
+		try:
+			regexp = platform.fieldsRegExp[mode][field]["start"]+"([^\)]+)"+platform.fieldsRegExp[mode][field]["end"]
+			tmp = re.findall(regexp, data)
+			values = []
+			for t in tmp:
+				if platform.fieldsRegExp[mode][field]["end"] in t:
+					values.append(t.split(platform.fieldsRegExp[mode][field]["end"])[0])
+				else:
+					values.append(t)
+		except:
+			regexp = platform.fieldsRegExp[mode][field]
+			values = re.findall(regexp, data)
+
+		for val in values:
+			aux = {}
+			aux["type"] = field
+			aux["value"] = val
+			aux["attributes"] = []
+			if aux not in info:
+				info.append(aux)
+	return info
+
+
+def getExtractionCorpus(corpusPath=None, mode="usufy"):
+	'''
+		Loading the pages used by doExtractionBenchmark.
+
+		:param corpusPath:	Folder with saved profiles named after the
+			platforms, e.g. twitter.html. If None, a page is generated for
+			each wrapper using its start and end tags.
+		:param mode:	Mode whose fields will be extracted.
+
+		:return:	A list of tuples (<Platform>, page).
+	'''
+	import osrframework.utils.platform_selection as platform_selection
+
+	corpus = []
+	for p in platform_selection.getAllPlatformObjects():
+		fields = p.fieldsRegExp.get(mode)
+		if not fields:
+			continue
+		if corpusPath != None:
+			pagePath = os.path.join(corpusPath, p.platformName.lower() + ".html")
+			if os.path.exists(pagePath):
+				with open(pagePath) as iF:
+					corpus.append((p, iF.read()))
+		else:
+			# A long page where each field appears a few times
+			page = "<html><head><title>" + p.platformName + "</title></head><body>"
+			for i in range(20):
+				page += "<div class=\"post\"><p>Some text of the post number " + str(i) + "</p></div>\n" * 10
+				for field, definition in fields.items():
+					if isinstance(definition, dict):
+						page += definition["start"] + "value" + str(i % 4) + definition["end"] + "\n"
+			page += "</body></html>"
+			corpus.append((p, page))
+	return corpus
+
+
+def doExtractionBenchmark(corpusPath=None, nRounds=10):
+	'''
+		Comparing the extraction of the fields of the wrappers using the plans
+		compiled once against building the regular expressions for each page.
+
+		:param corpusPath:	Folder with saved profiles named after the
+			platforms. If None, the pages are generated.
+		:param nRounds:	Number of times that the corpus is processed.
+
+		:return:	A dictionary with the seconds consumed in each case, the
+			number of pages and whether the results are identical.
+	'''
+	corpus = getExtractionCorpus(corpusPath)
+
+	res = {"pages": len(corpus), "same_results": True}
+	for p, page in corpus:
+		if json.dumps(p._extractFields(page, mode="usufy")) != json.dumps(legacyExtractFields(p, page, mode="usufy")):
+			print "Different results for " + str(p)
+			res["same_results"] = False
+
+	for case in ["legacy_extraction", "compiled_extraction"]:
+		t0 = time.time()
+		for i in range(nRounds):
+			for p, page in corpus:
+				if case == "legacy_extraction":
+					legacyExtractFields(p, page, mode="usufy")
+				else:
+					p._extractFields(page, mode="usufy")
+		t1 = time.time()
+		res[case] = t1 - t0
+		print case + "\t" + str(res[case]) + " seconds\t" + str(len(corpus) * nRounds) + " pages\n"
+	return res
+
+
+def legacyCsvExport(d, fPath):
+	'''
+		The CSV export performed up to 0.17.4, which reads and writes the
+		whole file again, used as the reference of doExportBenchmark.
+
+		:param d:	Data to export.
+		:param fPath:	File path for the output file.
+	'''
+	import osrframework.utils.general as general
+	from pyexcel_io import get_data, save_data
+
+	try:
+		oldData = {"OSRFramework": get_data(fPath)}
+	except:
+		oldData = {"OSRFramework": []}
+	tabularData = general._generateTabularData(d, oldData)
+	save_data(fPath, tabularData["OSRFramework"])
+
+
+def doExportBenchmark(nRuns=50, nProfiles=200):
+	'''
+		Comparing the incremental CSV export against rewriting the whole file
+		when the results of many runs are added to the same file.
+
+		:param nRuns:	Number of runs whose results are appended.
+		:param nProfiles:	Number of profiles found in each run. Each run
+			brings a new column in its first profile.
+
+		:return:	A dictionary with the seconds consumed by each export, the
+			seconds taken by the last run and whether both files are equal.
+	'''
+	import osrframework.utils.general as general
+
+	runs = []
+	for i in range(nRuns):
+		profiles = []
+		for j in range(nProfiles):
+			attributes = [
+				{"type": "i3visio.alias", "value": "nick" + str(j), "attributes": []},
+				{"type": "i3visio.platform", "value": "Platform" + str(i), "attributes": []},
+				{"type": "i3visio.uri", "value": "http://platform" + str(i) + ".com/nick" + str(j), "attributes": []}
+			]
+			if j == 0 and i % 10 == 0:
+				attributes.append({"type": "@field" + str(i), "value": u"valu\xe9", "attributes": []})
+			profiles.append({"type": "i3visio.profile", "value": "Platform" + str(i) + " - nick" + str(j), "attributes": attributes})
+		runs.append(profiles)
+
+	folder = tempfile.mkdtemp()
+	res = {}
+	try:
+		for case in ["legacy_export", "incremental_export"]:
+			fPath = os.path.join(folder, case + ".csv")
+			t0 = time.time()
+			for profiles in runs:
+				tLast = time.time()
+				if case == "legacy_export":
+					legacyCsvExport(profiles, fPath)
+				else:
+					general.usufyToCsvExport(profiles, fPath)
+			t1 = time.time()
+			res[case] = t1 - t0
+			res[case + "_last_run"] = t1 - tLast
+			print case + "\t" + str(res[case]) + " seconds\t" + str(res[case + "_last_run"]) + " seconds the last run\n"
+		with open(os.path.join(folder, "legacy_export.csv"), "rb") as iF:
+			legacy = iF.read()
+		with open(os.path.join(folder, "incremental_export.csv"), "rb") as iF:
+			incremental = iF.read()
+		res["same_files"] = legacy == incremental
+		res["rows"] = nRuns * nProfiles
+	finally:
+		shutil.rmtree(folder)
+	return res
+
+
+# Arguments that make each entry point send its first request
+ENTRY_POINTS = {
+	"domainfy": ["-n", "osrfbenchmark", "-t", "global"],
+	"entify": ["-r", "all", "-w", "http://osrfbenchmark.com"],
+	"mailfy": ["-m", "osrfbenchmark@gmail.com"],
+	"phonefy": ["-n", "666666666"],
+	"searchfy": ["-q", "osrfbenchmark"],
+	"usufy": ["-n", "osrfbenchmark", "-p", "twitter"],
+}
+
+# Modules that take long to import and are only needed by some options
+HEAVY_MODULES = ["matplotlib", "networkx", "pyexcel", "Skype4Py", "tweepy", "whois", "yaml"]
+
+# Code run by the child processes of doStartupBenchmark. The first name
+# resolution or connection stops the whole process group.
+STARTUP_BOOTSTRAP = """
+import os, runpy, signal, socket, sys, time
+start, report, module = float(sys.argv[1]), sys.argv[2], sys.argv[3]
+def _firstRequest(*args, **kwargs):
+	with open(report, "w") as oF:
+		oF.write(str(time.time() - start))
+	os.killpg(0, signal.SIGKILL)
+socket.getaddrinfo = socket.gethostbyname = socket.create_connection = _firstRequest
+sys.argv = [module] + sys.argv[4:]
+runpy.run_module(module, run_name="__main__", alter_sys=True)
+"""
+
+# Code run by the child process of doImportProfile
+IMPORTS_BOOTSTRAP = """
+import __builtin__, json, sys, time
+report, module = sys.argv[1], sys.argv[2]
+_import = __builtin__.__import__
+stack, times = [], {}
+def _timedImport(name, *args, **kwargs):
+	if name in sys.modules:
+		return _import(name, *args, **kwargs)
+	if not name:
+		# from . import something
+		label = (args and args[0] or {}).get("__name__", "") + " (relative)"
+	else:
+		label = name
+	stack.append(0.0)
+	t0 = time.time()
+	try:
+		return _import(name, *args, **kwargs)
+	finally:
+		total = time.time() - t0
+		children = stack.pop()
+		if stack:
+			stack[-1] += total
+		cumulative, own = times.get(label, (0.0, 0.0))
+		times[label] = (cumulative + total, own + total - children)
+__builtin__.__import__ = _timedImport
+t0 = time.time()
+__import__(module)
+times["[total]"] = (time.time() - t0, 0.0)
+with open(report, "w") as oF:
+	json.dump(times, oF)
+"""
+
+
+def _runChild(args, timeout=60):
+	'''
+		Running a Python child process in its own process group.
+
+		:param args:	Arguments passed to the interpreter.
+		:param timeout:	Seconds after which the child is killed.
+
+		:return:	A tuple with the seconds that it took and its peak RSS in KB.
+	'''
+	t0 = time.time()
+	with open(os.devnull, "w") as devnull:
+		child = subprocess.Popen([sys.executable] + args, stdout=devnull, stderr=devnull, stdin=devnull, preexec_fn=os.setsid)
+	killer = threading.Timer(timeout, os.killpg, [child.pid, signal.SIGKILL])
+	killer.start()
+	try:
+		pid, status, usage = os.wait4(child.pid, 0)
+	finally:
+		killer.cancel()
+	child.returncode = status
+	return time.time() - t0, usage.ru_maxrss
+
+
+def doStartupBenchmark(entryPoints=None, nRuns=3):
+	'''
+		Measuring the time to show the help, the time to the first request and
+		the peak RSS of the entry points. Each value is the median of the runs.
+
+		:param entryPoints:	List of the names of the entry points, e.g.
+			["usufy"]. None for all of them.
+		:param nRuns:	Number of times that each entry point is launched.
+
+		:return:	A dictionary with the measures of each entry point.
+	'''
+	if not entryPoints:
+		entryPoints = sorted(ENTRY_POINTS.keys())
+
+	res = {}
+	for name in entryPoints:
+		module = "osrframework." + name
+		helpTimes, helpRSS, requestTimes, requestRSS = [], [], [], []
+		for i in range(nRuns):
+			seconds, rss = _runChild(["-m", module, "--help"])
+			helpTimes.append(seconds)
+			helpRSS.append(rss)
+
+			fd, report = tempfile.mkstemp(prefix="osrf-startup-")
+			os.close(fd)
+			try:
+				seconds, rss = _runChild(["-c", STARTUP_BOOTSTRAP, str(time.time()), report, module] + ENTRY_POINTS[name])
+				with open(report) as iF:
+					value = iF.read()
+				if value:
+					requestTimes.append(float(value))
+					requestRSS.append(rss)
+			finally:
+				os.remove(report)
+
+		median = lambda values: sorted(values)[len(values) / 2] if values else None
+		res[name] = {
+			"help_seconds": median(helpTimes),
+			"help_peak_rss_kb": median(helpRSS),
+			"first_request_seconds": median(requestTimes),
+			"first_request_peak_rss_kb": median(requestRSS),
+		}
+		print name + "\t" + str(res[name]["help_seconds"]) + " seconds to --help\t" + str(res[name]["first_request_seconds"]) + " seconds to the first request\t" + str(res[name]["first_request_peak_rss_kb"]) + " KB\n"
+	return res
+
+
+def _getImportTimes(module):
+	'''
+		Importing a module in a new interpreter to time each of the modules
+		that it needs.
+
+		:param module:	The name of the module to be imported.
+
+		:return:	A dictionary {module: [cumulative seconds, own seconds]}.
+	'''
+	fd, report = tempfile.mkstemp(prefix="osrf-imports-")
+	os.close(fd)
+	try:
+		_runChild(["-c", IMPORTS_BOOTSTRAP, report, module])
+		with open(report) as iF:
+			return json.load(iF)
+	finally:
+		os.remove(report)
+
+
+def doImportProfile(module="osrframework.usufy", nModules=25):
+	'''
+		Measuring the time spent importing each module needed by another one
+		in a new interpreter.
+
+		:param module:	The name of the module to be imported.
+		:param nModules:	Number of modules to be shown.
+
+		:return:	A list of [module, cumulative seconds, own seconds] sorted by
+			the cumulative time, starting with the total.
+	'''
+	times = _getImportTimes(module)
+
+	res = sorted([[m] + list(t) for m, t in times.items()], key=lambda x: x[1], reverse=True)[:nModules]
+	for m, cumulative, own in res:
+		print "%.4f\t%.4f\t%s" % (cumulative, own, m)
+	print
+	return res
+
+
+def doLazyImportsCheck(entryPoints=None):
+	'''
+		Verifying that the entry points do not import any of the HEAVY_MODULES
+		before they are needed.
+
+		:param entryPoints:	List of the names of the entry points, e.g.
+			["usufy"]. None for all of them.
+
+		:return:	A dictionary with the heavy modules imported by each entry
+			point.
+	'''
+	if not entryPoints:
+		entryPoints = sorted(ENTRY_POINTS.keys())
+
+	res = {}
+	for name in entryPoints:
+		times = _getImportTimes("osrframework." + name)
+		res[name] = sorted([m for m in HEAVY_MODULES if m in times])
+		if res[name]:
+			print name + "\timports " + ", ".join(res[name]) + "\n"
+		else:
+			print name + "\tOK\n"
+	return res
+
+
+def doRateLimitBenchmark(nNicks=40, nThreads=16, requestsPerSecond=10, delay=0.05, engine="threads"):
+	'''
+		Verifying that a platform limited to some requests per second is not
+		exceeded by the workers of usufy, while another platform of the same
+		run is not delayed.
+
+		:param nNicks:	Number of nicks to be checked.
+		:param nThreads:	Number of workers.
+		:param requestsPerSecond:	Limit of the first platform.
+		:param delay:	Seconds that the stand-in server takes to answer.
+		:param engine:	The engine of usufy to be used.
+
+		:return:	A dictionary with the seconds that it took to send all the
+			requests and the maximum number of requests received in one second
+			by each platform.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+
+	server = startStandInServer(delay)
+	platforms = getStandInPlatforms(server, 2)
+	platforms[0].requestsPerSecond = requestsPerSecond
+	platforms[0].requestsBurst = 1
+	platforms[1].requestsPerSecond = 0
+
+	nicks = ["nobody" + str(i) for i in range(nNicks)]
+	usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, logFolder=tempfile.gettempdir(), engine=engine)
+	browser.closeSessions()
+	server.shutdown()
+
+	res = {}
+	for i, p in enumerate(platforms):
+		times = sorted([t for folder, t in server.hits if folder == "standin" + str(i)])
+		# Maximum number of requests in any window of one second
+		peak = 0
+		first = 0
+		for last in range(len(times)):
+			while times[last] - times[first] >= 1:
+				first += 1
+			peak = max(peak, last - first + 1)
+		res[str(p)] = {
+			"requests_per_second": p.requestsPerSecond,
+			"seconds": times[-1] - times[0],
+			"peak_requests_in_one_second": peak
+		}
+		print str(p) + "\t" + str(res[str(p)]["seconds"]) + " seconds\t" + str(peak) + " requests in one second at most\n"
+	return res
+
+
+def doRetryBenchmark(nNicks=10, nPlatforms=20, nThreads=16, delay=0.05, failureRate=0.2, maxRetries=2):
+	'''
+		Measuring the profiles lost to the transient failures of the
+		platforms and the cost of retrying them.
+
+		:param nNicks:	Number of nicks to be checked. Half of them exist.
+		:param nPlatforms:	Number of platforms to be created.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the stand-in server takes to answer.
+		:param failureRate:	Share of the checks whose first request fails.
+		:param maxRetries:	Retries to be compared with no retries at all.
+
+		:return:	A dictionary with the profiles found, the profiles missed,
+			the requests sent, the retries and the seconds of each setting.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+
+	nicks = ["found" + str(i) for i in range(nNicks / 2)] + ["nobody" + str(i) for i in range(nNicks - nNicks / 2)]
+	expected = (nNicks / 2) * nPlatforms
+
+	res = {}
+	for retries in [0, maxRetries]:
+		server = startStandInServer(delay, failureRate=failureRate)
+		platforms = getStandInPlatforms(server, nPlatforms)
+		for p in platforms:
+			p.maxRetries = retries
+			p.requestsPerSecond = 0
+
+		start = time.time()
+		poolResults = usufy.processNickListThreads(nicks, platforms, nThreads=nThreads)
+		seconds = time.time() - start
+		browser.closeSessions()
+		server.shutdown()
+
+		found = 0
+		retried = 0
+		outcomes = {}
+		for nick in poolResults.keys():
+			for result in poolResults[nick]:
+				if result["data"]:
+					found += 1
+				retried += result["stats"].get("retries", 0)
+				outcome = result["stats"].get("outcome")
+				outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+		res["retries_" + str(retries)] = {
+			"seconds": seconds,
+			"requests": len(server.hits),
+			"retries": retried,
+			"profiles_found": found,
+			"profiles_missed": expected - found,
+			"outcomes": outcomes
+		}
+		print "Retries: " + str(retries) + "\t" + str(seconds) + " seconds\t" + str(len(server.hits)) + " requests\t" + str(expected - found) + " profiles missed\n"
+	return res
+
+
+def doCacheBenchmark(nNicks=10, nPlatforms=20, nThreads=16, delay=0.05):
+	'''
+		Launching the same usufy run twice with the response cache enabled.
+
+		:param nNicks:	Number of nicks to be checked. Half of them exist.
+		:param nPlatforms:	Number of platforms to be created.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the stand-in server takes to answer.
+
+		:return:	A dictionary with the seconds, the requests received by the
+			server and the profiles found in each run and the statistics of the
+			cache.
+	'''
+	import shutil
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+	import osrframework.utils.http_cache as http_cache
+
+	folder = tempfile.mkdtemp()
+	cache = http_cache.getResponseCache(folder=folder)
+	browser.setCacheEnabled(True)
+
+	server = startStandInServer(delay)
+	platforms = getStandInPlatforms(server, nPlatforms)
+	for p in platforms:
+		p.requestsPerSecond = 0
+	nicks = ["found" + str(i) for i in range(nNicks / 2)] + ["nobody" + str(i) for i in range(nNicks - nNicks / 2)]
+
+	res = {}
+	try:
+		for run in ["first_run", "cached_run"]:
+			requests = len(server.hits)
+			start = time.time()
+			profiles = usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, logFolder=tempfile.gettempdir(), engine="threads")
+			res[run] = {
+				"seconds": time.time() - start,
+				"requests": len(server.hits) - requests,
+				"profiles": len(profiles)
+			}
+			print run + "\t" + str(res[run]["seconds"]) + " seconds\t" + str(res[run]["requests"]) + " requests\n"
+		res["cache"] = cache.getStats()
+	finally:
+		browser.setCacheEnabled(None)
+		browser.closeSessions()
+		server.shutdown()
+		shutil.rmtree(folder)
+	return res
+
+
+def doNegativeCacheBenchmark(nNicks=40, nPlatforms=20, nThreads=16, delay=0.05, engine="threads"):
+	'''
+		Launching the same usufy run twice using the negative cache, as when
+		a list of aliases is checked again.
+
+		:param nNicks:	Number of nicks to be checked. One in ten exists.
+		:param nPlatforms:	Number of platforms to be created.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the stand-in server takes to answer.
+		:param engine:	The engine of usufy to be used.
+
+		:return:	A dictionary with the seconds, the requests received by the
+			server and the profiles found in each run.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+	import osrframework.utils.negative_cache as negative_cache
+
+	fd, path = tempfile.mkstemp(suffix=".sqlite")
+	os.close(fd)
+	negative_cache.getNegativeCache(path)
+
+	server = startStandInServer(delay)
+	platforms = getStandInPlatforms(server, nPlatforms)
+	for p in platforms:
+		p.requestsPerSecond = 0
+	nicks = [("found" if i % 10 == 0 else "nobody") + str(i) for i in range(nNicks)]
+
+	res = {}
+	try:
+		for run in ["first_run", "second_run"]:
+			requests = len(server.hits)
+			start = time.time()
+			profiles = usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, logFolder=tempfile.gettempdir(), engine=engine, negativeCacheTTL=3600)
+			res[run] = {
+				"seconds": time.time() - start,
+				"requests": len(server.hits) - requests,
+				"profiles": len(profiles)
+			}
+			print run + "\t" + str(res[run]["seconds"]) + " seconds\t" + str(res[run]["requests"]) + " requests\n"
+	finally:
+		browser.closeSessions()
+		server.shutdown()
+		os.remove(path)
+	return res
+
+
+def doResumeBenchmark(nNicks=10, nPlatforms=20, nThreads=16, delay=0.05, engine="threads"):
+	'''
+		Launching a usufy run, stopping it by truncating its journal as if it
+		had been killed halfway and resuming it.
+
+		:param nNicks:	Number of nicks to be checked. One in ten exists.
+		:param nPlatforms:	Number of platforms to be created.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the stand-in server takes to answer.
+		:param engine:	The engine of usufy to be used.
+
+		:return:	A dictionary with the seconds, the requests received by the
+			server and the profiles found in the full run and in the resumed
+			one, and whether both found the same profiles.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+	import osrframework.utils.checkpoint as checkpoint
+
+	folder = tempfile.mkdtemp()
+	server = startStandInServer(delay)
+	platforms = getStandInPlatforms(server, nPlatforms)
+	for p in platforms:
+		p.requestsPerSecond = 0
+	nicks = [("found" if i % 10 == 0 else "nobody") + str(i) for i in range(nNicks)]
+
+	res = {}
+	found = {}
+	try:
+		for run in ["full_run", "resumed_run"]:
+			if run == "full_run":
+				journal, done = checkpoint.getJournal("usufy", fileHeader=os.path.join(folder, "full"), queries=nicks)
+			else:
+				# Keeping the first half of the checks and a torn line
+				with open(os.path.join(folder, "full" + checkpoint.JOURNAL_EXTENSION)) as iF:
+					lines = iF.readlines()
+				with open(os.path.join(folder, "stopped" + checkpoint.JOURNAL_EXTENSION), "w") as oF:
+					oF.writelines(lines[:len(lines) / 2])
+					oF.write(lines[len(lines) / 2][:20])
+				journal, done = checkpoint.getJournal("usufy", resume=os.path.join(folder, "stopped" + checkpoint.JOURNAL_EXTENSION), queries=nicks)
+			requests = len(server.hits)
+			start = time.time()
+			profiles = usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, logFolder=tempfile.gettempdir(), engine=engine, journal=journal, done=done)
+			journal.close()
+			found[run] = sorted([json.dumps(profile, sort_keys=True) for profile in profiles])
+			res[run] = {
+				"seconds": time.time() - start,
+				"requests": len(server.hits) - requests,
+				"profiles": len(profiles)
+			}
+			print run + "\t" + str(res[run]["seconds"]) + " seconds\t" + str(res[run]["requests"]) + " requests\n"
+	finally:
+		browser.closeSessions()
+		server.shutdown()
+		shutil.rmtree(folder)
+	res["same_profiles"] = found["full_run"] == found["resumed_run"]
+	return res
+
+
+def doSchedulerBenchmark(nNicks=100, nPlatforms=20, nThreads=16, delay=0.05, slowDelay=1.0, maxPerHost=4):
+	'''
+		Comparing the usufy engines when one of the platforms is slow. Each
+		platform is served by its own stand-in server so that each of them is
+		a different host.
+
+		:param nNicks:	Number of nicks to be checked. One in ten exists.
+		:param nPlatforms:	Number of platforms to be created.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the stand-in servers take to answer.
+		:param slowDelay:	Seconds that the server of the slow platform takes
+			to answer.
+		:param maxPerHost:	Maximum number of checks sent to the same host at
+			once by the threads engine.
+
+		:return:	A dictionary with the seconds consumed by each engine, the
+			highest number of requests answered at once by a server and
+			whether both engines found the same profiles.
+	'''
+	import osrframework.usufy as usufy
+	import osrframework.utils.browser as browser
+
+	servers = [startStandInServer(slowDelay if i == 0 else delay) for i in range(nPlatforms)]
+	platforms = [getStandInPlatforms(server, i + 1)[i] for i, server in enumerate(servers)]
+	for p in platforms:
+		p.requestsPerSecond = 0
+	nicks = [("found" if i % 10 == 0 else "nobody") + str(i) for i in range(nNicks)]
+
+	res = {}
+	found = {}
+	try:
+		for engine in ["pool", "threads"]:
+			for server in servers:
+				server.maxActive = 0
+			start = time.time()
+			profiles = usufy.processNickList(nicks, platforms, nThreads=nThreads, verbosity=0, logFolder=tempfile.gettempdir(), engine=engine, maxPerHost=maxPerHost)
+			res[engine] = time.time() - start
+			res[engine + "_max_requests_per_host"] = max([server.maxActive for server in servers])
+			found[engine] = sorted([json.dumps(profile, sort_keys=True) for profile in profiles])
+			print engine + "\t" + str(res[engine]) + " seconds\t" + str(len(profiles)) + " profiles\n"
+	finally:
+		browser.closeSessions()
+		for server in servers:
+			server.shutdown()
+	res["same_profiles"] = found["pool"] == found["threads"]
+	return res
+
+
+class StandInSMTPHandler(SocketServer.StreamRequestHandler):
+	'''
+		Handler of the stand-in SMTP server. The mailboxes whose local part
+		starts with "found" exist and the rest are rejected. The server
+		refuses more than maxRcpt recipients per transaction and closes the
+		sessions after maxRcptPerSession recipients.
+	'''
+	def handle(self):
+		with self.server.lock:
+			self.server.connections += 1
+		# The handshake, the reverse lookups and the greeting delays
+		time.sleep(self.server.delay)
+		self.wfile.write("220 standin.local ESMTP\r\n")
+		rcpts = 0
+		sessionRcpts = 0
+		while True:
+			line = self.rfile.readline()
+			if not line:
+				return
+			command = line.strip().upper()
+			if command.startswith("HELO") or command.startswith("EHLO"):
+				answer = "250 standin.local"
+			elif command.startswith("MAIL FROM"):
+				rcpts = 0
+				answer = "250 2.1.0 OK"
+			elif command.startswith("RCPT TO"):
+				time.sleep(self.server.commandDelay)
+				with self.server.lock:
+					self.server.rcpts += 1
+				if sessionRcpts >= self.server.maxRcptPerSession:
+					self.wfile.write("421 4.7.0 Too many recipients in this session\r\n")
+					return
+				if rcpts >= self.server.maxRcpt:
+					answer = "452 4.5.3 Too many recipients"
+				else:
+					rcpts += 1
+					sessionRcpts += 1
+					if line.split("<")[1].lower().startswith("found"):
+						answer = "250 2.1.5 OK"
+					else:
+						answer = "550 5.1.1 The email account that you tried to reach does not exist"
+			elif command.startswith("RSET"):
+				rcpts = 0
+				answer = "250 2.0.0 OK"
+			elif command.startswith("QUIT"):
+				self.wfile.write("221 2.0.0 Bye\r\n")
+				return
+			else:
+				answer = "250 2.0.0 OK"
+			self.wfile.write(answer + "\r\n")
+
+
+class StandInSMTPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+	'''
+		A local SMTP server that plays the role of a mail server.
+	'''
+	daemon_threads = True
+	allow_reuse_address = True
+
+	def handle_error(self, request, client_address):
+		# The clients may close the sessions without a QUIT
+		pass
+
+
+def startStandInSMTPServer(delay=0.05, commandDelay=0.001, maxRcpt=20, maxRcptPerSession=100):
+	'''
+		Launching a stand-in SMTP server in a random local port.
+
+		:param delay:	Seconds that the server waits before the greeting.
+		:param commandDelay:	Seconds that the server takes to answer each
+			RCPT TO command.
+		:param maxRcpt:	Recipients accepted in each transaction.
+		:param maxRcptPerSession:	Recipients accepted before closing the
+			session.
+
+		:return:	The <StandInSMTPServer> running in the background.
+	'''
+	server = StandInSMTPServer(("127.0.0.1", 0), StandInSMTPHandler)
+	server.delay = delay
+	server.commandDelay = commandDelay
+	server.maxRcpt = maxRcpt
+	server.maxRcptPerSession = maxRcptPerSession
+	server.lock = threading.Lock()
+	# Sessions opened and recipients checked
+	server.connections = 0
+	server.rcpts = 0
+	t = threading.Thread(target=server.serve_forever)
+	t.daemon = True
+	t.start()
+	return server
+
+
+def legacyVerifyEmail(email, host):
+	'''
+		The verification performed by emailahoy up to 0.17.4, opening a new
+		session for each email, used as the reference of doSMTPBenchmark.
+
+		:param email:	The email to be verified.
+		:param host:	The mail server as host:port.
+
+		:return:	A tuple with the email and whether it was found.
+	'''
+	import smtplib
+
+	server = smtplib.SMTP(local_hostname="example.com")
+	try:
+		server.connect(host)
+		server.docmd("HELO example.com")
+		server.docmd("MAIL FROM: <verify@example.com>")
+		code, message = server.docmd("RCPT TO: <%s>" % email)
+		server.quit()
+	except (smtplib.SMTPException, socket.error):
+		server.close()
+		return email, False
+	return email, code == 250
+
+
+def doSMTPBenchmark(nNicks=50, nDomains=10, nThreads=16, delay=0.05):
+	'''
+		Comparing the verification of emails opening a session for each of
+		them against the smtp engine of mailfy. Each domain is handled by its
+		own stand-in SMTP server.
+
+		:param nNicks:	Number of nicks. One in ten exists in every domain.
+		:param nDomains:	Number of domains.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the servers wait before the greeting.
+
+		:return:	A dictionary with the seconds, the sessions opened and the
+			emails checked per second in each case and whether both found the
+			same emails.
+	'''
+	import osrframework.utils.smtp_verifier as smtp_verifier
+	import osrframework.utils.task_runner as task_runner
+
+	servers = [startStandInSMTPServer(delay) for i in range(nDomains)]
+	mx = {}
+	for i, server in enumerate(servers):
+		mx["domain" + str(i) + ".test"] = "127.0.0.1:" + str(server.server_address[1])
+	emails = []
+	for i in range(nNicks):
+		for domain in sorted(mx.keys()):
+			emails.append(("found" if i % 10 == 0 else "nobody") + str(i) + "@" + domain)
+
+	res = {"emails": len(emails)}
+	found = {}
+	try:
+		for case in ["legacy_verification", "smtp_engine"]:
+			connections = sum([server.connections for server in servers])
+			t0 = time.time()
+			if case == "legacy_verification":
+				runner = task_runner.TaskRunner(legacyVerifyEmail, nThreads=nThreads, useThreads=True)
+				found[case] = sorted([email for email, isValid in runner.run([(e, mx[e.split("@")[1]]) for e in emails]) if isValid])
+			else:
+				verifier = smtp_verifier.SMTPVerifier(getMX=lambda domain: [mx[domain]])
+				outcomes = verifier.verify(emails, nThreads)
+				found[case] = sorted([email for email, outcome in outcomes.items() if outcome == smtp_verifier.FOUND])
+			t1 = time.time()
+			res[case] = t1 - t0
+			res[case + "_sessions"] = sum([server.connections for server in servers]) - connections
+			res[case + "_emails_per_second"] = len(emails) / res[case]
+			print case + "\t" + str(res[case]) + " seconds\t" + str(res[case + "_sessions"]) + " sessions\t" + str(len(found[case])) + " found\n"
+	finally:
+		for server in servers:
+			server.shutdown()
+	res["same_results"] = found["legacy_verification"] == found["smtp_engine"]
+	return res
+
+
+class StandInDNSHandler(SocketServer.BaseRequestHandler):
+	'''
+		Handler of the stand-in DNS server. The names whose first label starts
+		with "nx" do not exist. The rest have an A record and an MX record and
+		no AAAA records. In the wildcard TLDs, the names whose first label
+		starts with "nick" are registered and the rest resolve to 10.9.9.9.
+	'''
+	def handle(self):
+		import DNS
+
+		data, sock = self.request
+		u = DNS.Lib.Munpacker(data)
+		header = u.getHeader()
+		qname, qtype, qclass = u.getQuestion()
+		with self.server.lock:
+			self.server.queries += 1
+			if self.server.random.random() < self.server.dropRate:
+				# The query is lost
+				return
+
+		rcode = 0
+		answers = []
+		label = qname.split(".")[0].lower()
+		if qtype == DNS.Type.A and not label.startswith("nick") and [w for w in self.server.wildcards if qname.lower().endswith(w)]:
+			answers.append(lambda m: m.addA(qname, DNS.Class.IN, self.server.ttl, "10.9.9.9"))
+		elif label.startswith("nx"):
+			# NXDOMAIN
+			rcode = 3
+		elif qtype == DNS.Type.A:
+			answers.append(lambda m: m.addA(qname, DNS.Class.IN, self.server.ttl, "10.0.0." + str(1 + len(qname) % 250)))
+		elif qtype == DNS.Type.MX:
+			answers.append(lambda m: m.addMX(qname, DNS.Class.IN, self.server.ttl, 10, "mx." + qname))
+
+		m = DNS.Lib.Mpacker()
+		m.addHeader(header[0], 1, 0, 1, 0, header[5], 1, 0, rcode, 1, len(answers), 0, 0)
+		m.addQuestion(qname, qtype, qclass)
+		for addAnswer in answers:
+			addAnswer(m)
+		# The time taken by the recursive resolution
+		self.server.schedule(m.getbuf(), self.client_address)
+
+
+class StandInDNSServer(SocketServer.UDPServer):
+	'''
+		A local UDP server that plays the role of a recursive resolver. The
+		queries are read by a single thread and the answers are sent by
+		another one once their delay has passed, so that it can take
+		thousands of queries at the same time.
+	'''
+	allow_reuse_address = True
+
+	def schedule(self, answer, address):
+		'''
+			Sending an answer after the delay of the server.
+
+			:param answer:	The packet to be sent.
+			:param address:	The address of the client.
+		'''
+		with self.pendingCondition:
+			heapq.heappush(self.pending, (time.time() + self.delay, self.queries, answer, address))
+			self.pendingCondition.notify()
+
+	def sendAnswers(self):
+		'''
+			Loop of the thread that sends the answers.
+		'''
+		while True:
+			with self.pendingCondition:
+				while not self.pending or self.pending[0][0] > time.time():
+					self.pendingCondition.wait(self.pending[0][0] - time.time() if self.pending else None)
+				due, n, answer, address = heapq.heappop(self.pending)
+			self.socket.sendto(answer, address)
+
+
+def startStandInDNSServer(delay=0.02, ttl=3600, dropRate=0.0, wildcards=[]):
+	'''
+		Launching a stand-in DNS server in a random local port.
+
+		:param delay:	Seconds that the server takes to answer each query.
+		:param ttl:	TTL of the records.
+		:param dropRate:	Share of the queries that are ignored.
+		:param wildcards:	Suffixes that resolve any name, e. g. [".tk"].
+
+		:return:	The <StandInDNSServer> running in the background.
+	'''
+	server = StandInDNSServer(("127.0.0.1", 0), StandInDNSHandler)
+	server.delay = delay
+	server.ttl = ttl
+	server.dropRate = dropRate
+	server.wildcards = wildcards
+	server.random = random.Random(0)
+	server.lock = threading.Lock()
+	# Queries received
+	server.queries = 0
+	# Answers waiting for their delay as (time, order, answer, address)
+	server.pending = []
+	server.pendingCondition = threading.Condition()
+	for target in [server.serve_forever, server.sendAnswers]:
+		t = threading.Thread(target=target)
+		t.daemon = True
+		t.start()
+	return server
+
+
+def resolveName(dns, name, rtype):
+	'''
+		Resolving a name in the workers of doResolverBenchmark.
+
+		:param dns:	The <resolver.Resolver>.
+		:param name:	The name to be resolved.
+		:param rtype:	The type of the records.
+
+		:return:	The list of answers.
+	'''
+	return dns.resolve(name, rtype)
+
+
+def doResolverBenchmark(nNicks=50, nDomains=10, nThreads=16, delay=0.02):
+	'''
+		Measuring the queries saved by the DNS cache against a stand-in DNS
+		server. First, the MX records of the domains of many emails are
+		resolved as mailfy does, only sharing the lookups in flight (a TTL of
+		0) and with the cache. Then,
+		domainfy is launched twice over the same domains, as two runs of the
+		tool would do: the first one with an empty cache and the second one
+		with the answers stored on disk by the first.
+
+		:param nNicks:	Number of nicks. One in three does not exist.
+		:param nDomains:	Number of mail domains and of TLDs.
+		:param nThreads:	Number of workers.
+		:param delay:	Seconds that the server takes to answer each query.
+
+		:return:	A dictionary with the seconds, the queries received by the
+			server and the hit rate of each case and whether the runs of
+			domainfy found the same domains.
+	'''
+	import osrframework.domainfy as domainfy
+	import osrframework.utils.resolver as resolver
+	import osrframework.utils.task_runner as task_runner
+
+	server = startStandInDNSServer(delay)
+	nameservers = ["127.0.0.1:" + str(server.server_address[1])]
+	tmpFolder = tempfile.mkdtemp()
+	cachePath = os.path.join(tmpFolder, "dns_cache.sqlite")
+
+	nicks = [("nx" if i % 3 == 0 else "nick") + str(i) for i in range(nNicks)]
+	mailDomains = ["mail" + str(i) + ".test" for i in range(nDomains)]
+	tlds = [{"tld": ".tld" + str(i), "type": "user_defined"} for i in range(nDomains)]
+	domains = domainfy.createDomains(tlds, nicks=nicks)
+
+	res = {}
+	found = {}
+	try:
+		for case in ["mx_uncached", "mx_cached", "domainfy_first_run", "domainfy_second_run"]:
+			queries = server.queries
+			t0 = time.time()
+			if case.startswith("mx"):
+				ttl = 0 if case == "mx_uncached" else 3600
+				dns = resolver.Resolver(nameservers=nameservers, ttl=ttl, path=cachePath)
+				runner = task_runner.TaskRunner(resolveName, nThreads=nThreads, useThreads=True)
+				tasks = [(dns, d, "MX") for n in nicks for d in mailDomains]
+				list(runner.run(tasks))
+			else:
+				if case == "domainfy_first_run":
+					os.remove(cachePath)
+				# Starting with an empty memory, as a new run would
+				resolver._RESOLVER["resolver"] = None
+				dns = resolver.getResolver(nameservers=nameservers, ttl=3600, path=cachePath)
+				found[case] = sorted([r["value"] for r in domainfy.performSearch(domains, nThreads)])
+			t1 = time.time()
+			stats = dns.getStats()
+			res[case] = t1 - t0
+			res[case + "_queries"] = server.queries - queries
+			res[case + "_hit_rate"] = stats["hit_rate"]
+			print case + "\t" + str(res[case]) + " seconds\t" + str(res[case + "_queries"]) + " queries\t" + resolver.getStatsSummary(stats) + "\n"
+	finally:
+		server.shutdown()
+		resolver._RESOLVER["resolver"] = None
+		shutil.rmtree(tmpFolder)
+	res["same_results"] = found["domainfy_first_run"] == found["domainfy_second_run"]
+	res["domains_found"] = len(found["domainfy_first_run"])
+	return res
+
+
+def doBulkDNSBenchmark(nNicks=5, nDomains=1000, nThreads=16, delay=0.02, dropRate=0.01):
+	'''
+		Comparing the engines of domainfy against a stand-in DNS server that
+		loses some of the queries. The domains are resolved with an empty
+		cache kept in memory in both cases.
+
+		:param nNicks:	Number of nicks. One in three does not exist.
+		:param nDomains:	Number of TLDs.
+		:param nThreads:	Number of threads of the threads engine.
+		:param delay:	Seconds that the server takes to answer each query.
+		:param dropRate:	Share of the queries that the server ignores.
+
+		:return:	A dictionary with the seconds, the queries received by the
+			server and the domains resolved per second by each engine and
+			whether both found the same domains.
+	'''
+	import osrframework.domainfy as domainfy
+	import osrframework.utils.resolver as resolver
+
+	server = startStandInDNSServer(delay, dropRate=dropRate)
+	nameservers = ["127.0.0.1:" + str(server.server_address[1])]
+
+	nicks = [("nx" if i % 3 == 0 else "nick") + str(i) for i in range(nNicks)]
+	tlds = [{"tld": ".tld" + str(i), "type": "user_defined"} for i in range(nDomains)]
+	domains = domainfy.createDomains(tlds, nicks=nicks)
+
+	res = {"domains": len(domains)}
+	found = {}
+	try:
+		for engine in ["threads", "async"]:
+			resolver._RESOLVER["resolver"] = None
+			# The queries lost are sent again after a second
+			dns = resolver.getResolver(nameservers=nameservers, path=False)
+			dns.timeout = 1
+			queries = server.queries
+			t0 = time.time()
+			found[engine] = sorted([r["value"] for r in domainfy.performSearch(domains, nThreads, engine=engine)])
+			t1 = time.time()
+			res[engine] = t1 - t0
+			res[engine + "_queries"] = server.queries - queries
+			res[engine + "_domains_per_second"] = len(domains) / res[engine]
+			print engine + "\t" + str(res[engine]) + " seconds\t" + str(res[engine + "_queries"]) + " queries\t" + str(len(found[engine])) + " found\n"
+	finally:
+		server.shutdown()
+		resolver._RESOLVER["resolver"] = None
+	res["same_results"] = found["threads"] == found["async"]
+	return res
+
+
+def doWildcardBenchmark(nNicks=10, nDomains=100, nThreads=16, delay=0.02, whoisDelay=0.2):
+	'''
+		Measuring the false positives of domainfy in the TLDs that resolve any
+		name, with and without probing them first. One in ten TLDs of the
+		stand-in DNS server is a wildcard and the whois lookups are replaced by
+		a function that takes whoisDelay seconds.
+
+		:param nNicks:	Number of nicks. One in three is not registered.
+		:param nDomains:	Number of TLDs.
+		:param nThreads:	Number of threads used for the whois lookups.
+		:param delay:	Seconds that the server takes to answer each query.
+		:param whoisDelay:	Seconds taken by each whois lookup.
+
+		:return:	A dictionary with the seconds, the domains found, the false
+			positives and the whois lookups of each case.
+	'''
+	import osrframework.domainfy as domainfy
+	import osrframework.utils.resolver as resolver
+
+	wildcards = [".tld" + str(i) for i in range(0, nDomains, 10)]
+	server = startStandInDNSServer(delay, wildcards=wildcards)
+	nameservers = ["127.0.0.1:" + str(server.server_address[1])]
+
+	nicks = [("nx" if i % 3 == 0 else "nick") + str(i) for i in range(nNicks)]
+	tlds = [{"tld": ".tld" + str(i), "type": "user_defined"} for i in range(nDomains)]
+	domains = domainfy.createDomains(tlds, nicks=nicks)
+
+	whoisCalls = []
+	def getWhoisInfo(domain):
+		whoisCalls.append(domain)
+		time.sleep(whoisDelay)
+		return []
+	legacyWhois = domainfy.getWhoisInfo
+	domainfy.getWhoisInfo = getWhoisInfo
+
+	res = {"domains": len(domains)}
+	try:
+		for case in ["without_detection", "with_detection"]:
+			resolver._RESOLVER["resolver"] = None
+			resolver.getResolver(nameservers=nameservers, path=False)
+			domainfy._WILDCARDS.clear()
+			del whoisCalls[:]
+			t0 = time.time()
+			# The whois cache would answer the lookups of the second case
+			found = [r["attributes"][-3]["value"] for r in domainfy.performSearch(domains, nThreads, launchWhois=True, detectWildcards=(case == "with_detection"), whoisCacheTtl=0)]
+			t1 = time.time()
+			res[case] = t1 - t0
+			res[case + "_found"] = len(found)
+			res[case + "_false_positives"] = len([d for d in found if d.startswith("nx")])
+			res[case + "_whois"] = len(whoisCalls)
+			print case + "\t" + str(res[case]) + " seconds\t" + str(len(found)) + " found\t" + str(res[case + "_false_positives"]) + " false positives\t" + str(len(whoisCalls)) + " whois lookups\n"
+	finally:
+		domainfy.getWhoisInfo = legacyWhois
+		server.shutdown()
+		resolver._RESOLVER["resolver"] = None
+	return res
+
+
+def doWhoisBenchmark(nNicks=10, nDomains=20, nThreads=16, delay=0.02, whoisDelay=0.2, maxPerServer=2):
+	'''
+		Measuring domainfy --whois with the whois lookups run after resolving
+		all the domains and without limits, as it was done before, and in the
+		whois stage, with and without the info cached by a previous run. The
+		lookups are replaced by a function that takes whoisDelay seconds and
+		that is throttled when a TLD receives more than maxPerServer of them
+		at the same time.
+
+		:param nNicks:	Number of nicks. One in three is not registered.
+		:param nDomains:	Number of TLDs.
+		:param nThreads:	Number of threads used for the whois lookups.
+		:param delay:	Seconds that the server takes to answer each query.
+		:param whoisDelay:	Seconds taken by each whois lookup.
+		:param maxPerServer:	Lookups accepted at the same time by each TLD.
+
+		:return:	A dictionary with the seconds, the domains found with whois
+			info and the whois lookups of each case.
+	'''
+	import osrframework.domainfy as domainfy
+	import osrframework.utils.resolver as resolver
+	import osrframework.utils.task_runner as task_runner
+	import osrframework.utils.whois_stage as whois_stage
+
+	server = startStandInDNSServer(delay)
+	nameservers = ["127.0.0.1:" + str(server.server_address[1])]
+
+	nicks = [("nx" if i % 3 == 0 else "nick") + str(i) for i in range(nNicks)]
+	tlds = [{"tld": ".tld" + str(i), "type": "user_defined"} for i in range(nDomains)]
+	domains = domainfy.createDomains(tlds, nicks=nicks)
+
+	lock = threading.Lock()
+	active = collections.Counter()
+	whoisCalls = []
+	def getWhoisInfo(domain):
+		tld = domain.split(".")[-1]
+		with lock:
+			whoisCalls.append(domain)
+			active[tld] += 1
+			throttled = active[tld] > maxPerServer
+		try:
+			if throttled:
+				time.sleep(whoisDelay / 10)
+				raise whois_stage.WhoisThrottledError("Query rate limit exceeded")
+			time.sleep(whoisDelay)
+			return [{"type": "i3visio.registrar", "value": "Registrar of " + tld, "attributes": []}]
+		finally:
+			with lock:
+				active[tld] -= 1
+	legacyWhois = domainfy.getWhoisInfo
+	domainfy.getWhoisInfo = getWhoisInfo
+
+	def getDomainResult(d, addresses):
+		try:
+			info = getWhoisInfo(d["domain"])
+		except whois_stage.WhoisThrottledError:
+			info = []
+		return domainfy.getDomainResult(d, addresses, whoisInfo=info)
+
+	tmpFolder = tempfile.mkdtemp()
+	res = {"domains": len(domains)}
+	try:
+		whois_stage.getWhoisCache(os.path.join(tmpFolder, "whois_cache.sqlite"))
+		for case in ["legacy", "stage", "stage_cached"]:
+			resolver._RESOLVER["resolver"] = None
+			resolver.getResolver(nameservers=nameservers, path=False)
+			del whoisCalls[:]
+			t0 = time.time()
+			if case == "legacy":
+				byName = dict([(d["domain"], d) for d in domains])
+				whoisTasks = []
+				for name, addresses, error in resolver.getResolver().resolveMany(byName.keys()):
+					if addresses:
+						whoisTasks.append((byName[name], addresses))
+				runner = task_runner.TaskRunner(getDomainResult, nThreads=nThreads, useThreads=True)
+				results = [r["data"] for r in runner.run(whoisTasks)]
+			else:
+				results = domainfy.performSearch(domains, nThreads, launchWhois=True, detectWildcards=False, whoisPerServer=maxPerServer)
+			t1 = time.time()
+			res[case] = t1 - t0
+			res[case + "_found"] = len(results)
+			res[case + "_with_whois"] = len([r for r in results if r["attributes"][0]["type"] == "i3visio.registrar"])
+			res[case + "_whois"] = len(whoisCalls)
+			print case + "\t" + str(res[case]) + " seconds\t" + str(len(results)) + " found\t" + str(res[case + "_with_whois"]) + " with whois info\t" + str(len(whoisCalls)) + " whois lookups\n"
+	finally:
+		domainfy.getWhoisInfo = legacyWhois
+		server.shutdown()
+		resolver._RESOLVER["resolver"] = None
+		whois_stage._CACHE["cache"] = None
+		shutil.rmtree(tmpFolder)
+	return res
+
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='benchmark.py - Performance tests of OSRFramework against local stand-in servers.', prog='benchmark.py')
+	parser.add_argument('test', choices=['browser', 'bulkdns', 'cache', 'connections', 'dns', 'engines', 'export', 'extraction', 'imports', 'lazy', 'negative', 'ratelimit', 'resume', 'retries', 'scheduler', 'smtp', 'startup', 'streaming', 'whois', 'wildcards'], help='the benchmark to be launched.')
+	parser.add_argument('-n', '--nicks', metavar='<number>', type=int, default=10, help='number of nicks to be used.')
+	parser.add_argument('-p', '--platforms', metavar='<number>', type=int, default=20, help='number of platforms to be used.')
+	parser.add_argument('-T', '--threads', metavar='<number>', type=int, default=16, help='number of threads to be used.')
+	parser.add_argument('-r', '--requests', metavar='<number>', type=int, default=200, help='number of requests to be sent, browsers to be created, rounds of extractions, modules to be shown or profiles exported in each run.')
+	parser.add_argument('-d', '--delay', metavar='<seconds>', type=float, default=0.05, help='seconds that the stand-in server takes to answer.')
+	parser.add_argument('-s', '--size', metavar='<bytes>', type=int, default=500000, help='bytes that follow the contents of each page.')
+	parser.add_argument('-c', '--corpus', metavar='<path>', default=None, help='folder with saved profiles named after the platforms, e.g. twitter.html.')
+	parser.add_argument('-E', '--entry_points', metavar='<name>', nargs='+', choices=sorted(ENTRY_POINTS.keys()), default=None, help='entry points to be measured. Default: all of them.')
+	parser.add_argument('-R', '--runs', metavar='<number>', type=int, default=3, help='number of times that each entry point is launched or number of runs exported.')
+	args = parser.parse_args()
+
+	if args.test == "browser":
+		res = doBrowserBenchmark(args.requests)
+	elif args.test == "bulkdns":
+		res = doBulkDNSBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "cache":
+		res = doCacheBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "connections":
+		res = doConnectionBenchmark(args.requests, args.delay)
+	elif args.test == "dns":
+		res = doResolverBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "engines":
+		res = doEngineBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "export":
+		res = doExportBenchmark(args.runs, args.requests)
+	elif args.test == "extraction":
+		res = doExtractionBenchmark(args.corpus, args.requests)
+	elif args.test == "imports":
+		res = doImportProfile("osrframework." + (args.entry_points or ["usufy"])[0], args.requests)
+	elif args.test == "lazy":
+		res = doLazyImportsCheck(args.entry_points)
+	elif args.test == "negative":
+		res = doNegativeCacheBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "ratelimit":
+		res = doRateLimitBenchmark(args.nicks, args.threads, delay=args.delay)
+	elif args.test == "resume":
+		res = doResumeBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "retries":
+		res = doRetryBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "scheduler":
+		res = doSchedulerBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "smtp":
+		res = doSMTPBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "startup":
+		res = doStartupBenchmark(args.entry_points, args.runs)
+	elif args.test == "streaming":
+		res = doStreamingBenchmark(args.requests, args.size)
+	elif args.test == "wildcards":
+		res = doWildcardBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	elif args.test == "whois":
+		res = doWhoisBenchmark(args.nicks, args.platforms, args.threads, args.delay)
+	print json.dumps(res, indent=2, sort_keys=True)
+
+	if args.test == "lazy" and [name for name in res.keys() if res[name]]:
+		sys.exit(1)
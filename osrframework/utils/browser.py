@@ -21,133 +21,513 @@
 ##################################################################################
 
 # Required libraries
-import mechanize
+import collections
 import cookielib
 import ConfigParser
 import random
 import os
-
+import re
+import socket
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.connection import HTTPConnection, HTTPSConnection
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from requests.packages.urllib3.exceptions import NewConnectionError, ReadTimeoutError
 
 import osrframework.utils.configuration as configuration
+import osrframework.utils.http_cache as http_cache
+import osrframework.utils.markers as markers
+import osrframework.utils.rate_limiter as rate_limiter
 
 # logging imports
 import logging
 
-class Browser():
-    """
-        Utility used to code a Browser.
+# Number of hosts whose connections are kept open by each session
+POOLED_HOSTS = 512
+
+# Bytes read from the responses in each iteration
+CHUNK_SIZE = 16384
+# Bytes left in a response whose download was stopped that are read anyway to
+#   keep the connection open
+DRAIN_BYTES = 65536
+
+# Regular expression to find the refresh tags that a browser would follow
+REFRESH_REGEXP = re.compile("^\\s*(\\d+)\\s*;\\s*url\\s*=\\s*['\"]?([^'\"]+)", re.IGNORECASE)
+META_REFRESH_REGEXP = re.compile("<meta[^>]+http-equiv=[\"']?refresh[\"']?[^>]+content=[\"']([^\"']+)[\"']", re.IGNORECASE)
+
+# Maximum number of seconds waited before retrying a request, even if the
+#   platform asks for more in its Retry-After header
+MAX_BACKOFF = 10.0
+# Failures of a request that are worth a retry
+RETRIED_FAILURES = ["connect_timeout", "read_timeout", "throttled", "server_error"]
+
+# Sessions opened by this process keyed by the proxies used
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Whether the response cache is used, overriding browser.cfg if not None
+_CACHE_ENABLED = {"enabled": None}
+
+# Seconds spent resolving and connecting by the requests of each thread
+_TIMINGS = threading.local()
+
+
+def _addTiming(name, seconds):
     """
-    def __init__(self):
-        """
-            Recovering an instance of a new Browser.
-        """
+        Adding the seconds of a phase to the timings of this thread.
 
-        # Browser
-        self.br = mechanize.Browser()
+        :param name:    "dns" or "connect".
+        :param seconds: Seconds spent.
+    """
+    setattr(_TIMINGS, name, getattr(_TIMINGS, name, 0.0) + seconds)
 
-        # Cookie Jar
-        self.cj = cookielib.LWPCookieJar()
-        self.br.set_cookiejar(self.cj)
 
-        # Browser options
-        self.br.set_handle_equiv(True)
-        self.br.set_handle_gzip(False)
-        self.br.set_handle_redirect(True)
-        self.br.set_handle_referer(False)
-        self.br.set_handle_robots(False)
-        self.br.set_handled_schemes(['http', 'https'])
+def resetTimings():
+    """
+        Recovering and clearing the seconds spent resolving and connecting
+        by the requests of this thread since the last call.
 
-        # Follows refresh 0 but not hangs on refresh > 0
-        self.br.set_handle_refresh(mechanize._http.HTTPRefreshProcessor(), max_time=1)
+        :return:    A dictionary like {"dns": 0.01, "connect": 0.05}.
+    """
+    timings = {"dns": getattr(_TIMINGS, "dns", 0.0), "connect": getattr(_TIMINGS, "connect", 0.0)}
+    _TIMINGS.dns = 0.0
+    _TIMINGS.connect = 0.0
+    return timings
 
-        # Defining User Agents
-        self.userAgents = []
 
-        # Handling proxies
-        self.proxies = {}
-        self.timeout = 2
-
-        # Want debugging messages?
-        #self.br.set_debug_http(True)
-        #self.br.set_debug_redirects(True)
-        #self.br.set_debug_responses(True)
-
-        # Trying to read the configuration
-        # --------------------------------
-        # If a current.cfg has not been found, creating it by copying from default
-        configPath = configuration.getConfigPath("browser.cfg")
-        configPath = os.path.join(configuration.getConfigPath()["appPath"], "browser.cfg")
-
-        # Checking if the configuration file exists
-        if not os.path.exists(configPath):
+class TimedConnection(object):
+    """
+        Mixin of the urllib3 connections that measures the time spent
+        resolving the host and connecting to it (TLS handshake included).
+    """
+    def _new_conn(self):
+        host = self._dns_host
+        start = time.time()
+        try:
+            addresses = socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+        except socket.error, e:
+            raise NewConnectionError(self, "Failed to establish a new connection: %s" % e)
+        finally:
+            _addTiming("dns", time.time() - start)
+
+        # Connecting to each address resolved until one answers, as urllib3
+        # would do
+        error = None
+        for address in addresses:
+            self._dns_host = address[4][0]
             try:
-                # Copy the data from the default folder
-                defaultConfigPath = os.path.join(configuration.getConfigPath()["appPathDefaults"], "browser.cfg")
+                return super(TimedConnection, self)._new_conn()
+            except NewConnectionError, e:
+                error = e
+            finally:
+                self._dns_host = host
+        raise error or NewConnectionError(self, "Failed to establish a new connection: getaddrinfo returns an empty list")
+
+    def connect(self):
+        start = time.time()
+        dns = getattr(_TIMINGS, "dns", 0.0)
+        try:
+            super(TimedConnection, self).connect()
+        finally:
+            _addTiming("connect", time.time() - start - (getattr(_TIMINGS, "dns", 0.0) - dns))
+
+
+class TimedHTTPConnection(TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """
+        Adapter whose connections record their timings.
+    """
+    POOL_CLASSES = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+    def init_poolmanager(self, *args, **kwargs):
+        HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = self.POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = HTTPAdapter.proxy_manager_for(self, proxy, **proxy_kwargs)
+        # The SOCKS proxies need their own connections
+        if not proxy.lower().startswith("socks"):
+            manager.pool_classes_by_scheme = self.POOL_CLASSES
+        return manager
 
-                with open(defaultConfigPath) as iF:
-                    cont = iF.read()
-                    with open(configPath, "w") as oF:
-                        oF.write(cont)
-            except Exception, e:
-                print "WARNING. No configuration file could be found and the default file was not found either, so configuration will be set as default."
-                print str(e)
-                print
-                # Storing configuration as default
-                self.userAgents = ['Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/55.0.2883.87 Chrome/55.0.2883.87 Safari/537.36']
-                self.proxies = {}
-
-                return None
-
-        # Reading the configuration file
-        config = ConfigParser.ConfigParser()
-        config.read(configPath)
-
-        proxy = {}
-
-        # Iterating through all the sections, which contain the platforms
-        for conf in config.sections():
-            if conf == "Browser":
-                # Iterating through parametgers
-                for (param, value) in config.items(conf):
-                    if param == "user_agent":
-                        if value != '':
-                            self.userAgents.append(value)
-                        else:
-                            self.userAgents = ['Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/55.0.2883.87 Chrome/55.0.2883.87 Safari/537.36']
-                    if param == "timeout":
-                        try:
-                            self.timeout = int(value)
-                        except:
-                            self.timeout = 2
-            else:
-                proxy[conf] = {}
-                # Iterating through parametgers
-                for (param, value) in config.items(conf):
-                    if value != '':
-                        proxy[conf][param] = value
 
-        # Configuring the proxy as it will be used by br.set_proxies
-        for p in proxy.keys():
-            # p ~= ProxyHTTP --> Protocol = p.lower()[5:]
-            #print p, p.lower()[5:], proxy[p]
+def getSession(proxies={}, maxConnections=4):
+    """
+        Recovering the keep-alive session of this process for some proxies.
+
+        Each session keeps a pool of connections per scheme and host, so
+        successive requests to the same platform reuse the handshakes. The
+        sessions are never shared with the children of this process.
+
+        :param proxies: Dictionary with the proxies to be used, e.g.:
+            {"http": "http://localhost:8080"}.
+        :param maxConnections:  Maximum number of connections kept open to
+            the same host.
+
+        :return:    A <requests.Session>.
+    """
+    key = (os.getpid(), tuple(sorted(proxies.items())))
+
+    with _SESSIONS_LOCK:
+        if key not in _SESSIONS:
+            session = requests.Session()
+            adapter = TimedHTTPAdapter(pool_connections=POOLED_HOSTS, pool_maxsize=maxConnections, max_retries=0)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.proxies = dict(proxies)
+            # The cookies are stored per request, as each Browser used to
+            # start with an empty cookie jar
+            session.cookies.set_policy(cookielib.DefaultCookiePolicy(allowed_domains=[]))
+            _SESSIONS[key] = session
+        return _SESSIONS[key]
+
+
+def getConnectionStats():
+    """
+        Recovering the number of connections opened and requests performed
+        by the sessions of this process.
+
+        :return:    A dictionary like {"requests": 100, "new_connections": 4}.
+    """
+    stats = {"requests": 0, "new_connections": 0}
+    with _SESSIONS_LOCK:
+        for key, session in _SESSIONS.items():
+            if key[0] != os.getpid():
+                continue
+            for adapter in set(session.adapters.values()):
+                managers = [adapter.poolmanager] + adapter.proxy_manager.values()
+                for manager in managers:
+                    for poolKey in manager.pools.keys():
+                        pool = manager.pools.get(poolKey)
+                        if pool != None:
+                            stats["requests"] += pool.num_requests
+                            stats["new_connections"] += pool.num_connections
+    return stats
+
+
+def classifyFailure(e):
+    """
+        Classifying the failures of a request.
+
+        :param e:   The exception raised by requests.
+
+        :return:    One of "connect_timeout", "read_timeout", "throttled" and
+            "server_error", which are worth a retry, "not_found" for the
+            platforms that answer 404 or 410 when a profile does not exist, or
+            None for any other failure.
+    """
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return "connect_timeout"
+    if isinstance(e, requests.exceptions.ReadTimeout):
+        return "read_timeout"
+    # The timeouts while streaming the body are wrapped by requests
+    if isinstance(e, requests.exceptions.ConnectionError) and e.args and isinstance(e.args[0], ReadTimeoutError):
+        return "read_timeout"
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        if e.response.status_code == 429:
+            return "throttled"
+        if e.response.status_code in [404, 410]:
+            return "not_found"
+        if 500 <= e.response.status_code < 600:
+            return "server_error"
+    return None
+
+
+def setCacheEnabled(enabled):
+    """
+        Enabling or disabling the response cache in this process and in the
+        workers forked from it, overriding browser.cfg.
+
+        :param enabled: True, False or None to use browser.cfg.
+    """
+    _CACHE_ENABLED["enabled"] = enabled
+
+
+def isCacheEnabled():
+    """
+        Checking whether the response cache is used in this process.
+
+        :return:    The value set with setCacheEnabled or, if None, the cache
+            option in browser.cfg.
+    """
+    if _CACHE_ENABLED["enabled"] != None:
+        return _CACHE_ENABLED["enabled"]
+    return getBrowserSettings().cache
+
+
+def closeSessions():
+    """
+        Closing all the sessions opened by this process.
+    """
+    with _SESSIONS_LOCK:
+        for key in _SESSIONS.keys():
+            if key[0] == os.getpid():
+                _SESSIONS[key].close()
+            del _SESSIONS[key]
+
+
+# The settings of browser.cfg as loaded by this process
+BrowserSettings = collections.namedtuple("BrowserSettings", ["userAgents", "proxies", "timeout", "maxConnections", "maxBytes", "requestsPerSecond", "requestsBurst", "maxRetries", "retryBackoff", "retryBudget", "cache", "cacheMaxBytes", "cacheTTLs"])
+
+DEFAULT_USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Ubuntu Chromium/55.0.2883.87 Chrome/55.0.2883.87 Safari/537.36'
+
+_SETTINGS = {"path": None, "mtime": None, "settings": None}
+_SETTINGS_LOCK = threading.Lock()
+
+
+def loadBrowserSettings():
+    """
+        Reading the browser.cfg file of the user.
+
+        If the file does not exist, it is copied from the default folder.
+
+        :return:    A tuple with the path to the file and the <BrowserSettings>.
+    """
+    userAgents = []
+    proxies = {}
+    timeout = 2
+    maxConnections = 4
+    maxBytes = 0
+    requestsPerSecond = 0
+    requestsBurst = 1
+    maxRetries = 0
+    retryBackoff = 0.5
+    retryBudget = 0.2
+    cache = False
+    cacheMaxBytes = 256 * 1024 * 1024
+    # Seconds during which the responses are valid per mode
+    cacheTTLs = {"default": 3600}
+
+    # Trying to read the configuration
+    # --------------------------------
+    # If a current.cfg has not been found, creating it by copying from default
+    paths = configuration.getConfigPath()
+    configPath = os.path.join(paths["appPath"], "browser.cfg")
+
+    # Checking if the configuration file exists
+    if not os.path.exists(configPath):
+        try:
+            # Copy the data from the default folder
+            defaultConfigPath = os.path.join(paths["appPathDefaults"], "browser.cfg")
+
+            with open(defaultConfigPath) as iF:
+                cont = iF.read()
+                with open(configPath, "w") as oF:
+                    oF.write(cont)
+        except Exception, e:
+            print "WARNING. No configuration file could be found and the default file was not found either, so configuration will be set as default."
+            print str(e)
+            print
+            # Storing configuration as default
+            return configPath, BrowserSettings((DEFAULT_USER_AGENT, ), {}, timeout, maxConnections, maxBytes, requestsPerSecond, requestsBurst, maxRetries, retryBackoff, retryBudget, cache, cacheMaxBytes, cacheTTLs)
+
+    # Reading the configuration file
+    config = ConfigParser.ConfigParser()
+    config.read(configPath)
+
+    proxy = {}
+
+    # Iterating through all the sections, which contain the platforms
+    for conf in config.sections():
+        if conf == "Browser":
+            # Iterating through parametgers
+            for (param, value) in config.items(conf):
+                if param == "user_agent":
+                    if value != '':
+                        userAgents.append(value)
+                    else:
+                        userAgents = [DEFAULT_USER_AGENT]
+                if param == "timeout":
+                    try:
+                        timeout = int(value)
+                    except:
+                        timeout = 2
+                if param == "max_connections_per_host":
+                    try:
+                        maxConnections = max(1, int(value))
+                    except:
+                        maxConnections = 4
+                if param == "max_bytes":
+                    try:
+                        maxBytes = max(0, int(value))
+                    except:
+                        maxBytes = 0
+                if param == "requests_per_second":
+                    try:
+                        requestsPerSecond = max(0, float(value))
+                    except:
+                        requestsPerSecond = 0
+                if param == "requests_burst":
+                    try:
+                        requestsBurst = max(1, int(value))
+                    except:
+                        requestsBurst = 1
+                if param == "max_retries":
+                    try:
+                        maxRetries = max(0, int(value))
+                    except:
+                        maxRetries = 0
+                if param == "retry_backoff":
+                    try:
+                        retryBackoff = max(0, float(value))
+                    except:
+                        retryBackoff = 0.5
+                if param == "retry_budget":
+                    try:
+                        retryBudget = max(0, float(value))
+                    except:
+                        retryBudget = 0.2
+                if param == "cache":
+                    cache = value.strip().lower() in ["true", "yes", "on", "1"]
+                if param == "cache_max_mb":
+                    try:
+                        cacheMaxBytes = max(0, int(value)) * 1024 * 1024
+                    except:
+                        cacheMaxBytes = 256 * 1024 * 1024
+                if param == "cache_ttl" or param.startswith("cache_ttl_"):
+                    try:
+                        cacheTTLs[param[len("cache_ttl_"):] or "default"] = max(0, int(value))
+                    except:
+                        pass
+        else:
+            proxy[conf] = {}
+            # Iterating through parametgers
+            for (param, value) in config.items(conf):
+                if value != '':
+                    proxy[conf][param] = value
+
+    # Configuring the proxy as it will be used by the sessions
+    for p in proxy.keys():
+        # p ~= ProxyHTTP --> Protocol = p.lower()[5:]
+        try:
+            # Adding credentials if they exist
+            proxies[ p.lower()[5:] ] = proxy[p]["username"] + ":" + proxy[p]["password"]  + "@" + proxy[p]["host"] + ":" + proxy[p]["port"]
+        except:
             try:
-                # Adding credentials if they exist
-                self.proxies[ p.lower()[5:] ] = proxy[p]["username"] + ":" + proxy[p]["password"]  + "@" + proxy[p]["host"] + ":" + proxy[p]["port"]
+                proxies[ p.lower()[5:] ] = proxy[p]["host"] + ":" + proxy[p]["port"]
             except:
-                try:
-                    self.proxies[ p.lower()[5:] ] = proxy[p]["host"] + ":" + proxy[p]["port"]
-                except:
-                    # We are not adding this protocol to be proxied
-                    pass
+                # We are not adding this protocol to be proxied
+                pass
+
+    return configPath, BrowserSettings(tuple(userAgents), proxies, timeout, maxConnections, maxBytes, requestsPerSecond, requestsBurst, maxRetries, retryBackoff, retryBudget, cache, cacheMaxBytes, cacheTTLs)
 
-    def recoverURL(self,url):
+
+def getBrowserSettings(forceReload=False):
+    """
+        Recovering the browser settings of this process.
+
+        The browser.cfg file is only parsed the first time and whenever its
+        modification time changes.
+
+        :param forceReload: Whether to parse the file anyway.
+
+        :return:    A <BrowserSettings> object that must not be modified.
+    """
+    with _SETTINGS_LOCK:
+        mtime = None
+        if _SETTINGS["path"] != None:
+            try:
+                mtime = os.stat(_SETTINGS["path"]).st_mtime
+            except OSError:
+                pass
+
+        if forceReload or _SETTINGS["settings"] == None or mtime != _SETTINGS["mtime"]:
+            configPath, settings = loadBrowserSettings()
+            try:
+                mtime = os.stat(configPath).st_mtime
+            except OSError:
+                mtime = None
+            _SETTINGS["path"] = configPath
+            _SETTINGS["mtime"] = mtime
+            _SETTINGS["settings"] = settings
+        return _SETTINGS["settings"]
+
+
+class Browser():
+    """
+        Utility used to code a Browser.
+    """
+    def __init__(self):
+        """
+            Recovering an instance of a new Browser.
+        """
+        settings = getBrowserSettings()
+
+        # Headers to be sent
+        self.headers = {}
+        # Credentials to be used in some URL: {url: (username, password)}
+        self.credentials = {}
+
+        # Defining User Agents
+        self.userAgents = list(settings.userAgents)
+
+        # Handling proxies
+        self.proxies = dict(settings.proxies)
+        self.currentProxies = {}
+        self.timeout = settings.timeout
+        self.maxConnections = settings.maxConnections
+        # Bytes read when the rest of the page will not be processed
+        self.maxBytes = settings.maxBytes
+        # Requests per second allowed to each platform or host by all the workers
+        self.rateLimitKey = None
+        self.requestsPerSecond = settings.requestsPerSecond
+        self.requestsBurst = settings.requestsBurst
+        # Retries of the transient failures
+        self.maxRetries = settings.maxRetries
+        self.retryBackoff = settings.retryBackoff
+        self.retryBudget = settings.retryBudget
+        # Response cache, whose TTL depends on the mode of the query
+        self.cacheEnabled = settings.cache
+        self.cacheMaxBytes = settings.cacheMaxBytes
+        self.cacheTTLs = settings.cacheTTLs
+        self.cacheTTL = settings.cacheTTLs["default"]
+
+    def recoverURL(self, url, stopMarkers=None, maxBytes=None, stats=None):
         """
             Public method to recover a resource.
                 url
                 Platform
 
+            The resource is read in chunks that can stop the download before
+            the end of the body:
+                stopMarkers: strings whose presence is enough for the caller,
+                    like the clues of a profile not found.
+                maxBytes: number of bytes after which the rest is not needed.
+
+            The timeouts, the 429 and the 5xx responses are retried with an
+            exponential backoff within the retry budget of the platform. If
+            a dictionary is provided as stats, it is filled with the number
+            of attempts and retries, the failures retried, the outcome and
+            the HTTP status of the last attempt, even if an exception is
+            finally raised. The seconds spent resolving, connecting, waiting
+            for the first byte and downloading, and the bytes read, are added
+            up across all the attempts.
+
+            If the response cache is enabled, the content is recovered from
+            it while its TTL has not expired and stats["cached"] is set.
+
             Returns:
-                Returns a resource that has to be read, for instance, with html = self.br.read()
+                Returns the html code of the resource, which will be
+                incomplete if the download was stopped.
         """
 
         logger = logging.getLogger("osrframework.utils")
@@ -172,22 +552,282 @@ class Browser():
                 pass
             url = url.replace(".onion", ".onion.cab")
 
-        logger.debug("Retrieving the resource: " + url)
-        # Opening the resource
-        recurso = self.br.open(url, timeout=self.timeout)
+        session = getSession(self.currentProxies, self.maxConnections)
 
-        logger.debug("Reading html code from: " + url)
-        # [TO-DO]
-        #    Additional things may be done here to load javascript.
-        html = recurso.read()
+        if stats == None:
+            stats = {}
+        stats.update({"attempts": 0, "retries": 0, "failures": [], "outcome": None, "status": None, "dns": 0.0, "connect": 0.0, "ttfb": 0.0, "download": 0.0, "bytes": 0, "cached": False})
 
+        cache = None
+        enabled = _CACHE_ENABLED["enabled"]
+        if (self.cacheEnabled if enabled == None else enabled) and self.cacheTTL > 0:
+            cache = http_cache.getResponseCache(self.cacheMaxBytes)
+            credentials = self._getCredentials(url)
+            # The content read depends on the limits of the download
+            cacheKey = cache.getKey(url, self.headers, credentials and credentials[0], [sorted(stopMarkers or []), maxBytes])
+            try:
+                html = cache.get(cacheKey, self.cacheTTL)
+            except (sqlite3.Error, IOError, OSError), e:
+                logger.warning("The response cache could not be read: " + str(e))
+                html = cache = None
+            if html != None:
+                logger.debug("Recovering the resource from the cache: " + url)
+                stats.update({"outcome": "ok", "status": 200, "cached": True})
+                return html
+
+        cacheURL = url
+        # Following the refresh tags of up to 1 second as a browser would do
+        for i in range(5):
+            recurso, html = self._fetch(session, url, stopMarkers, maxBytes, stats)
+
+            newURL = self._getRefreshURL(recurso, html)
+            if newURL == None:
+                break
+            url = newURL
+
+        if cache != None:
+            try:
+                cache.put(cacheKey, cacheURL, html)
+            except (sqlite3.Error, IOError, OSError), e:
+                logger.warning("The response could not be cached: " + str(e))
         return html
 
+    def _fetch(self, session, url, stopMarkers, maxBytes, stats):
+        """
+            Requesting a resource and retrying its transient failures.
+
+            :param session: The <requests.Session> to be used.
+            :param url: The URL of the resource.
+            :param stopMarkers: Strings that stop the download.
+            :param maxBytes:    Number of bytes after which the download stops.
+            :param stats:   Dictionary where the attempts are recorded.
+
+            :return:    A tuple with the <requests.Response> and its content.
+        """
+        logger = logging.getLogger("osrframework.utils")
+
+        key = self.rateLimitKey or requests.compat.urlparse(url).netloc
+        budget = rate_limiter.getRetryBudget()
+        budget.addRequest(key)
+
+        attempt = 0
+        while True:
+            # Waiting for the bucket of this platform or host
+            rate_limiter.getRateLimiter().wait(key, self.requestsPerSecond, self.requestsBurst)
+            stats["attempts"] += 1
+            resetTimings()
+            start = time.time()
+            received = None
+            try:
+                logger.debug("Retrieving the resource: " + url)
+                # Opening the resource
+                recurso = session.get(url, headers=self.headers, auth=self._getCredentials(url), timeout=self.timeout, stream=True)
+                received = time.time()
+                stats["status"] = recurso.status_code
+                try:
+                    recurso.raise_for_status()
+
+                    logger.debug("Reading html code from: " + url)
+                    # [TO-DO]
+                    #    Additional things may be done here to load javascript.
+                    html = self._readContent(recurso, stopMarkers, maxBytes)
+                    stats["bytes"] += len(html)
+                finally:
+                    recurso.close()
+                    self._addTimings(stats, start, received)
+                stats["outcome"] = "ok"
+                return recurso, html
+            except Exception, e:
+                if received == None:
+                    # No response was received
+                    self._addTimings(stats, start, received)
+                failure = classifyFailure(e)
+                stats["outcome"] = failure or "error"
+                if failure not in RETRIED_FAILURES or attempt >= self.maxRetries or not budget.spend(key, self.retryBudget):
+                    raise
+                attempt += 1
+                stats["retries"] += 1
+                stats["failures"].append(failure)
+
+                seconds = self._getBackoff(attempt, e)
+                logger.debug("Retrying " + url + " in " + str(seconds) + " seconds after a " + failure + " failure.")
+                time.sleep(seconds)
+
+    def _addTimings(self, stats, start, received=None):
+        """
+            Adding the timings of an attempt to the stats of a request.
+
+            :param stats:   Dictionary where the attempts are recorded.
+            :param start:   Time when the attempt started.
+            :param received:    Time when the headers of the response were
+                received, if any.
+        """
+        timings = resetTimings()
+        stats["dns"] += timings["dns"]
+        stats["connect"] += timings["connect"]
+        if received != None:
+            stats["ttfb"] += max(0.0, received - start - timings["dns"] - timings["connect"])
+            stats["download"] += time.time() - received
+
+    def _getBackoff(self, attempt, e):
+        """
+            Choosing the seconds to wait before a retry using an exponential
+            backoff with full jitter, so that the workers that failed at the
+            same time do not retry at the same time.
+
+            :param attempt: Number of the retry, starting at 1.
+            :param e:   The exception raised by the last attempt.
+
+            :return:    The seconds to wait.
+        """
+        seconds = random.uniform(0, min(MAX_BACKOFF, self.retryBackoff * 2 ** (attempt - 1)))
+
+        # Honouring the Retry-After header of the platforms that throttle us
+        response = getattr(e, "response", None)
+        if response is not None and response.status_code == 429:
+            try:
+                seconds = max(seconds, min(MAX_BACKOFF, float(response.headers.get("Retry-After", 0))))
+            except ValueError:
+                # Retry-After can also be a date, which is not worth parsing
+                pass
+        return seconds
+
+    def _readContent(self, recurso, stopMarkers=None, maxBytes=None):
+        """
+            Reading the body of a response as it is downloaded.
+
+            The download is stopped as soon as one of the markers appears or
+            when more than maxBytes have been read. The markers are also found
+            when split between two chunks as the last bytes of each chunk are
+            kept to be scanned again with the next one.
+
+            :param recurso: The <requests.Response> opened with stream=True.
+            :param stopMarkers: List of strings that stop the download.
+            :param maxBytes:    Number of bytes after which the download is
+                stopped. None or 0 to read the whole body.
+
+            :return:    The content read.
+        """
+        matcher = markers.getMatcher(stopMarkers or [])
+
+        chunks = []
+        read = 0
+        stopped = False
+        tail = ""
+        for chunk in recurso.iter_content(chunk_size=CHUNK_SIZE):
+            chunks.append(chunk)
+            read += len(chunk)
+
+            window = tail + chunk
+            if (matcher and matcher.search(window) != None) or (maxBytes and read >= maxBytes):
+                stopped = True
+                break
+            if matcher.overlap:
+                tail = window[-matcher.overlap:]
+
+        if stopped:
+            self._discardContent(recurso, read)
+        return "".join(chunks)
+
+    def _discardContent(self, recurso, read):
+        """
+            Discarding the rest of a response whose download was stopped.
+
+            The remaining bytes are read when they are just a few, so the
+            connection can be reused. Otherwise, the connection will be closed
+            with the response.
+
+            :param recurso: The <requests.Response> opened with stream=True.
+            :param read:    Number of bytes already read.
+        """
+        try:
+            pending = int(recurso.headers.get("Content-Length")) - read
+        except (TypeError, ValueError):
+            pending = None
+
+        if pending != None and pending <= DRAIN_BYTES and recurso.headers.get("Content-Encoding") in [None, "identity"]:
+            for chunk in recurso.iter_content(chunk_size=CHUNK_SIZE):
+                pass
+
+    def _getCredentials(self, url):
+        """
+            Recovering the credentials set for a url.
+
+            :param url: The url to be opened.
+
+            :return:    A tuple (username, password) or None.
+        """
+        for base in self.credentials.keys():
+            if url.startswith(base):
+                return self.credentials[base]
+        return None
+
+    def _getRefreshURL(self, recurso, html):
+        """
+            Recovering the url of a refresh header or <meta> tag.
+
+            :param recurso: The <requests.Response> received.
+            :param html:    The html code of the response.
+
+            :return:    The url to be opened or None if it should not be
+                refreshed.
+        """
+        refresh = recurso.headers.get("Refresh")
+        if refresh == None:
+            head = html.split("</head>")[0]
+            found = META_REFRESH_REGEXP.search(head)
+            if found != None:
+                refresh = found.group(1)
+
+        if refresh != None:
+            found = REFRESH_REGEXP.search(refresh)
+            if found != None and int(found.group(1)) <= 1:
+                newURL = requests.compat.urljoin(recurso.url, found.group(2).strip())
+                if newURL != recurso.url:
+                    return newURL
+        return None
+
+    def setRateLimit(self, key, requestsPerSecond=None, burst=None):
+        """
+            Public method to share the rate limit of a platform among all its
+            hosts. The limits not provided are taken from browser.cfg.
+
+            :param key: The name of the bucket, e.g. the name of the platform.
+            :param requestsPerSecond:   Requests per second allowed. 0 for no
+                limit.
+            :param burst:   Number of requests that can be sent at once.
+        """
+        self.rateLimitKey = key
+        if requestsPerSecond != None:
+            self.requestsPerSecond = requestsPerSecond
+        if burst != None:
+            self.requestsBurst = burst
+
+    def setRetries(self, maxRetries=None):
+        """
+            Public method to set the retries of a platform. If not provided,
+            they are taken from browser.cfg.
+
+            :param maxRetries:  Maximum number of retries of each request. 0
+                to disable them.
+        """
+        if maxRetries != None:
+            self.maxRetries = maxRetries
+
+    def setCacheMode(self, mode=None):
+        """
+            Public method to set the TTL of the cached responses to the one of
+            a mode as set in browser.cfg.
+
+            :param mode:    The mode of the query, e.g.: "usufy".
+        """
+        self.cacheTTL = self.cacheTTLs.get(mode, self.cacheTTLs["default"])
+
     def setNewPassword(self, url, username, password):
         """
             Public method to manually set the credentials for a url in the browser.
         """
-        self.br.add_password(url, username, password)
+        self.credentials[url] = (username, password)
 
     def setProxy(self, protocol="http"):
         """
@@ -195,11 +835,10 @@ class Browser():
         """
         # Setting proxy
         try:
-            new = { protocol: self.proxies[protocol]}
-            self.br.set_proxies( new )
+            self.currentProxies = { protocol: "http://" + self.proxies[protocol] }
         except:
             # No proxy defined for that protocol
-            pass
+            self.currentProxies = {}
 
     def setUserAgent(self, uA=None):
         """
@@ -223,8 +862,6 @@ class Browser():
 
         #logger.debug("Setting the user agent:\t" + str(uA))
 
-        self.br.addheaders = [ ('User-agent', uA), ]
-        #self.br.addheaders = [('User-Agent', 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like Gecko) Chrome/23.0.1271.64 Safari/537.11'), ('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'), ('Accept-Charset', 'ISO-8859-1,utf-8;q=0.7,*;q=0.3'), ('Accept-Encoding', 'none'), ('Accept-Language', 'es-es,es;q=0.8'), ('Connection', 'keep-alive')]
-        #self.br.set_handle_refresh(mechanize._http.HTTPRefreshProcessor(), max_time=1)
+        self.headers = { 'User-agent': uA }
 
         return True
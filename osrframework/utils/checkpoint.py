@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import json
+import os
+import threading
+import time
+
+# Extension of the journals written next to the output files
+JOURNAL_EXTENSION = ".journal.jsonl"
+# Bytes read at a time when looking for the end of the last complete line
+CHUNK_SIZE = 65536
+
+
+class Journal():
+    """
+        Append-only record of the checks completed by a run.
+
+        Each line is a JSON object written and flushed as soon as a check of a
+        query in a platform is completed, so a run that is stopped or killed
+        can be resumed without repeating the checks already done. The first
+        line is a header with the tool that wrote the journal. A line left
+        incomplete by a crash is ignored when loading and removed before
+        appending to the journal again.
+    """
+    def __init__(self, path, tool):
+        """
+            Creating a journal.
+
+            :param path:    The path to the journal file.
+            :param tool:    The name of the tool writing the journal, e. g.
+                usufy. The journals written by other tools are refused.
+        """
+        self.path = path
+        self.tool = tool
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+            Reading the checks already completed.
+
+            :return:    A dictionary where the keys are tuples (query,
+                platform) and the values the results stored for them. Only
+                the checks marked as done are returned and, if a check was
+                stored twice, the last one is used.
+        """
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+
+        with open(self.path, "r") as iF:
+            for i, line in enumerate(iF):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line may be incomplete if the run was killed
+                    continue
+                if i == 0 and "tool" in entry:
+                    if entry["tool"] != self.tool:
+                        raise ValueError("The journal " + self.path + " was written by " + str(entry["tool"]) + ", not by " + self.tool + ".")
+                    continue
+                key = (entry["query"], entry["platform"])
+                if entry.get("done", True):
+                    done[key] = entry["result"]
+                else:
+                    done.pop(key, None)
+        return done
+
+    def open(self, resume=False, queries=[]):
+        """
+            Opening the journal to append the checks.
+
+            :param resume:  Whether to keep the checks already stored. If
+                False, the journal is emptied.
+            :param queries: The queries of the run, stored in the header.
+        """
+        if resume and os.path.exists(self.path):
+            self._file = open(self.path, "r+b")
+            # Removing the line left incomplete by a killed run so that the
+            # next entry is not glued to it
+            self._file.truncate(self._getCompleteSize())
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() > 0:
+                return
+            self._file.close()
+        self._file = open(self.path, "w")
+        self._write({"tool": self.tool, "started": time.time(), "queries": list(queries)})
+
+    def _getCompleteSize(self):
+        """
+            Finding the end of the last complete line of the opened file.
+
+            :return:    The number of bytes up to the last line break.
+        """
+        self._file.seek(0, os.SEEK_END)
+        position = self._file.tell()
+        while position > 0:
+            size = min(CHUNK_SIZE, position)
+            position -= size
+            self._file.seek(position)
+            index = self._file.read(size).rfind("\n")
+            if index >= 0:
+                return position + index + 1
+        return 0
+
+    def append(self, query, platform, result, done=True):
+        """
+            Storing a completed check.
+
+            :param query:   The query checked (a nick, an email or a domain).
+            :param platform:    The name of the platform where it was checked.
+            :param result:  A serializable object with the result of the check.
+            :param done:    Whether the check will be skipped when resuming.
+                Failed checks are stored as not done so as to retry them.
+        """
+        self._write({"query": query, "platform": platform, "done": done, "result": result})
+
+    def _write(self, entry):
+        """
+            Writing an entry in a single line and flushing it.
+
+            :param entry:   The dictionary to be written.
+        """
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """
+            Closing the journal file.
+        """
+        if self._file != None:
+            self._file.close()
+            self._file = None
+
+
+def getJournal(tool, resume=None, fileHeader=None, queries=[]):
+    """
+        Opening the journal of a run.
+
+        :param tool:    The name of the tool writing the journal.
+        :param resume:  The path to the journal of a previous run to be
+            resumed. If None, a new journal is started.
+        :param fileHeader:  The header of the output files. The new journals
+            are written next to them.
+        :param queries: The queries of the run, stored in the header.
+
+        :return:    A tuple with the opened <Journal> (None if neither resume
+            nor fileHeader were provided) and the dictionary of the checks
+            already completed as returned by <Journal.load>.
+    """
+    if resume != None:
+        journal = Journal(resume, tool)
+        done = journal.load()
+        journal.open(resume=True, queries=queries)
+    elif fileHeader != None:
+        journal = Journal(fileHeader + JOURNAL_EXTENSION, tool)
+        done = {}
+        journal.open(resume=False, queries=queries)
+    else:
+        journal = None
+        done = {}
+    return journal, done
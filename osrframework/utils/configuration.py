@@ -123,7 +123,7 @@ def returnListOfConfigurationValues(util):
     config = ConfigParser.ConfigParser()
     config.read(configPath)
 
-    LISTS = ["tlds", "domains", "platforms", "extension", "exclude_platforms", "exclude_domains"]
+    LISTS = ["tlds", "domains", "platforms", "extension", "exclude_platforms", "exclude_domains", "stream", "nameservers"]
 
     # Iterating through all the sections, which contain the platforms
     for section in config.sections():
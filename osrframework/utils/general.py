@@ -21,23 +21,26 @@
 ################################################################################
 
 
+import collections
 import colorama
 colorama.init(autoreset=True)
+import csv
 import datetime
 import hashlib
 import json
 import logging
-import networkx as nx
 import os
 import time
 import urllib
 import webbrowser as wb
 
-from osrframework.transforms.lib.maltego import MaltegoEntity, MaltegoTransform
 
 
 LICENSE_URL = "https://www.gnu.org/licenses/agpl-3.0.txt"
 
+# Extension of the sidecar index kept next to the CSV exports
+TABULAR_INDEX_EXTENSION = ".index.json"
+
 
 def exportUsufy(data, ext, fileH):
     """
@@ -73,6 +76,100 @@ def exportUsufy(data, ext, fileH):
         usufyToXlsxExport(data, fileH+"."+ext)
 
 
+def _grabbingNewHeader(h):
+    """
+    Updates the headers to be general.
+
+    Changing the starting @ for a '_' and changing the "i3visio." for
+    "i3visio_". Changed in 0.9.4+.
+
+    Args:
+    -----
+        h: A header to be sanitised.
+
+    Returns:
+    --------
+        string: The modified header.
+    """
+    if h[0] == "@":
+        h = h.replace("@","_")
+    elif "i3visio." in h:
+        h = h.replace("i3visio.", "i3visio_")
+    return h
+
+
+def _generateTabularRows(res, headers, firstId, isTerminal=False, canUnicode=True):
+    """
+    Method that builds the rows of a list of profiles.
+
+    The headers not seen before are appended to the list received, using a set
+    to look them up.
+
+    Args:
+    -----
+        res: List of profiles to export.
+        headers: The list of current headers. It is updated with the new ones.
+        firstId: The value of the _id column of the first row.
+        isTerminal: If isTerminal is activated, only information related to
+            i3visio.alias, i3visio.platform and i3visio.uri will be displayed
+            in the terminal.
+        canUnicode: Variable that stores if the printed output can deal with
+            Unicode characters.
+
+    Returns:
+    --------
+        list: A list of rows with a cell for each header.
+    """
+    # Entities allowed for the output in terminal
+    allowedInTerminal = ["i3visio_alias", "i3visio_uri", "i3visio_platform", "i3visio_email", "i3visio_ipv4", "i3visio_phone", "i3visio_dni", "i3visio_domain", "i3visio_platform_leaked"]
+    knownHeaders = set(headers)
+    # List of profiles found in the order in which they were received
+    values = collections.OrderedDict()
+
+    # We are assuming that we received a list of profiles.
+    for p in res:
+        # Creating the dictionaries
+        values[p["value"]] = {}
+        attributes = p["attributes"]
+        # Processing all the attributes found
+        for a in attributes:
+            # Grabbing the type in the new format
+            h = _grabbingNewHeader(a["type"])
+
+            # Specific table construction for the terminal output
+            if isTerminal and h not in allowedInTerminal:
+                continue
+
+            values[p["value"]][h] = a["value"]
+            # Appending the column if not already included
+            if str(h) not in knownHeaders:
+                knownHeaders.add(str(h))
+                headers.append(str(h))
+
+    rows = []
+    for prof in values.keys():
+        # Creating an empty structure
+        newRow = []
+        for i, col in enumerate(headers):
+            try:
+                if col == "_id":
+                    newRow.append(firstId + len(rows))
+                else:
+                    if canUnicode:
+                        newRow.append(unicode(values[prof][col]))
+                    else:
+                        newRow.append(str(values[prof][col]))
+            except UnicodeEncodeError as e:
+                # Printing that an error was found
+                newRow.append("[WARNING: Unicode Encode]")
+            except:
+                # Printing that this is not applicable value
+                newRow.append("[N/A]")
+        # Appending the newRow to the data structure
+        rows.append(newRow)
+    return rows
+
+
 def _generateTabularData(res, oldTabularData = {}, isTerminal=False, canUnicode=True):
     """
     Method that recovers the values and columns from the current structure
@@ -131,31 +228,8 @@ def _generateTabularData(res, oldTabularData = {}, isTerminal=False, canUnicode=
           ]
         }
     """
-    def _grabbingNewHeader(h):
-        """
-        Updates the headers to be general.
-
-        Changing the starting @ for a '_' and changing the "i3visio." for
-        "i3visio_". Changed in 0.9.4+.
-
-        Args:
-        -----
-            h: A header to be sanitised.
-
-        Returns:
-        --------
-            string: The modified header.
-        """
-        if h[0] == "@":
-            h = h.replace("@","_")
-        elif "i3visio." in h:
-            h = h.replace("i3visio.", "i3visio_")
-        return h
-
     # Entities allowed for the output in terminal
     allowedInTerminal = ["i3visio_alias", "i3visio_uri", "i3visio_platform", "i3visio_email", "i3visio_ipv4", "i3visio_phone", "i3visio_dni", "i3visio_domain", "i3visio_platform_leaked"]
-    # List of profiles found
-    values = {}
     headers = ["_id"]
     try:
         if not isTerminal:
@@ -180,29 +254,13 @@ def _generateTabularData(res, oldTabularData = {}, isTerminal=False, canUnicode=
         # No previous files... Easy...
         headers = ["_id"]
 
-    # We are assuming that we received a list of profiles.
-    for p in res:
-        # Creating the dictionaries
-        values[p["value"]] = {}
-        attributes = p["attributes"]
-        # Processing all the attributes found
-        for a in attributes:
-            # Grabbing the type in the new format
-            h = _grabbingNewHeader(a["type"])
+    try:
+        oldRows = len(oldTabularData["OSRFramework"][1:])
+    except:
+        oldRows = 0
 
-            # Default behaviour for the output methods
-            if not isTerminal:
-                values[p["value"]][h] = a["value"]
-                # Appending the column if not already included
-                if str(h) not in headers:
-                    headers.append(str(h))
-            # Specific table construction for the terminal output
-            else:
-                if h in allowedInTerminal:
-                    values[p["value"]][h] = a["value"]
-                    # Appending the column if not already included
-                    if str(h) not in headers:
-                        headers.append(str(h))
+    # Grabbing the new rows and headers
+    newRows = _generateTabularRows(res, headers, oldRows + 1, isTerminal=isTerminal, canUnicode=canUnicode)
 
     data = {}
     # Note that each row should be a list!
@@ -231,26 +289,7 @@ def _generateTabularData(res, oldTabularData = {}, isTerminal=False, canUnicode=
         pass
 
     # After having all the previous data stored an updated... We will go through the rest:
-    for prof in values.keys():
-        # Creating an empty structure
-        newRow = []
-        for i, col in enumerate(headers):
-            try:
-                if col == "_id":
-                    newRow.append(len(workingSheet))
-                else:
-                    if canUnicode:
-                        newRow.append(unicode(values[prof][col]))
-                    else:
-                        newRow.append(str(values[prof][col]))
-            except UnicodeEncodeError as e:
-                # Printing that an error was found
-                newRow.append("[WARNING: Unicode Encode]")
-            except:
-                # Printing that this is not applicable value
-                newRow.append("[N/A]")
-        # Appending the newRow to the data structure
-        workingSheet.append(newRow)
+    workingSheet += newRows
 
     # Storing the workingSheet onto the data structure to be stored
     data.update({"OSRFramework": workingSheet})
@@ -333,30 +372,105 @@ def usufyToTextExport(d, fPath=None):
         return unicode(sheet)
 
 
+def _getTabularIndex(fPath):
+    """
+    Method that recovers the sidecar index of a CSV export.
+
+    The index stores the headers of the file, the number of rows and the size
+    of the file when it was written. If it is missing or the file has been
+    modified by other means, it is rebuilt reading the file once.
+
+    Args:
+    -----
+        fPath: File path of the CSV file.
+
+    Returns:
+    --------
+        dict: A dictionary with the `headers`, the number of `rows` and the
+            `size` of the file.
+    """
+    if not os.path.exists(fPath) or os.path.getsize(fPath) == 0:
+        return {"headers": ["_id"], "rows": 0, "size": 0}
+
+    try:
+        with open(fPath + TABULAR_INDEX_EXTENSION) as iF:
+            index = json.load(iF)
+        if index["size"] == os.path.getsize(fPath):
+            return index
+    except (IOError, ValueError, KeyError):
+        pass
+
+    # Rebuilding the index from the file
+    headers = None
+    rows = 0
+    with open(fPath, "rb") as iF:
+        for row in csv.reader(iF):
+            if headers == None:
+                headers = [_grabbingNewHeader(h.decode("utf-8")) for h in row if h != ""]
+            elif row != []:
+                rows += 1
+    return {"headers": headers or ["_id"], "rows": rows, "size": os.path.getsize(fPath)}
+
+
+def _writeCsvRows(writer, rows):
+    """
+    Method that writes rows in a CSV file encoded as UTF-8.
+
+    Args:
+    -----
+        writer: A csv writer.
+        rows: A list of rows.
+    """
+    for row in rows:
+        writer.writerow([unicode(cell if cell != None else "").encode("utf-8") for cell in row])
+
+
 def usufyToCsvExport(d, fPath):
     """
     Workaround to export to a CSV file.
 
+    The new profiles are appended to the previous file instead of reading and
+    writing it again. The headers and the number of rows are kept in a
+    sidecar index (<fPath>.index.json). The file is only rewritten when the
+    new profiles bring new columns, filling the previous rows with [N/A].
+
     Args:
     -----
         d: Data to export.
         fPath: File path for the output file.
     """
+    index = _getTabularIndex(fPath)
+    headers = list(index["headers"])
 
-    from pyexcel_io import get_data
-    try:
-        oldData = {"OSRFramework": get_data(fPath) }
-    except:
-        # No information has been recovered
-        oldData = {"OSRFramework":[]}
+    # Generating the new rows and adding the new headers
+    rows = _generateTabularRows(d, headers, index["rows"] + 1)
 
-    # Generating the new tabular data.
-    tabularData = _generateTabularData(d, oldData)
-
-    from pyexcel_io import save_data
-    # Storing the file
-    # NOTE: when working with CSV files it is no longer a dict because it is a one-sheet-format
-    save_data(fPath, tabularData["OSRFramework"])
+    if index["size"] > 0 and headers == index["headers"]:
+        with open(fPath, "ab") as oF:
+            _writeCsvRows(csv.writer(oF), rows)
+    else:
+        tmpPath = fPath + ".tmp"
+        with open(tmpPath, "wb") as oF:
+            writer = csv.writer(oF)
+            _writeCsvRows(writer, [headers])
+            if index["size"] > 0:
+                with open(fPath, "rb") as iF:
+                    reader = csv.reader(iF)
+                    # Skipping the previous headers
+                    next(reader)
+                    for row in reader:
+                        if row == []:
+                            continue
+                        # Filling the new columns
+                        writer.writerow(row + ["[N/A]"] * (len(headers) - len(row)))
+            _writeCsvRows(writer, rows)
+        os.rename(tmpPath, fPath)
+
+    # Storing the new index
+    index = {"headers": headers, "rows": index["rows"] + len(rows), "size": os.path.getsize(fPath)}
+    with open(fPath + TABULAR_INDEX_EXTENSION + ".tmp", "w") as oF:
+        json.dump(index, oF)
+    os.rename(fPath + TABULAR_INDEX_EXTENSION + ".tmp", fPath + TABULAR_INDEX_EXTENSION)
 
 
 def usufyToOdsExport(d, fPath):
@@ -436,7 +550,7 @@ def usufyToXlsxExport(d, fPath):
     save_data(fPath, tabularData)
 
 
-def _generateGraphData(data, oldData=nx.Graph()):
+def _generateGraphData(data, oldData=None):
     """
     Processing the data from i3visio structures to generate nodes and edges
 
@@ -550,6 +664,9 @@ def _generateGraphData(data, oldData=nx.Graph()):
 
         return newAtts, newEntities
 
+    if oldData == None:
+        import networkx as nx
+        oldData = nx.Graph()
     graphData = oldData
     # Iterating through the results
     for elem in data:
@@ -601,6 +718,8 @@ def usufyToGmlExport(d, fPath):
         d: Data to export.
         fPath: File path for the output file.
     """
+    import networkx as nx
+
     # Reading the previous gml file
     try:
         oldData=nx.read_gml(fPath)
@@ -634,6 +753,7 @@ def usufyToPngExport(d, fPath):
     """
     newGraph = _generateGraphData(d)
 
+    import networkx as nx
     import matplotlib.pyplot as plt
     # Writing the png file
     nx.draw(newGraph)
@@ -649,6 +769,8 @@ def usufyToMaltegoExport(profiles, fPath):
         d: Data to export.
         fPath: File path for the output file.
     """
+    from osrframework.transforms.lib.maltego import MaltegoTransform
+
     me = MaltegoTransform()
     # A dictionary with the structure:
 
@@ -722,6 +844,8 @@ def listToMaltego(profiles):
 
     maltegoText = ""
     logger.debug("Going through all the keys in the dictionary...")
+    from osrframework.transforms.lib.maltego import MaltegoTransform
+
     me = MaltegoTransform()
     # A dictionary with the structure:
 
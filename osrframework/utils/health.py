@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import json
+import logging
+import os
+import threading
+import time
+
+import osrframework.utils.configuration as configuration
+
+# Name of the file under appPath where the health of the platforms is stored
+HEALTH_FILE = "health.json"
+
+# Consecutive runs in which all the checks of a platform failed before it is
+#   quarantined
+QUARANTINE_RUNS = 3
+# Seconds that a platform stays in quarantine before being probed again. They
+#   are doubled each time that the probe fails up to MAX_QUARANTINE.
+QUARANTINE_SECONDS = 24 * 3600
+MAX_QUARANTINE = 30 * 24 * 3600
+# Weight of the last run in the averages of errors and seconds
+SMOOTHING = 0.3
+# Platforms with higher averages are launched after the rest
+SLOW_SECONDS = 10.0
+ERROR_RATE = 0.5
+# Share of the platforms of a run that must fail to blame the network of the
+#   user instead of the platforms
+NETWORK_DOWN_RATIO = 0.9
+# Nick used to probe the platforms in quarantine
+PROBE_NICK = "i3visio"
+# Outcomes of the browser that show that a platform answers, including the 404
+#   and 410 of the platforms that use them for the profiles that do not exist
+ANSWERED_OUTCOMES = ["ok", "not_found"]
+
+# Overrides that the user can set on a platform
+INCLUDE = "include"
+EXCLUDE = "exclude"
+AUTO = "auto"
+
+# Store of this process
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+class HealthStore():
+    """
+        Success rate and latency of each platform across runs.
+
+        The store is a json file under appPath like:
+            {
+                "Twitter": {
+                    "runs": 12,
+                    "checks": 40,
+                    "errors": 2,
+                    "failedRuns": 0,
+                    "errorRate": 0.05,
+                    "meanSeconds": 0.8,
+                    "lastRun": 1510000000.0,
+                    "lastSuccess": 1510000000.0,
+                    "quarantines": 0,
+                    "quarantinedSince": None,
+                    "probeAt": None,
+                    "override": None
+                }
+            }
+    """
+    def __init__(self, path=None):
+        """
+            Loading the store.
+
+            :param path:    The path to the json file. By default, health.json
+                under appPath.
+        """
+        if path == None:
+            path = os.path.join(configuration.getConfigPath()["appPath"], HEALTH_FILE)
+        self.path = path
+        self._lock = threading.RLock()
+        self.platforms = self._load()
+
+    def _load(self):
+        """
+            Reading the json file.
+
+            :return:    The dictionary of the platforms, empty if the file does
+                not exist or is corrupted.
+        """
+        try:
+            with open(self.path) as iF:
+                return json.load(iF)
+        except (IOError, ValueError):
+            return {}
+
+    def _save(self):
+        """
+            Writing the json file atomically as several runs may be launched
+            at once.
+        """
+        try:
+            tmpPath = self.path + "." + str(os.getpid())
+            with open(tmpPath, "w") as oF:
+                json.dump(self.platforms, oF, indent=2, sort_keys=True)
+            os.rename(tmpPath, self.path)
+        except (IOError, OSError), e:
+            logging.getLogger("osrframework.utils").warning("The health of the platforms could not be stored: " + str(e))
+
+    def _getEntry(self, platform):
+        """
+            Recovering the entry of a platform, creating it if needed.
+
+            :param platform:    The name of the platform.
+
+            :return:    The dictionary of the platform.
+        """
+        if platform not in self.platforms:
+            self.platforms[platform] = {
+                "runs": 0,
+                "checks": 0,
+                "errors": 0,
+                "failedRuns": 0,
+                "errorRate": 0.0,
+                "meanSeconds": None,
+                "lastRun": None,
+                "lastSuccess": None,
+                "quarantines": 0,
+                "quarantinedSince": None,
+                "probeAt": None,
+                "override": None
+            }
+        return self.platforms[platform]
+
+    def _quarantine(self, entry, now):
+        """
+            Putting a platform in quarantine until its next probe.
+
+            :param entry:   The dictionary of the platform.
+            :param now: The current time.
+        """
+        entry["quarantines"] += 1
+        if entry["quarantinedSince"] == None:
+            entry["quarantinedSince"] = now
+        entry["probeAt"] = now + min(MAX_QUARANTINE, QUARANTINE_SECONDS * 2 ** (entry["quarantines"] - 1))
+
+    def _release(self, entry):
+        """
+            Taking a platform out of quarantine.
+
+            :param entry:   The dictionary of the platform.
+        """
+        entry["failedRuns"] = 0
+        entry["quarantines"] = 0
+        entry["quarantinedSince"] = None
+        entry["probeAt"] = None
+
+    def isQuarantined(self, platform):
+        """
+            Verifying whether a platform has to be skipped.
+
+            :param platform:    The name of the platform.
+
+            :return:    True if the platform is in quarantine and the user has
+                not overridden it, or if the user excluded it.
+        """
+        with self._lock:
+            entry = self.platforms.get(platform)
+            if entry == None:
+                return False
+            if entry["override"] == INCLUDE:
+                return False
+            if entry["override"] == EXCLUDE:
+                return True
+            return entry["quarantinedSince"] != None
+
+    def isDueForProbe(self, platform, now=None):
+        """
+            Verifying whether a platform in quarantine has to be probed.
+
+            :param platform:    The name of the platform.
+            :param now: The current time.
+
+            :return:    True if the quarantine has expired.
+        """
+        now = now or time.time()
+        with self._lock:
+            entry = self.platforms.get(platform)
+            if entry == None or entry["override"] != None or entry["quarantinedSince"] == None:
+                return False
+            return entry["probeAt"] <= now
+
+    def getPriority(self, platform):
+        """
+            Recovering the order in which a platform should be launched.
+
+            :param platform:    The name of the platform.
+
+            :return:    0 for the healthy platforms and 1 for the ones that
+                are slow or fail often.
+        """
+        with self._lock:
+            entry = self.platforms.get(platform)
+            if entry == None or entry["override"] == INCLUDE:
+                return 0
+            if entry["errorRate"] >= ERROR_RATE or (entry["meanSeconds"] or 0) >= SLOW_SECONDS:
+                return 1
+            return 0
+
+    def getQuarantined(self):
+        """
+            Recovering the platforms that are being skipped.
+
+            :return:    A dictionary where the keys are the platforms and the
+                values their entries.
+        """
+        with self._lock:
+            return dict([(p, dict(e)) for p, e in self.platforms.items() if self.isQuarantined(p)])
+
+    def recordRun(self, summary, now=None):
+        """
+            Updating the health of the platforms with the checks of a run.
+
+            :param summary: Dictionary as returned by telemetry.getSummary.
+            :param now: The time of the run.
+        """
+        if not summary:
+            return
+        now = now or time.time()
+
+        failed = [p for p, s in summary.items() if s["error"] == s["checks"]]
+        # Nothing is learnt about the platforms when the network is down
+        networkDown = len(summary) > 1 and len(failed) >= NETWORK_DOWN_RATIO * len(summary)
+
+        with self._lock:
+            # Other runs may have updated the store in the meantime
+            self.platforms.update(self._load())
+            for platform, s in summary.items():
+                entry = self._getEntry(platform)
+                entry["runs"] += 1
+                entry["checks"] += s["checks"]
+                entry["errors"] += s["error"]
+                entry["lastRun"] = now
+                if networkDown:
+                    continue
+
+                entry["errorRate"] = (1 - SMOOTHING) * entry["errorRate"] + SMOOTHING * float(s["error"]) / s["checks"]
+                if entry["meanSeconds"] == None:
+                    entry["meanSeconds"] = s["mean_seconds"]
+                else:
+                    entry["meanSeconds"] = (1 - SMOOTHING) * entry["meanSeconds"] + SMOOTHING * s["mean_seconds"]
+
+                if platform in failed:
+                    entry["failedRuns"] += 1
+                    if entry["failedRuns"] >= QUARANTINE_RUNS and entry["quarantinedSince"] == None:
+                        self._quarantine(entry, now)
+                else:
+                    entry["lastSuccess"] = now
+                    self._release(entry)
+            self._save()
+
+    def recordProbe(self, platform, success, now=None):
+        """
+            Updating the health of a platform in quarantine after probing it.
+
+            :param platform:    The name of the platform.
+            :param success: Whether the platform answered.
+            :param now: The time of the probe.
+        """
+        now = now or time.time()
+        with self._lock:
+            self.platforms.update(self._load())
+            entry = self._getEntry(platform)
+            if success:
+                entry["lastSuccess"] = now
+                self._release(entry)
+            else:
+                self._quarantine(entry, now)
+            self._save()
+
+    def setOverride(self, platform, override):
+        """
+            Overriding the automatic decisions on a platform.
+
+            :param platform:    The name of the platform.
+            :param override:    "include" to never skip it, "exclude" to always
+                skip it or "auto" to let the store decide.
+        """
+        with self._lock:
+            self.platforms.update(self._load())
+            entry = self._getEntry(platform)
+            entry["override"] = None if override == AUTO else override
+            if override == AUTO:
+                self._release(entry)
+            self._save()
+
+
+def getHealthStore():
+    """
+        Recovering the health store of this process.
+
+        :return:    The <HealthStore>.
+    """
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE == None:
+            _STORE = HealthStore()
+        return _STORE
+
+
+def probe(platforms, mode="usufy", store=None):
+    """
+        Probing the platforms in quarantine to release the ones that answer
+        again.
+
+        :param platforms:   List of <Platform> objects due for a probe.
+        :param mode:    The mode used to query them.
+        :param store:   The <HealthStore> to be updated.
+    """
+    logger = logging.getLogger("osrframework.utils")
+    store = store or getHealthStore()
+    for p in platforms:
+        stats = {}
+        try:
+            p.query(query=PROBE_NICK, mode=mode, stats=stats)
+        except Exception, e:
+            logger.debug("The probe of " + str(p) + " failed: " + str(e))
+        if stats.get("outcome") == None:
+            # The platform was not queried through the browser
+            continue
+        logger.debug("Probing " + str(p) + ": " + stats["outcome"])
+        store.recordProbe(str(p), stats["outcome"] in ANSWERED_OUTCOMES)
+
+
+def startProbing(platforms, mode="usufy"):
+    """
+        Probing the platforms in quarantine in the background.
+
+        :param platforms:   List of <Platform> objects due for a probe.
+        :param mode:    The mode used to query them.
+
+        :return:    The <threading.Thread> launched or None if there is nothing
+            to probe.
+    """
+    if not platforms:
+        return None
+    t = threading.Thread(target=probe, args=(platforms, mode))
+    t.daemon = True
+    t.start()
+    return t
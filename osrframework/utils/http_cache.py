@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import argparse
+import collections
+import hashlib
+import json
+import logging
+import multiprocessing.util
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+import osrframework.utils.configuration as configuration
+
+# Folder under appPathData where the responses are cached
+CACHE_FOLDER = "http_cache"
+# Index of the responses cached
+INDEX_FILE = "index.sqlite"
+# Share of the size cap that is kept after evicting the responses
+EVICTION_RATIO = 0.9
+# Lookups whose stats are kept in memory before writing them to the index
+FLUSH_EVERY = 100
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, url TEXT, digest TEXT, size INTEGER, stored REAL, accessed REAL)",
+    "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)",
+    "CREATE INDEX IF NOT EXISTS entries_digest ON entries (digest)",
+    "CREATE TABLE IF NOT EXISTS objects (digest TEXT PRIMARY KEY, disk INTEGER)",
+    "CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER)"
+]
+
+
+class ResponseCache():
+    """
+        Cache of the contents recovered by the browser.
+
+        The contents are stored compressed in files named after their sha1
+        digest, so the pages shared by several URLs are stored once. A sqlite
+        index maps each request to its content and keeps the time when it was
+        stored, to honour the TTLs, and when it was last read, to evict the
+        least recently used ones once the cache exceeds its size cap.
+    """
+    def __init__(self, folder=None, maxBytes=256 * 1024 * 1024):
+        """
+            Opening the cache.
+
+            :param folder:  The folder where the cache is stored. By default,
+                http_cache under appPathData.
+            :param maxBytes:    Maximum number of bytes of the contents stored
+                on disk.
+        """
+        if folder == None:
+            folder = os.path.join(configuration.getConfigPath()["appPathData"], CACHE_FOLDER)
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self._created = False
+        # Stats and access times not written yet as (pid, stats, accessed)
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def _connect(self):
+        """
+            Opening the index. The connections are not shared by the threads
+            nor the processes as sqlite does not allow it.
+
+            :return:    A <sqlite3.Connection>.
+        """
+        if not self._created:
+            if not os.path.exists(os.path.join(self.folder, "objects")):
+                os.makedirs(os.path.join(self.folder, "objects"))
+        conn = sqlite3.connect(os.path.join(self.folder, INDEX_FILE), timeout=30)
+        # Losing the last entries in a crash is cheaper than syncing the disk
+        # in each lookup
+        conn.execute("PRAGMA synchronous = OFF")
+        if not self._created:
+            conn.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+            self._created = True
+        return conn
+
+    def _getObjectPath(self, digest):
+        """
+            Recovering the path of the file of a content.
+
+            :param digest:  The sha1 digest of the content.
+
+            :return:    The path to the file.
+        """
+        return os.path.join(self.folder, "objects", digest[:2], digest[2:])
+
+    @staticmethod
+    def getKey(url, headers={}, user=None, limits=None):
+        """
+            Building the key of a request.
+
+            :param url: The URL requested.
+            :param headers: Dictionary with the headers sent. The User-Agent
+                is ignored as it is chosen randomly for each request.
+            :param user:    The user of the credentials sent, if any.
+            :param limits:  Anything that changes the content read, such as
+                the markers that stop the download.
+
+            :return:    The hexadecimal sha1 digest of the request.
+        """
+        h = [(k.lower(), v) for k, v in headers.items() if k.lower() != "user-agent"]
+        return hashlib.sha1(json.dumps([url, sorted(h), user, limits])).hexdigest()
+
+    def _getPending(self):
+        """
+            Recovering the stats and the access times not written yet by this
+            process. It must be called holding the lock.
+
+            :return:    A tuple (pid, stats, accessed).
+        """
+        if self._pending == None or self._pending[0] != os.getpid():
+            # The ones inherited from the parent process are written by it
+            self._pending = (os.getpid(), collections.Counter(), {})
+            multiprocessing.util.Finalize(None, self.flush, exitpriority=10)
+        return self._pending
+
+    def _writePending(self, conn):
+        """
+            Writing the stats and the access times kept in memory in the
+            transaction of a connection.
+        """
+        with self._lock:
+            pid, stats, accessed = self._getPending()
+            self._pending = (pid, collections.Counter(), {})
+        for name, value in stats.items():
+            self._addStat(conn, name, value)
+        conn.executemany("UPDATE entries SET accessed = ? WHERE key = ? AND accessed < ?", [(t, key, t) for key, t in accessed.items()])
+
+    def flush(self):
+        """
+            Writing the stats and the access times kept in memory. It is called
+            when the process exits.
+        """
+        with self._lock:
+            if self._pending == None or self._pending[0] != os.getpid() or not (self._pending[1] or self._pending[2]):
+                return
+        try:
+            conn = self._connect()
+            try:
+                self._writePending(conn)
+                conn.commit()
+            finally:
+                conn.close()
+        except (sqlite3.Error, IOError, OSError), e:
+            logging.getLogger("osrframework.utils").debug("The stats of the response cache could not be written: " + str(e))
+
+    def _addStat(self, conn, name, value):
+        conn.execute("INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)", (name, ))
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (value, name))
+
+    def _getDiskBytes(self, conn):
+        """
+            Recovering the bytes of the contents stored on disk. They are kept
+            in the stats so as not to add them up in each write.
+        """
+        row = conn.execute("SELECT value FROM stats WHERE name = 'disk'").fetchone()
+        if row != None:
+            return row[0]
+        # Indexes created before the bytes were kept
+        total = conn.execute("SELECT COALESCE(SUM(disk), 0) FROM objects").fetchone()[0]
+        conn.execute("INSERT INTO stats (name, value) VALUES ('disk', ?)", (total, ))
+        return total
+
+    def get(self, key, ttl):
+        """
+            Recovering the content of a request.
+
+            :param key: The key of the request as returned by getKey.
+            :param ttl: Seconds during which the content is valid.
+
+            :return:    The content or None if it is not cached or expired.
+        """
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT digest, size, stored FROM entries WHERE key = ?", (key, )).fetchone()
+            content = None
+            if row != None and row[2] + ttl >= time.time():
+                try:
+                    with open(self._getObjectPath(row[0]), "rb") as iF:
+                        content = zlib.decompress(iF.read())
+                except (IOError, zlib.error):
+                    # The file was evicted by another process or is corrupted
+                    content = None
+
+            if content == None and row != None:
+                self._removeEntry(conn, key, row[0])
+                conn.commit()
+
+            # The lookups are written in batches instead of in each one
+            with self._lock:
+                pid, stats, accessed = self._getPending()
+                if content == None:
+                    stats["misses"] += 1
+                else:
+                    stats["hits"] += 1
+                    stats["bytes_saved"] += row[1]
+                    accessed[key] = time.time()
+                full = stats["hits"] + stats["misses"] >= FLUSH_EVERY
+            if full:
+                self._writePending(conn)
+                conn.commit()
+            return content
+        finally:
+            conn.close()
+
+    def put(self, key, url, content):
+        """
+            Storing the content of a request.
+
+            :param key: The key of the request as returned by getKey.
+            :param url: The URL requested.
+            :param content: The content recovered.
+        """
+        digest = hashlib.sha1(content).hexdigest()
+        path = self._getObjectPath(digest)
+
+        conn = self._connect()
+        try:
+            self._getDiskBytes(conn)
+            if conn.execute("SELECT digest FROM objects WHERE digest = ?", (digest, )).fetchone() == None:
+                if not os.path.exists(os.path.dirname(path)):
+                    try:
+                        os.makedirs(os.path.dirname(path))
+                    except OSError:
+                        # Created by another process in the meantime
+                        pass
+                data = zlib.compress(content)
+                # Several threads may be storing the same content at once
+                fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path))
+                with os.fdopen(fd, "wb") as oF:
+                    oF.write(data)
+                os.rename(tmpPath, path)
+                # Another process may have stored it in the meantime
+                if conn.execute("INSERT OR IGNORE INTO objects (digest, disk) VALUES (?, ?)", (digest, len(data))).rowcount == 1:
+                    self._addStat(conn, "disk", len(data))
+
+            old = conn.execute("SELECT digest FROM entries WHERE key = ?", (key, )).fetchone()
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO entries (key, url, digest, size, stored, accessed) VALUES (?, ?, ?, ?, ?, ?)", (key, url, digest, len(content), now, now))
+            if old != None and old[0] != digest:
+                self._removeObject(conn, old[0])
+            # The recent lookups decide which entries are evicted
+            self._writePending(conn)
+            self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _removeEntry(self, conn, key, digest):
+        conn.execute("DELETE FROM entries WHERE key = ?", (key, ))
+        self._removeObject(conn, digest)
+
+    def _removeObject(self, conn, digest):
+        """
+            Removing a content if no request points to it any longer.
+        """
+        if conn.execute("SELECT key FROM entries WHERE digest = ? LIMIT 1", (digest, )).fetchone() != None:
+            return
+        self._getDiskBytes(conn)
+        row = conn.execute("SELECT disk FROM objects WHERE digest = ?", (digest, )).fetchone()
+        if row == None:
+            return
+        conn.execute("DELETE FROM objects WHERE digest = ?", (digest, ))
+        self._addStat(conn, "disk", -row[0])
+        try:
+            os.remove(self._getObjectPath(digest))
+        except OSError:
+            pass
+
+    def _evict(self, conn):
+        """
+            Removing the least recently used contents until the cache is
+            below EVICTION_RATIO of its size cap.
+        """
+        total = self._getDiskBytes(conn)
+        if total <= self.maxBytes:
+            return
+
+        # A content is freed once all the requests pointing to it are removed
+        references = dict(conn.execute("SELECT digest, COUNT(*) FROM entries GROUP BY digest").fetchall())
+        keys = []
+        freed = []
+        for key, digest, disk in conn.execute("SELECT entries.key, entries.digest, objects.disk FROM entries JOIN objects ON objects.digest = entries.digest ORDER BY entries.accessed"):
+            if total <= self.maxBytes * EVICTION_RATIO:
+                break
+            keys.append((key, ))
+            references[digest] -= 1
+            if references[digest] == 0:
+                freed.append((digest, ))
+                total -= disk
+
+        conn.executemany("DELETE FROM entries WHERE key = ?", keys)
+        conn.executemany("DELETE FROM objects WHERE digest = ?", freed)
+        self._addStat(conn, "disk", total - self._getDiskBytes(conn))
+        for digest, in freed:
+            try:
+                os.remove(self._getObjectPath(digest))
+            except OSError:
+                pass
+
+    def getStats(self):
+        """
+            Recovering the statistics of the cache.
+
+            :return:    A dictionary with the entries and contents stored, the
+                bytes used on disk, the hits, the misses, the hit rate and the
+                bytes that were not downloaded thanks to the cache.
+        """
+        self.flush()
+        conn = self._connect()
+        try:
+            stats = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+            res = {
+                "entries": conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+                "objects": conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0],
+                "bytes_on_disk": conn.execute("SELECT COALESCE(SUM(disk), 0) FROM objects").fetchone()[0],
+                "hits": stats.get("hits", 0),
+                "misses": stats.get("misses", 0),
+                "bytes_saved": stats.get("bytes_saved", 0)
+            }
+        finally:
+            conn.close()
+        lookups = res["hits"] + res["misses"]
+        res["hit_rate"] = float(res["hits"]) / lookups if lookups else 0.0
+        return res
+
+    def clear(self):
+        """
+            Removing all the contents and statistics of the cache.
+        """
+        with self._lock:
+            self._getPending()
+            self._pending = (os.getpid(), collections.Counter(), {})
+        conn = self._connect()
+        try:
+            for digest, in conn.execute("SELECT digest FROM objects").fetchall():
+                try:
+                    os.remove(self._getObjectPath(digest))
+                except OSError:
+                    pass
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM objects")
+            conn.execute("DELETE FROM stats")
+            conn.commit()
+        finally:
+            conn.close()
+
+
+# Cache of this process
+_CACHE = {"cache": None}
+
+
+def getResponseCache(maxBytes=256 * 1024 * 1024, folder=None):
+    """
+        Recovering the response cache of this process.
+
+        :param maxBytes:    Maximum number of bytes stored on disk.
+        :param folder:  The folder of the cache. If provided, the cache of
+            this process is moved to it.
+
+        :return:    The <ResponseCache>.
+    """
+    if _CACHE["cache"] == None or (folder != None and folder != _CACHE["cache"].folder):
+        if _CACHE["cache"] != None:
+            _CACHE["cache"].flush()
+        _CACHE["cache"] = ResponseCache(folder=folder, maxBytes=maxBytes)
+    _CACHE["cache"].maxBytes = maxBytes
+    return _CACHE["cache"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='http_cache.py - Managing the responses cached by OSRFramework.', prog='http_cache.py')
+    parser.add_argument('action', choices=['clear', 'stats'], help='the action to be performed: stats (show the hit rate and the bytes saved) or clear (remove all the responses cached).')
+    args = parser.parse_args()
+
+    cache = getResponseCache()
+    if args.action == "stats":
+        print json.dumps(cache.getStats(), indent=2, sort_keys=True)
+    elif args.action == "clear":
+        cache.clear()
+        print "The cache stored in " + cache.folder + " has been cleared."
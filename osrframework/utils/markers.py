@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import threading
+
+# Matchers already compiled by this process keyed by the tuple of markers
+_MATCHERS = {}
+_MATCHERS_LOCK = threading.Lock()
+
+
+class MarkerMatcher():
+    """
+        Utility that checks whether any of a set of markers appears in a text.
+
+        The markers are deduplicated and those containing a shorter marker are
+        dropped, as the shorter one will always be found first. Each remaining
+        marker is looked for with the native substring search, which is still
+        faster than a single pass of a Python automaton or of a compiled
+        alternation for the few markers defined by each wrapper.
+    """
+    def __init__(self, markers=[]):
+        """
+            Compiling the markers.
+
+            :param markers: List of strings to be found.
+        """
+        self.source = tuple(markers)
+
+        unique = []
+        for m in self.source:
+            if m not in unique:
+                unique.append(m)
+
+        # Shorter markers first so that they are found as soon as possible
+        self.markers = tuple([m for m in sorted(unique, key=len) if not [o for o in unique if o != m and o in m]])
+
+        # Bytes to keep between chunks so that no marker is split
+        self.overlap = max([len(m) for m in self.markers] + [1]) - 1
+
+    def search(self, data):
+        """
+            Finding the first marker in a text.
+
+            :param data:    The text to be scanned.
+
+            :return:    The marker found or None.
+        """
+        for m in self.markers:
+            if m in data:
+                return m
+        return None
+
+    def __len__(self):
+        return len(self.markers)
+
+
+def getMatcher(markers):
+    """
+        Recovering the matcher compiled for a list of markers.
+
+        :param markers: List of strings to be found.
+
+        :return:    A <MarkerMatcher>.
+    """
+    key = tuple(markers)
+    matcher = _MATCHERS.get(key)
+    if matcher == None:
+        with _MATCHERS_LOCK:
+            matcher = _MATCHERS.get(key)
+            if matcher == None:
+                matcher = MarkerMatcher(key)
+                _MATCHERS[key] = matcher
+    return matcher
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import os
+import sqlite3
+import time
+
+import osrframework.utils.configuration as configuration
+
+# File under appPathData where the results are stored
+NEGATIVE_CACHE_FILE = "negative_cache.sqlite"
+# Maximum number of parameters of each sqlite query
+BATCH_SIZE = 500
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS results (platform TEXT, mode TEXT, query TEXT, outcome TEXT, checked REAL, PRIMARY KEY (platform, mode, query)) WITHOUT ROWID",
+    # The queries are looked up in all the platforms at once
+    "CREATE INDEX IF NOT EXISTS results_by_query ON results (mode, query)"
+]
+
+# Outcome stored for the queries that were not found
+NOT_FOUND = "not_found"
+
+
+class NegativeCache():
+    """
+        Store of the queries that were not found in each platform.
+
+        Most of the checks of usufy are not found and the answer does not
+        change for days, so the pairs recently checked can be skipped without
+        sending any request. The store is a sqlite table indexed by platform,
+        mode and query, and by mode and query.
+    """
+    def __init__(self, path=None):
+        """
+            Opening the store.
+
+            :param path:    The path to the sqlite file. By default,
+                negative_cache.sqlite under appPathData.
+        """
+        if path == None:
+            path = os.path.join(configuration.getConfigPath()["appPathData"], NEGATIVE_CACHE_FILE)
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """
+            Opening the sqlite file.
+
+            :return:    A <sqlite3.Connection>.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous = OFF")
+        return conn
+
+    def getNotFound(self, platforms, queries, mode="usufy", ttl=3 * 24 * 3600, now=None):
+        """
+            Recovering the pairs that were not found during the TTL.
+
+            :param platforms:   List of names of the platforms.
+            :param queries: List of queries.
+            :param mode:    The mode of the queries.
+            :param ttl: Seconds during which a not found result is valid.
+            :param now: The current time.
+
+            :return:    A set of tuples (platform, query).
+        """
+        now = now or time.time()
+        platforms = set(platforms)
+        queries = list(set(queries))
+
+        found = set()
+        if ttl <= 0 or not platforms or not queries:
+            return found
+
+        conn = self._connect()
+        try:
+            for i in range(0, len(queries), BATCH_SIZE):
+                batch = queries[i:i + BATCH_SIZE]
+                sql = "SELECT platform, query FROM results WHERE mode = ? AND outcome = ? AND checked >= ? AND query IN (" + ", ".join(["?"] * len(batch)) + ")"
+                for platform, query in conn.execute(sql, [mode, NOT_FOUND, now - ttl] + batch):
+                    if platform in platforms:
+                        found.add((platform, query))
+        finally:
+            conn.close()
+        return found
+
+    def record(self, results, mode="usufy", now=None):
+        """
+            Storing the outcome of some checks.
+
+            The not found pairs are stored and the ones found are removed.
+
+            :param results: List of tuples (platform, query, found).
+            :param mode:    The mode of the queries.
+            :param now: The time of the checks.
+        """
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            conn.executemany("INSERT OR REPLACE INTO results (platform, mode, query, outcome, checked) VALUES (?, ?, ?, ?, ?)", [(p, mode, q, NOT_FOUND, now) for p, q, found in results if not found])
+            conn.executemany("DELETE FROM results WHERE platform = ? AND mode = ? AND query = ?", [(p, mode, q) for p, q, found in results if found])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge(self, ttl, now=None):
+        """
+            Removing the results older than a TTL.
+
+            :param ttl: Seconds during which a result is kept.
+            :param now: The current time.
+
+            :return:    The number of results removed.
+        """
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            removed = conn.execute("DELETE FROM results WHERE checked < ?", (now - ttl, )).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return removed
+
+
+# Store of this process
+_CACHE = {"cache": None}
+
+
+def getNegativeCache(path=None):
+    """
+        Recovering the negative cache of this process.
+
+        :param path:    The path to the sqlite file. If provided, the cache of
+            this process is moved to it.
+
+        :return:    The <NegativeCache>.
+    """
+    if _CACHE["cache"] == None or (path != None and path != _CACHE["cache"].path):
+        _CACHE["cache"] = NegativeCache(path)
+    return _CACHE["cache"]
@@ -22,15 +22,25 @@
 import os
 import sys
 
+import json
 import pkgutil
 import importlib
 import inspect
+import threading
 import osrframework.wrappers
 
 import osrframework.utils.credentials as credentials
 import osrframework.utils.configuration as configuration
+import osrframework.utils.health as health
 import osrframework
 
+# Name of the file under appPathData where the manifest is cached
+MANIFEST_FILE = "wrappers.json"
+
+# Manifest of the wrappers loaded by this process
+_REGISTRY = {"key": None, "manifest": None}
+_REGISTRY_LOCK = threading.Lock()
+
 
 def getAllPlatformNames(mode):
     """Method that defines the whole list of available parameters.
@@ -43,14 +53,13 @@ def getAllPlatformNames(mode):
     # Recovering all the possible platforms installed
     platOptions = []
     if mode in ["phonefy", "usufy", "searchfy"]:
-        allPlatforms = getAllPlatformObjects(mode=mode)
+        allPlatforms = _getManifestEntries(mode=mode)
         # Defining the platOptions
         for p in allPlatforms:
-            try:
-                # E. g.: to use wikipedia instead of wikipedia_ca and so on
-                parameter = p.parameterName
-            except:
-                parameter = p.platformName.lower()
+            # E. g.: to use wikipedia instead of wikipedia_ca and so on
+            parameter = p["parameterName"]
+            if parameter == None:
+                parameter = p["platformName"].lower()
 
             if parameter not in platOptions:
                 platOptions.append(parameter)
@@ -64,55 +73,81 @@ def getAllPlatformNames(mode):
     return platOptions
 
 
-def getPlatformsByName(platformNames=['all'], mode=None, tags=[], excludePlatformNames=[]):
+def getPlatformsByName(platformNames=['all'], mode=None, tags=[], excludePlatformNames=[], useHealth=True):
     """Method that recovers the names of the <Platforms> in a given list.
 
         :param platformNames:    List of strings containing the possible platforms.
         :param mode:    The mode of the search. The following can be chosen: ["phonefy", "usufy", "searchfy"].
         :param tags:    Just in case the method to select the candidates is a series of tags.
         :param excludePlatformNames:    List of strings to be excluded from the search.
+        :param useHealth:   Whether to skip the platforms in quarantine and to
+            place the slow or failing ones at the end, as stored in the
+            <HealthStore>. The platforms requested by name are never skipped.
         :return:    Array of <Platforms> classes.
     """
 
-    allPlatformsList = getAllPlatformObjects(mode)
+    allPlatformsList = _getManifestEntries(mode)
 
     platformList = []
+    # Platforms requested by name, which are never skipped
+    namedList = []
 
     # Tags has priority over platform
     if "all" in platformNames and len(tags) == 0:
         # Last condition: checking if "all" has been provided
         for plat in allPlatformsList:
-            if str(plat.platformName).lower() not in excludePlatformNames:
+            if plat["platformName"].lower() not in excludePlatformNames:
                 platformList.append(plat)
-        return platformList
+        return _getPlatformObjects(_sortByHealth(platformList, namedList) if useHealth else platformList)
     else:
         # going through the regexpList
         for name in platformNames:
             if name not in excludePlatformNames:
                 for plat in allPlatformsList:
                     # Verifying if the parameter was provided
-                    if name == str(plat.platformName).lower():
+                    if name == plat["platformName"].lower():
                         platformList.append(plat)
+                        namedList.append(plat)
                         break
 
                     # We need to perform additional checks to verify the Wikipedia platforms, which are called with a single parameter
-                    try:
-                        if name == str(plat.parameterName).lower():
-                            platformList.append(plat)
-                            break
-                    except:
-                        pass
+                    if plat["parameterName"] != None and name == plat["parameterName"].lower():
+                        platformList.append(plat)
+                        namedList.append(plat)
+                        break
 
                     # Verifying if any of the platform tags match the original tag
-                    for t in plat.tags:
+                    for t in plat["tags"]:
                         if t in tags:
                             platformList.append(plat)
                             break
     # If the platformList is empty, we will return all
     if platformList == []:
-        return allPlatformsList
-    else:
-        return platformList
+        platformList = allPlatformsList
+    return _getPlatformObjects(_sortByHealth(platformList, namedList) if useHealth else platformList)
+
+
+def getPlatformsToProbe(mode=None):
+    """Method that recovers the <Platforms> in quarantine that have to be probed again.
+
+        :param mode:    The mode of the search. The following can be chosen: ["phonefy", "usufy", "searchfy"].
+        :return:    Array of <Platforms> classes.
+    """
+    store = health.getHealthStore()
+    return _getPlatformObjects([plat for plat in _getManifestEntries(mode) if store.isDueForProbe(plat["platformName"])])
+
+
+def _sortByHealth(entries, namedEntries=[]):
+    """Method that skips the platforms in quarantine and places the slow or failing ones at the end.
+
+        :param entries: List of entries of the manifest.
+        :param namedEntries:    Entries requested by name, which are never skipped.
+        :return:    Returns a list [] of the entries of the manifest.
+    """
+    store = health.getHealthStore()
+    selected = [plat for plat in entries if plat in namedEntries or not store.isQuarantined(plat["platformName"])]
+    # The sort is stable, so the order is kept within each group
+    return sorted(selected, key=lambda plat: store.getPriority(plat["platformName"]))
 
 def getAllPlatformNamesByTag (mode = None):
     """Returns the platforms in the framework grouped by tags.
@@ -120,16 +155,16 @@ def getAllPlatformNamesByTag (mode = None):
     """
     tags = {}
 
-    allPlatformsList = getAllPlatformObjects(mode)
+    allPlatformsList = _getManifestEntries(mode)
 
     # Iterating the list of platforms to collect the tags
     for plat in allPlatformsList:
         # Grabbing the tags and providing them
-        for t in plat.tags:
+        for t in plat["tags"]:
             if t not in tags.keys():
-                tags[t] = [str(plat)]
+                tags[t] = [plat["name"]]
             else:
-                tags[t].append(str(plat))
+                tags[t].append(plat["name"])
 
     return tags
 
@@ -141,91 +176,164 @@ def getAllPlatformObjects(mode = None):
 
         :return:    Returns a list [] of <Platform> objects.
     """
+    return _getPlatformObjects(_getManifestEntries(mode))
 
-    listAll = []
 
-    ############################################################################
-    ############################################################################
+def getPlatformManifest(forceReload=False):
+    """Method that recovers the manifest of all the wrappers available.
 
-    # --------------------------------------------------------------------------
-    # Dinamically collecting all the "official" modules
-    # --------------------------------------------------------------------------
+        The manifest is built by importing all the wrappers only when any of
+        the files of the official wrappers or the user plugins has changed.
+        Otherwise, it is loaded from the copy stored under appPathData.
 
-    # A list that will contain all of the module names
-    all_modules = []
+        :param forceReload: Whether to import all the wrappers anyway.
 
-    # Grabbing all the module names
-    for _, name, _ in pkgutil.iter_modules(osrframework.wrappers.__path__):
-        all_modules.append("osrframework.wrappers." + name)
+        :return:    Returns a list [] of dictionaries like:
+            {"module": "osrframework.wrappers.twitter", "user": False, "name": "twitter", "platformName": "Twitter", "parameterName": None, "tags": ["social"], "modes": {"usufy": True}}
+    """
+    with _REGISTRY_LOCK:
+        officialModules, userModules = _getWrapperModules()
 
-    # Iterating through all the module names to grab them
-    for moduleName in all_modules:
-        # Importing the module
-        my_module = importlib.import_module(moduleName)
+        # The manifest is valid while the files of the wrappers do not change
+        files = {}
+        for moduleName, path in officialModules + userModules:
+            try:
+                files[path] = os.path.getmtime(path)
+            except OSError:
+                files[path] = None
+        key = {"version": osrframework.__version__, "files": files}
 
-        # Getting all the classNames.
-        classNames = [m[0] for m in inspect.getmembers(my_module, inspect.isclass) if m[1].__module__ == moduleName]
+        if not forceReload and _REGISTRY["key"] == key:
+            return _REGISTRY["manifest"]
 
-        # Dinamically grabbing the first class of the module. IT SHOULD BE ALONE!
-        MyClass = getattr(my_module, classNames[0])
+        manifestPath = os.path.join(configuration.getConfigPath()["appPathData"], MANIFEST_FILE)
 
-        # Instantiating the object
-        newInstance = MyClass()
+        manifest = None
+        if not forceReload:
+            try:
+                with open(manifestPath) as iF:
+                    stored = json.load(iF)
+                if stored["key"] == key:
+                    manifest = stored["manifest"]
+            except:
+                # The manifest has not been stored yet or it is corrupted
+                pass
 
-        # Adding to the list!
-        listAll.append(newInstance)
+        if manifest == None:
+            manifest = _buildManifest(officialModules, userModules)
+            try:
+                # Writing it atomically as several processes may be started at once
+                tmpPath = manifestPath + "." + str(os.getpid())
+                with open(tmpPath, "w") as oF:
+                    json.dump({"key": key, "manifest": manifest}, oF)
+                os.rename(tmpPath, manifestPath)
+            except (IOError, OSError):
+                pass
 
-    # --------------------------------------------------------------------------
-    # Loading user-defined wrappers under [OSRFrameworkHOME]/plugins/wrappers/
-    # --------------------------------------------------------------------------
+        _REGISTRY["key"] = key
+        _REGISTRY["manifest"] = manifest
+        return manifest
 
-    # Creating the application paths
-    paths = configuration.getConfigPath()
 
-    newPath = os.path.abspath(paths["appPathWrappers"])
+def _getManifestEntries(mode=None):
+    """Method that recovers the entries of the manifest valid for a mode.
 
-    # Inserting in the System Path
-    if not newPath in sys.path:
-        sys.path.append(newPath)
+        :param mode:    The mode of the search. The following can be chosen: ["phonefy", "usufy", "searchfy"].
+
+        :return:    Returns a list [] of the entries of the manifest.
+    """
+    manifest = getPlatformManifest()
+    if mode == None:
+        return manifest
+    else:
+        # We are returning only those platforms which are required by the mode.
+        return [p for p in manifest if p["modes"].get(mode)]
 
-    userImportedModules = {}
 
-    for module in os.listdir(newPath):
+def _getWrapperModules():
+    """Method that lists the modules of the official wrappers and the user plugins.
+
+        :return:    Returns a tuple of two lists [] of (moduleName, path), one for the official wrappers and one for the wrappers under [OSRFrameworkHOME]/plugins/wrappers/.
+    """
+    officialModules = []
+    for path in osrframework.wrappers.__path__:
+        # Grabbing all the module names
+        for _, name, _ in pkgutil.iter_modules([path]):
+            modulePath = os.path.join(path, name + ".py")
+            if not os.path.exists(modulePath):
+                modulePath += "c"
+            officialModules.append(("osrframework.wrappers." + name, modulePath))
+
+    userModules = []
+    userPath = os.path.abspath(configuration.getConfigPath()["appPathWrappers"])
+    for module in sorted(os.listdir(userPath)):
         if module[-3:] == '.py':
-            current = module.replace('.py', '')
-            userImportedModules[current] = __import__(current)
+            userModules.append((module.replace('.py', ''), os.path.join(userPath, module)))
+    return officialModules, userModules
 
-    del newPath
 
-    userClasses = []
+def _importWrapperClass(moduleName, user=False):
+    """Method that imports the class of a wrapper.
+
+        :param moduleName:  The name of the module.
+        :param user:    Whether it is a wrapper under [OSRFrameworkHOME]/plugins/wrappers/.
+
+        :return:    The class defined in the module.
+    """
+    if user:
+        newPath = os.path.abspath(configuration.getConfigPath()["appPathWrappers"])
+
+        # Inserting in the System Path
+        if not newPath in sys.path:
+            sys.path.append(newPath)
+        my_module = __import__(moduleName)
+    else:
+        # Importing the module
+        my_module = importlib.import_module(moduleName)
+
+    # Getting all the classNames.
+    classNames = [m[0] for m in inspect.getmembers(my_module, inspect.isclass) if m[1].__module__ == moduleName]
 
-    # Iterating through all the files
-    for userModule in userImportedModules.keys():
+    # Dinamically grabbing the first class of the module. IT SHOULD BE ALONE!
+    return getattr(my_module, classNames[0])
 
-        my_module = userImportedModules[userModule]
-        # Getting all the classNames.
-        classNames = [m[0] for m in inspect.getmembers(my_module, inspect.isclass) if m[1].__module__ == userModule]
 
-        # Dinamically grabbing the first class of the module. IT SHOULD BE ALONE!
-        MyClass = getattr(my_module, classNames[0])
+def _buildManifest(officialModules, userModules):
+    """Method that imports all the wrappers to describe them.
 
-        # Instantiating the object
-        newInstance = MyClass()
+        :param officialModules: List of (moduleName, path) of the official wrappers.
+        :param userModules: List of (moduleName, path) of the user plugins.
 
-        # Adding to the list!
-        userClasses.append(newInstance)
+        :return:    Returns a list [] of the entries of the manifest.
+    """
+    listAll = []
+    for modules, user in [(officialModules, False), (userModules, True)]:
+        for moduleName, path in modules:
+            # Instantiating the object
+            newInstance = _importWrapperClass(moduleName, user=user)()
+
+            listAll.append({
+                "module": moduleName,
+                "user": user,
+                "name": str(newInstance),
+                "platformName": newInstance.platformName,
+                "parameterName": getattr(newInstance, "parameterName", None),
+                "tags": list(newInstance.tags),
+                "modes": dict(newInstance.isValidMode)
+            })
 
     # --------------------------------------------------------------------------
     # Overwriting original modules with the user plugins
     # --------------------------------------------------------------------------
+    official = [p for p in listAll if not p["user"]]
     listToAdd = []
-    for userClass in userClasses:
+    for userClass in [p for p in listAll if p["user"]]:
         overwritten = False
-        for i, officialClass in enumerate(listAll):
+        for i, officialClass in enumerate(official):
             # Checking if the name is the same
-            if str(userClass) == str(officialClass):
+            if userClass["name"] == officialClass["name"]:
                 # Replacing the official module if a user module exists for it
-                listAll[i] = userClass
+                official[i] = userClass
                 # We stop iterating this loop
                 overwritten = True
                 break
@@ -233,10 +341,22 @@ def getAllPlatformObjects(mode = None):
             # Appending the new class
             listToAdd.append(userClass)
 
-    # Merging listAll and listToAdd
-    listAll = listAll + listToAdd
-    ############################################################################
-    ############################################################################
+    # Merging both lists
+    return official + listToAdd
+
+
+def _getPlatformObjects(entries):
+    """Method that instantiates the <Platform> classes of some entries of the manifest.
+
+        Only the modules of these wrappers are imported.
+
+        :param entries: List of entries of the manifest.
+
+        :return:    Returns a list [] of <Platform> objects.
+    """
+    listAll = []
+    for p in entries:
+        listAll.append(_importWrapperClass(str(p["module"]), user=p["user"])())
 
     creds = credentials.getCredentials()
 
@@ -244,13 +364,11 @@ def getAllPlatformObjects(mode = None):
         # Verify if there are credentials to be loaded
         if p.platformName.lower() in creds.keys():
             p.setCredentials(creds[p.platformName.lower()])
-
-    if mode == None:
-        return listAll
-    else:
-        # We are returning only those platforms which are required by the mode.
-        selected = []
-        for p in listAll:
-            if p.isValidMode[mode]:
-                selected.append(p)
-        return selected
+        # Compiling the not found clues only once
+        for m in p.notFoundText.keys():
+            p.getNotFoundMatcher(m)
+        # Compiling the regular expressions of the fields only once
+        for m in p.fieldsRegExp.keys():
+            p.getExtractionPlan(m)
+
+    return listAll
@@ -31,16 +31,44 @@ import urllib2
 import osrframework.utils.browser as browser
 from osrframework.utils.credentials import Credential
 import osrframework.utils.general as general
+import osrframework.utils.markers as markers
 import osrframework.entify as entify
 import osrframework.utils.config_api_keys as api_keys
 
 # logging imports
 import logging
 
+
+def _decodeEntities(obj):
+    '''
+        Method that converts the entities found to the types that they had when
+        getInfo returned them as a json text: strings in unicode and tuples as
+        lists.
+
+        :param obj: The list, dictionary or value to be converted.
+
+        :return:    The converted object.
+    '''
+    if isinstance(obj, str):
+        return obj.decode("utf-8")
+    elif isinstance(obj, (list, tuple)):
+        return [_decodeEntities(o) for o in obj]
+    elif isinstance(obj, dict):
+        return dict([(_decodeEntities(k), _decodeEntities(v)) for k, v in obj.items()])
+    return obj
+
 class Platform():
     '''
         <Platform> class.
     '''
+    # Requests per second and burst allowed to this platform by all the
+    # workers of a run. None to use the values in browser.cfg.
+    requestsPerSecond = None
+    requestsBurst = None
+    # Retries of the transient failures of the requests sent to this
+    # platform. None to use the value in browser.cfg.
+    maxRetries = None
+
     def __init__(self):
         '''
             Constructor without parameters...
@@ -158,24 +186,49 @@ class Platform():
         '''
             Method that checks the presence of a given query and recovers the first list of complains.
 
+            Kept for compatibility: query() returns the same entities without
+            serializing them.
+
             :param query:   Query to verify.
             :param proces:  Calling the processing function.
             :param mode:    Mode to be executed.
             :param qURI:    A query to be checked
 
-            :return:    Python structure for the html processed.
+            :return:    A json text with the entities found.
+        '''
+        return json.dumps(self.query(query=query, process=process, mode=mode, qURI=qURI))
+
+    def query(self, query=None, process = False, mode="phonefy", qURI=None, stats=None):
         '''
+            Method that checks the presence of a given query and recovers the first list of complains.
+
+            :param query:   Query to verify.
+            :param proces:  Calling the processing function.
+            :param mode:    Mode to be executed.
+            :param qURI:    A query to be checked
+            :param stats:   A dictionary to be filled with the attempts,
+                retries and outcome of the request, as in
+                <Browser.recoverURL>.
+
+            :return:    A list of the entities found.
+        '''
+        # Wrappers written for older versions may still override getInfo
+        if self.getInfo.im_func is not Platform.getInfo.im_func:
+            if qURI != None:
+                return json.loads(self.getInfo(query=query, process=process, mode=mode, qURI=qURI))
+            return json.loads(self.getInfo(query=query, process=process, mode=mode))
+
         # Defining variables for this process
         results = []
         data = ""
         if not self.modeIsValid(mode=mode):
             # TO-DO: InvalidModeException
-            return json.dumps(results)
+            return results
 
         # Verrifying if the mode is valid
         if not self._isValidQuery(query, mode=mode):
             # TO-DO: InvalidQueryException
-            return json.dumps(results)
+            return results
 
         # Verifying if the platform has an API defined
         try:
@@ -216,20 +269,25 @@ class Platform():
             else:
                 qURL, query = self.createURL(word=query, mode=mode)
             i3Browser = browser.Browser()
+            i3Browser.setRateLimit(self.platformName, self.requestsPerSecond, self.requestsBurst)
+            i3Browser.setRetries(self.maxRetries)
+            i3Browser.setCacheMode(mode)
+            # The download is stopped once the rest of the page is not needed
+            stopMarkers, maxBytes = self._getDownloadLimits(i3Browser, process=process, mode=mode)
             try:
                 # check if it needs creds
                 if self.needsCredentials[mode]:
                     authenticated = self._getAuthenticated(i3Browser)
                     if authenticated:
                         # Accessing the resources
-                        data = i3Browser.recoverURL(qURL)
+                        data = i3Browser.recoverURL(qURL, stopMarkers=stopMarkers, maxBytes=maxBytes, stats=stats)
                 else:
                     # Accessing the resources
-                    data = i3Browser.recoverURL(qURL)
+                    data = i3Browser.recoverURL(qURL, stopMarkers=stopMarkers, maxBytes=maxBytes, stats=stats)
             except:
                 # No information was found, then we return a null entity
                 # TO-DO: i3BrowserException
-                return json.dumps(results)
+                return results
 
             # Verifying if the platform exists
             if self.somethingFound(data, mode=mode):
@@ -256,8 +314,7 @@ class Platform():
 
                     # Iterating if requested to extract more entities from the URI
                     if process:
-                        # This function returns a json text!
-                        r["attributes"] += json.loads(self.processData(data=data, mode=mode))
+                        r["attributes"] += self._getEntities(data=data, mode=mode)
                     # Appending the result to results: in this case only one profile will be grabbed
                     results.append(r)
 
@@ -289,8 +346,7 @@ class Platform():
 
                     # Iterating if requested to extract more entities from the URI
                     if process:
-                        # This function returns a json text!
-                        r["attributes"] += json.loads(self.processData(data=data, mode=mode))
+                        r["attributes"] += self._getEntities(data=data, mode=mode)
 
                     # Appending the result to results: in this case only one profile will be grabbed
                     results.append(r)
@@ -343,7 +399,31 @@ class Platform():
                             r["attributes"] += json.loads(self.getInfo(process = True, mode="usufy", qURI=uri, query=i))
                         # Appending the result to results: in this case only one profile will be grabbed"""
                         results.append(r)
-        return json.dumps(results)
+        return _decodeEntities(results)
+
+    def _getDownloadLimits(self, i3Browser, process=False, mode="phonefy"):
+        '''
+            Method that defines when the download of a page can be stopped.
+
+            The not found clues are enough to discard a page, but only if this
+            wrapper relies on the default somethingFound method. The rest of a
+            long page is only needed if it is going to be processed.
+
+            :param i3Browser:   The browser that will recover the page.
+            :param process: Whether the page will be processed.
+            :param mode:    Mode to be executed.
+
+            :return:    A tuple with the list of markers and the maximum number
+                of bytes to be passed to recoverURL.
+        '''
+        stopMarkers = None
+        maxBytes = None
+        if self.somethingFound.im_func is Platform.somethingFound.im_func:
+            stopMarkers = self.notFoundText.get(mode)
+        # Searchfy needs the whole page to recover the aliases
+        if not process and mode != "searchfy":
+            maxBytes = i3Browser.maxBytes
+        return stopMarkers, maxBytes
 
     def modeIsValid(self, mode):
         '''
@@ -359,6 +439,21 @@ class Platform():
         return False
 
     def processData(self, uri=None, data = None, mode=None):
+        '''
+            Method to process and extract the entities of a URL of this type.
+
+            Kept for compatibility: extractEntities() returns the same entities
+            without serializing them.
+
+            :param uri: The URI of this platform to be processed.
+            :param data: The information from which the info will be extracted. This way, info will not be downloaded twice.
+            :param mode:    Mode to be executed.
+
+            :return:    A json text with the entities found.
+        '''
+        return json.dumps(self.extractEntities(uri=uri, data=data, mode=mode))
+
+    def extractEntities(self, uri=None, data = None, mode=None):
         '''
             Method to process and extract the entities of a URL of this type.
 
@@ -371,6 +466,9 @@ class Platform():
         if data == None:
             # Accessing the resource
             i3Browser = browser.Browser()
+            i3Browser.setRateLimit(self.platformName, self.requestsPerSecond, self.requestsBurst)
+            i3Browser.setRetries(self.maxRetries)
+            i3Browser.setCacheMode(mode)
             try:
                 # check if it needs creds
                 if self.needsCredentials[mode]:
@@ -384,44 +482,12 @@ class Platform():
             except:
                 # No information was found, then we return a null entity
                 # TO-DO: i3BrowserException
-                return json.dumps({})
-        #else:
-        #    return json.dumps({})
+                return []
         info = []
 
         # Searchfy needs an special treatment to recover the results
         if mode != "searchfy":
-            # Iterating through all the type of fields
-            for field in self.fieldsRegExp[mode].keys():
-                # Recovering the RegularExpression
-                try:
-                    # Using the old approach of "Start" + "End"
-                    regexp = self.fieldsRegExp[mode][field]["start"]+"([^\)]+)"+self.fieldsRegExp[mode][field]["end"]
-
-                    tmp = re.findall(regexp, data)
-
-                    # Now we are performing an operation just in case the "end" tag is found  in the results, which would mean that the tag selected matches something longer in the data.
-                    values = []
-                    for t in tmp:
-                        if self.fieldsRegExp[mode][field]["end"] in t:
-
-                            values.append(t.split(self.fieldsRegExp[mode][field]["end"])[0])
-                        else:
-                            values.append(t)
-
-                except:
-                    # Using the compact approach if start and end tags do not exist.
-                    regexp = self.fieldsRegExp[mode][field]
-
-                    values = re.findall(regexp, data)
-
-                for val in values:
-                    aux = {}
-                    aux["type"] = field
-                    aux["value"] = val
-                    aux["attributes"] = []
-                    if aux not in info:
-                        info.append(aux)
+            info = self._extractFields(data, mode=mode)
         # Searchfy results
         else:
             # Grabbing the results for the search
@@ -480,9 +546,113 @@ class Platform():
                             aux["attributes"] = []
                             if aux not in r["attributes"]:
                                 r["attributes"].append(aux) """
-                r["attributes"] = json.loads(self.getInfo(process = True, mode="usufy", qURI=resURI))
+                r["attributes"] = self.query(process = True, mode="usufy", qURI=resURI)
                 info.append(r)
-        return json.dumps(info)
+        return info
+
+    def _getEntities(self, uri=None, data=None, mode=None):
+        '''
+            Method that calls the processData of wrappers written for older
+            versions or extractEntities otherwise.
+
+            :param uri: The URI of this platform to be processed.
+            :param data: The information from which the info will be extracted.
+            :param mode:    Mode to be executed.
+
+            :return:    A list of the entities found.
+        '''
+        if self.processData.im_func is not Platform.processData.im_func:
+            return json.loads(self.processData(uri=uri, data=data, mode=mode))
+        return self.extractEntities(uri=uri, data=data, mode=mode)
+
+    def getNotFoundMatcher(self, mode="phonefy"):
+        '''
+            Recovering the matcher of the not found clues of a mode.
+
+            :param mode:    Mode to be executed.
+
+            :return:    A <MarkerMatcher> compiled once per process.
+        '''
+        return markers.getMatcher(self.notFoundText[mode])
+
+    def getExtractionPlan(self, mode="phonefy"):
+        '''
+            Recovering the compiled regular expressions of the fields of a mode.
+
+            The plan is built only once and each field is compiled again only
+            if its definition is changed.
+
+            :param mode:    Mode to be executed.
+
+            :return:    A dictionary {field: (definition, regexp, end)} where
+                end is None for the compact approach and regexp is None if
+                the definition could not be compiled.
+        '''
+        plans = getattr(self, "_extractionPlans", None)
+        if plans == None:
+            plans = self._extractionPlans = {}
+        plan = plans.setdefault(mode, {})
+
+        for field, definition in self.fieldsRegExp[mode].items():
+            if field not in plan or plan[field][0] != definition:
+                try:
+                    # Using the old approach of "Start" + "End"
+                    plan[field] = (dict(definition), re.compile(definition["start"]+"([^\)]+)"+definition["end"]), definition["end"])
+                except:
+                    try:
+                        # Using the compact approach if start and end tags do not exist.
+                        plan[field] = (definition, re.compile(definition), None)
+                    except:
+                        plan[field] = (definition, None, None)
+        return plan
+
+    def _extractFields(self, data, mode="phonefy"):
+        '''
+            Method that extracts the fields of a mode from a page.
+
+            :param data:    The information from which the info will be extracted.
+            :param mode:    Mode to be executed.
+
+            :return:    A list of the entities found.
+        '''
+        plan = self.getExtractionPlan(mode)
+        info = []
+        found = set()
+
+        # Iterating through all the type of fields
+        for field in self.fieldsRegExp[mode].keys():
+            definition, regexp, end = plan[field]
+            values = None
+
+            if end != None:
+                try:
+                    tmp = regexp.findall(data)
+
+                    # Now we are performing an operation just in case the "end" tag is found  in the results, which would mean that the tag selected matches something longer in the data.
+                    values = []
+                    for t in tmp:
+                        if end in t:
+                            values.append(t.split(end)[0])
+                        else:
+                            values.append(t)
+                except:
+                    values = None
+            elif regexp != None:
+                values = regexp.findall(data)
+
+            if values == None:
+                # Using the compact approach if start and end tags do not exist.
+                values = re.findall(definition, data)
+
+            for val in values:
+                if (field, val) not in found:
+                    found.add((field, val))
+                    aux = {}
+                    aux["type"] = field
+                    aux["value"] = val
+                    aux["attributes"] = []
+                    info.append(aux)
+        return info
 
     def somethingFound(self,data,mode="phonefy"):
         '''
@@ -494,10 +664,7 @@ class Platform():
             :return: Returns True if exists.
         '''
         #try:
-        for text in self.notFoundText[mode]:
-            if text in data:
-                return False
-        return True
+        return self.getNotFoundMatcher(mode).search(data) == None
         #except:
         #    pass
         #    # TO-DO: Throw notFoundText not found for this mode.
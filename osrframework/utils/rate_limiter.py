@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import multiprocessing
+import threading
+import time
+import zlib
+
+# Number of hosts or platforms that can be limited at the same time
+SLOTS = 4096
+# Retries allowed to each platform or host besides its share of the requests
+RETRY_BUDGET_MINIMUM = 10
+
+# Limiter of this process and of the workers forked from it
+_LIMITER = None
+_BUDGET = None
+_LIMITER_LOCK = threading.Lock()
+
+
+class SharedTable():
+    """
+        Table of keys in shared memory used by the threads and the forked
+        processes of a run.
+    """
+    def __init__(self, slots=SLOTS):
+        """
+            Creating the table in shared memory.
+
+            :param slots:   Maximum number of keys.
+        """
+        self.slots = slots
+        self._lock = multiprocessing.Lock()
+        self._keys = multiprocessing.RawArray("l", slots)
+
+    def _getSlot(self, key):
+        """
+            Finding the position of a key in the table, adding it if needed.
+            It must be called holding the lock.
+
+            :param key: The name of the platform or host.
+
+            :return:    The index of the slot.
+        """
+        h = (zlib.crc32(key) & 0x7fffffff) or 1
+        start = h % self.slots
+        for i in range(self.slots):
+            index = (start + i) % self.slots
+            if self._keys[index] == h:
+                return index
+            if self._keys[index] == 0:
+                self._keys[index] = h
+                return index
+        # The table is full, so this key shares a bucket with others
+        return start
+
+
+class RateLimiter(SharedTable):
+    """
+        Token buckets shared by the threads and the forked processes of a run.
+
+        Each key (a platform or a host) gets a bucket that refills at a given
+        rate up to a burst. The buckets are stored as the theoretical arrival
+        time of the next request (GCRA), which is the same as a token bucket
+        but needs a single float per key, so the whole table fits in shared
+        memory.
+    """
+    def __init__(self, slots=SLOTS):
+        """
+            Creating the table in shared memory.
+
+            :param slots:   Maximum number of keys.
+        """
+        SharedTable.__init__(self, slots)
+        self._arrivals = multiprocessing.RawArray("d", slots)
+
+    def reserve(self, key, requestsPerSecond, burst=1):
+        """
+            Reserving the next request of a key.
+
+            :param key: The name of the platform or host.
+            :param requestsPerSecond:   The rate at which the bucket refills.
+                If 0 or None, the key is not limited.
+            :param burst:   Number of requests that can be sent at once.
+
+            :return:    The seconds to wait before sending the request.
+        """
+        if not requestsPerSecond or requestsPerSecond <= 0:
+            return 0.0
+
+        interval = 1.0 / requestsPerSecond
+        tolerance = interval * (max(1, burst) - 1)
+
+        with self._lock:
+            index = self._getSlot(key)
+            now = time.time()
+            arrival = max(self._arrivals[index], now)
+            self._arrivals[index] = arrival + interval
+        return max(0.0, arrival - tolerance - now)
+
+    def wait(self, key, requestsPerSecond, burst=1):
+        """
+            Blocking until a request of a key can be sent.
+
+            :param key: The name of the platform or host.
+            :param requestsPerSecond:   The rate at which the bucket refills.
+            :param burst:   Number of requests that can be sent at once.
+
+            :return:    The seconds waited.
+        """
+        seconds = self.reserve(key, requestsPerSecond, burst)
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+
+class RetryBudget(SharedTable):
+    """
+        Retries allowed to each platform or host during a run.
+
+        Each key can retry a share of the requests sent to it, plus a few
+        more, so that a platform that is down is not hammered by all the
+        workers.
+    """
+    def __init__(self, slots=SLOTS):
+        """
+            Creating the table in shared memory.
+
+            :param slots:   Maximum number of keys.
+        """
+        SharedTable.__init__(self, slots)
+        self._requests = multiprocessing.RawArray("l", slots)
+        self._retries = multiprocessing.RawArray("l", slots)
+
+    def addRequest(self, key):
+        """
+            Counting a new request of a key.
+
+            :param key: The name of the platform or host.
+        """
+        with self._lock:
+            self._requests[self._getSlot(key)] += 1
+
+    def spend(self, key, ratio):
+        """
+            Taking a retry from the budget of a key.
+
+            :param key: The name of the platform or host.
+            :param ratio:   Retries allowed per request.
+
+            :return:    True if the request can be retried.
+        """
+        with self._lock:
+            index = self._getSlot(key)
+            if self._retries[index] < RETRY_BUDGET_MINIMUM + max(0, ratio) * self._requests[index]:
+                self._retries[index] += 1
+                return True
+            return False
+
+
+def getRetryBudget():
+    """
+        Recovering the retry budget of this process.
+
+        As the limiter, it has to be created before forking the workers so
+        that they share it.
+
+        :return:    The <RetryBudget>.
+    """
+    global _BUDGET
+    with _LIMITER_LOCK:
+        if _BUDGET == None:
+            _BUDGET = RetryBudget()
+        return _BUDGET
+
+
+def getRateLimiter():
+    """
+        Recovering the limiter of this process.
+
+        It has to be created before forking the workers so that they share it.
+        Workers that create their own one are only limited by themselves.
+
+        :return:    The <RateLimiter>.
+    """
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER == None:
+            _LIMITER = RateLimiter()
+        return _LIMITER
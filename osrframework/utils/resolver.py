@@ -0,0 +1,648 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import errno
+import heapq
+import json
+import os
+import random
+import select
+import socket
+import sqlite3
+import threading
+import time
+
+import osrframework.utils.configuration as configuration
+
+# File under appPathData where the answers are stored
+RESOLVER_CACHE_FILE = "dns_cache.sqlite"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS records (name TEXT, rtype TEXT, answers TEXT, expires REAL, PRIMARY KEY (name, rtype)) WITHOUT ROWID"
+]
+# Maximum number of parameters of each sqlite query
+BATCH_SIZE = 500
+# Bytes of the receive buffer of the sockets used by resolveMany
+RECEIVE_BUFFER = 4 * 1024 * 1024
+# Queries sent at once by resolveMany before any answer arrives and minimum
+#   number of them waiting for an answer when the name servers drop queries
+INITIAL_WINDOW = 64
+MIN_WINDOW = 8
+
+# Types of the records that can be resolved
+RECORD_TYPES = ["A", "AAAA", "MX"]
+
+
+class ResolverError(Exception):
+    """
+        Raised when none of the name servers gave a valid answer. These
+        failures are not cached.
+    """
+    pass
+
+
+class Resolver():
+    """
+        Resolver of A, AAAA and MX records shared by the threads of a process.
+
+        The answers are kept in memory and in a sqlite file during their TTL,
+        so the same names are not resolved again in the same run nor in the
+        next ones. The names that do not exist, or that have no records of the
+        type asked, are cached as empty answers for a shorter time. If several
+        threads ask for the same record at the same time, a single query is
+        sent and all of them receive its answer.
+    """
+    def __init__(self, nameservers=[], ttl=3600, negativeTtl=600, timeout=5, retries=2, path=None):
+        """
+            Creating the resolver.
+
+            :param nameservers: List of name servers as host or host:port. If
+                empty, the ones in /etc/resolv.conf are used.
+            :param ttl: Maximum seconds during which an answer is cached. The
+                TTL of the records is honoured if it is shorter. If 0, nothing
+                is cached.
+            :param negativeTtl: Seconds during which a name that does not
+                exist is cached.
+            :param timeout: Seconds to wait for each answer.
+            :param retries: Times that each query is sent again, to the next
+                name server, if it is not answered.
+            :param path:    The path to the sqlite file. By default,
+                dns_cache.sqlite under appPathData. If False, the answers are
+                only kept in memory.
+        """
+        if path == None:
+            path = os.path.join(configuration.getConfigPath()["appPathData"], RESOLVER_CACHE_FILE)
+        self.path = path
+        self.nameservers = nameservers
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self.timeout = timeout
+        self.retries = retries
+        self._created = False
+        # Connection to the sqlite file of each thread
+        self._local = threading.local()
+        # Name servers as addresses by the settings they were built from
+        self._servers = None
+
+        self._lock = threading.Lock()
+        # Answers cached as (expires, answers) by (name, rtype)
+        self._records = {}
+        # Lookups being performed as [event, answers, error] by (name, rtype)
+        self._inFlight = {}
+        self.stats = {
+            "requests": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "shared": 0,
+            "lookups": 0,
+            "negative": 0,
+            "failures": 0
+        }
+
+    def _connect(self):
+        """
+            Opening the sqlite file. Each thread keeps its own connection as
+            sqlite does not allow sharing them, and a new one is opened in the
+            processes forked from it.
+
+            :return:    A <sqlite3.Connection>.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn != None and self._local.owner == (os.getpid(), self.path):
+            return conn
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous = OFF")
+        self._local.conn = conn
+        self._local.owner = (os.getpid(), self.path)
+        if not self._created:
+            conn.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute("DELETE FROM records WHERE expires < ?", (time.time(), ))
+            conn.commit()
+            self._created = True
+        return conn
+
+    def _getServers(self):
+        """
+            Getting the name servers to be queried. The host names are
+            resolved so that the answers can be matched by the address they
+            come from.
+
+            :return:    A list of tuples (address, port).
+        """
+        import DNS
+
+        if self._servers != None and self._servers[0] == tuple(self.nameservers):
+            return self._servers[1]
+
+        nameservers = self.nameservers
+        if not nameservers:
+            if not DNS.defaults["server"]:
+                DNS.DiscoverNameServers()
+            nameservers = DNS.defaults["server"]
+
+        servers = []
+        for ns in nameservers:
+            # IPv6 servers do not admit a port
+            if ns.count(":") == 1:
+                host, port = ns.split(":")
+                port = int(port)
+            else:
+                host, port = ns, 53
+            try:
+                host = socket.getaddrinfo(host, port, 0, socket.SOCK_DGRAM)[0][4][0]
+            except socket.gaierror:
+                # The queries sent to it will fail and be retried elsewhere
+                pass
+            servers.append((host, port))
+        self._servers = (tuple(self.nameservers), servers)
+        return servers
+
+    def _getAnswers(self, response, rtype):
+        """
+            Getting the answers of a response of a name server.
+
+            :param response:    The <DNS.Lib.DnsResult>.
+            :param rtype:   The type of the records.
+
+            :return:    A tuple with the list of answers and their TTL. MX
+                answers are sorted by preference. None if the server could
+                not resolve the name and another one should be queried.
+        """
+        status = response.header["status"]
+        if status == "NXDOMAIN":
+            return [], min(self.ttl, self.negativeTtl)
+        if status != "NOERROR":
+            return None
+
+        records = [r for r in response.answers if r["typename"] == rtype]
+        if not records:
+            # The name exists but it has no records of this type
+            return [], min(self.ttl, self.negativeTtl)
+        if rtype == "MX":
+            answers = [host for preference, host in sorted([r["data"] for r in records])]
+        elif rtype == "AAAA":
+            answers = [socket.inet_ntop(socket.AF_INET6, r["data"]) for r in records]
+        else:
+            answers = [r["data"] for r in records]
+        return answers, min([self.ttl] + [r["ttl"] for r in records])
+
+    def _query(self, name, rtype):
+        """
+            Querying the name servers in turns until one of them answers or
+            the retries are exhausted.
+
+            :param name:    The name to be resolved.
+            :param rtype:   The type of the records.
+
+            :return:    A tuple with the list of answers and their TTL.
+        """
+        # It is only imported when a name is resolved
+        import DNS
+
+        error = "no name servers found"
+        servers = self._getServers()
+        for attempt in range(self.retries + 1 if servers else 0):
+            host, port = servers[attempt % len(servers)]
+            try:
+                response = DNS.DnsRequest(name, qtype=rtype, server=[host], port=port, timeout=self.timeout).req()
+            except (DNS.DNSError, socket.error), e:
+                error = host + ": " + str(e)
+                continue
+
+            answer = self._getAnswers(response, rtype)
+            if answer == None:
+                error = host + ": " + response.header["status"]
+                continue
+            return answer
+        raise ResolverError("'" + name + "' (" + rtype + ") could not be resolved: " + error)
+
+    def _loadMany(self, keys):
+        """
+            Recovering the answers stored on disk by this or a previous run.
+
+            :param keys:    List of tuples (name, rtype).
+
+            :return:    A dictionary with a tuple (expires, answers) for each
+                key found.
+        """
+        found = {}
+        if self.path == False or not keys:
+            return found
+        now = time.time()
+        conn = self._connect()
+        for rtype in set([k[1] for k in keys]):
+            names = [k[0] for k in keys if k[1] == rtype]
+            for i in range(0, len(names), BATCH_SIZE):
+                batch = names[i:i + BATCH_SIZE]
+                sql = "SELECT name, answers, expires FROM records WHERE rtype = ? AND expires >= ? AND name IN (" + ", ".join(["?"] * len(batch)) + ")"
+                for name, answers, expires in conn.execute(sql, [rtype, now] + batch):
+                    found[(name, rtype)] = expires, json.loads(answers)
+        return found
+
+    def _storeMany(self, records):
+        """
+            Storing some answers on disk.
+
+            :param records: List of tuples (key, expires, answers) where key is
+                a tuple (name, rtype).
+        """
+        if self.path == False or not records:
+            return
+        conn = self._connect()
+        try:
+            conn.executemany("INSERT OR REPLACE INTO records (name, rtype, answers, expires) VALUES (?, ?, ?, ?)", [key + (json.dumps(answers), expires) for key, expires, answers in records])
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
+    def resolve(self, name, rtype="A"):
+        """
+            Resolving a name.
+
+            :param name:    The name to be resolved.
+            :param rtype:   The type of the records: A, AAAA or MX.
+
+            :return:    A list with the addresses or, for MX records, the
+                hosts sorted by preference. It is empty if the name does not
+                exist or it has no records of that type.
+        """
+        rtype = rtype.upper()
+        if rtype not in RECORD_TYPES:
+            raise ValueError("Unsupported record type: " + rtype)
+        key = (name.lower().rstrip("."), rtype)
+
+        owner = False
+        with self._lock:
+            self.stats["requests"] += 1
+            cached = self._records.get(key)
+            if cached != None and cached[0] >= time.time():
+                self.stats["memory_hits"] += 1
+                return list(cached[1])
+            lookup = self._inFlight.get(key)
+            if lookup != None:
+                self.stats["shared"] += 1
+            else:
+                lookup = [threading.Event(), None, None, threading.current_thread()]
+                self._inFlight[key] = lookup
+                owner = True
+
+        if not owner:
+            # Another thread is resolving it. The wait is split so that the
+            # thread can still be interrupted
+            while not lookup[0].wait(1):
+                if not lookup[3].is_alive():
+                    with self._lock:
+                        if self._inFlight.get(key) is lookup:
+                            del self._inFlight[key]
+                    break
+            if lookup[2] != None:
+                raise lookup[2]
+            if lookup[1] != None:
+                return list(lookup[1])
+            # The owner is gone or failed unexpectedly
+            answers, ttl = self._query(key[0], rtype)
+            with self._lock:
+                self.stats["lookups"] += 1
+            return list(answers)
+
+        try:
+            cached = None
+            if self.ttl > 0:
+                cached = self._loadMany([key]).get(key)
+            if cached != None:
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._records[key] = cached
+            else:
+                answers, ttl = self._query(key[0], rtype)
+                cached = time.time() + ttl, answers
+                with self._lock:
+                    self.stats["lookups"] += 1
+                    if not answers:
+                        self.stats["negative"] += 1
+                    if ttl > 0:
+                        self._records[key] = cached
+                if ttl > 0:
+                    self._storeMany([(key, cached[0], answers)])
+            lookup[1] = cached[1]
+            return list(cached[1])
+        except ResolverError, e:
+            with self._lock:
+                self.stats["failures"] += 1
+            lookup[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._inFlight[key]
+            lookup[0].set()
+
+    def _openSocket(self, host):
+        """
+            Opening a non-blocking UDP socket to query a name server.
+
+            :param host:    The address of the name server.
+
+            :return:    A <socket.socket>.
+        """
+        sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Room for the answers that arrive while the previous ones are
+            # being processed
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        except socket.error:
+            pass
+        sock.setblocking(0)
+        return sock
+
+    def resolveMany(self, names, rtype="A", maxInFlight=1000, retries=None, timeout=None):
+        """
+            Generator that resolves a list of names at once, yielding each
+            answer as soon as it arrives.
+
+            The names not cached are queried from a single non-blocking UDP
+            socket per address family without waiting for the previous
+            answers. As name servers drop the queries when they are flooded,
+            the number of queries pending is adapted as TCP does: it doubles
+            with each round of answers, up to maxInFlight, until a query is not
+            answered in time. Then it is halved and it only grows by one with
+            each round.
+            A query that is not answered, or that the name server fails to
+            resolve, is sent again to the next name server, waiting twice as
+            long for each new attempt.
+
+            :param names:   List of names to be resolved.
+            :param rtype:   The type of the records: A, AAAA or MX.
+            :param maxInFlight: Maximum number of queries waiting for an
+                answer at the same time.
+            :param retries: Times that each query is sent again. By default,
+                the retries of the resolver.
+            :param timeout: Seconds to wait for the first answer. By default,
+                the timeout of the resolver.
+
+            :return:    Tuples (name, answers, error) in the order in which the
+                names are resolved, with the answers as returned by <resolve>.
+                If no name server answered, the answers are None and the error
+                is a <ResolverError>.
+        """
+        # It is only imported when a name is resolved
+        import DNS
+
+        rtype = rtype.upper()
+        if rtype not in RECORD_TYPES:
+            raise ValueError("Unsupported record type: " + rtype)
+        qtype = getattr(DNS.Type, rtype)
+        timeout = timeout or self.timeout
+        if retries == None:
+            retries = self.retries
+
+        # Names given for each record, in order
+        keys = collections.OrderedDict()
+        for name in names:
+            keys.setdefault((name.lower().rstrip("."), rtype), []).append(name)
+
+        # Answering first the records already cached
+        now = time.time()
+        ready = []
+        with self._lock:
+            self.stats["requests"] += len(names)
+            self.stats["shared"] += len(names) - len(keys)
+            for key in keys:
+                cached = self._records.get(key)
+                if cached != None and cached[0] >= now:
+                    self.stats["memory_hits"] += 1
+                    ready.append((key, cached[1]))
+        cachedKeys = set([key for key, answers in ready])
+        missing = [key for key in keys if key not in cachedKeys]
+        if self.ttl > 0:
+            stored = self._loadMany(missing)
+            with self._lock:
+                self.stats["disk_hits"] += len(stored)
+                self._records.update(stored)
+            ready += [(key, stored[key][1]) for key in missing if key in stored]
+            missing = [key for key in missing if key not in stored]
+        for key, answers in ready:
+            for name in keys[key]:
+                yield name, list(answers), None
+
+        servers = self._getServers()
+        queue = collections.deque([(key, 0) for key in missing])
+        # Queries sent as [key, attempt, server, deadline, sent] by transaction
+        # id
+        inFlight = {}
+        # Number of queries that can be waiting for an answer
+        window = min(maxInFlight, INITIAL_WINDOW)
+        # Size of the window when the queries started to be lost
+        threshold = maxInFlight
+        # Time when the window was last reduced
+        reduced = 0
+        # Heap of the queries sent as (deadline, transaction id, query)
+        deadlines = []
+        sockets = {}
+        # Answers waiting to be stored on disk
+        toStore = []
+
+        try:
+            while queue or inFlight:
+                resolved = []
+                failed = []
+
+                # Sending the queries until the limit is reached
+                while queue and len(inFlight) < window:
+                    key, attempt = queue.popleft()
+                    if not servers:
+                        failed.append((key, "no name servers found"))
+                        continue
+                    server = servers[attempt % len(servers)]
+                    tid = random.randint(0, 65535)
+                    while tid in inFlight:
+                        tid = random.randint(0, 65535)
+                    m = DNS.Lib.Mpacker()
+                    m.addHeader(tid, 0, DNS.Opcode.QUERY, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0)
+                    m.addQuestion(key[0], qtype, DNS.Class.IN)
+                    if server[0] not in sockets:
+                        sockets[server[0]] = self._openSocket(server[0])
+                    try:
+                        sockets[server[0]].sendto(m.getbuf(), server)
+                    except socket.error, e:
+                        if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK, errno.ENOBUFS]:
+                            # The socket is full: reading the answers first
+                            queue.appendleft((key, attempt))
+                            break
+                        if attempt < retries:
+                            queue.append((key, attempt + 1))
+                        else:
+                            failed.append((key, server[0] + ": " + str(e)))
+                        continue
+                    sent = time.time()
+                    query = [key, attempt, server, sent + timeout * 2 ** attempt, sent]
+                    inFlight[tid] = query
+                    heapq.heappush(deadlines, (query[3], tid, query))
+
+                # Waiting for the answers until the first deadline
+                wait = max(0, deadlines[0][0] - time.time()) if deadlines else 0
+                try:
+                    readable = select.select(sockets.values(), [], [], wait)[0] if sockets else []
+                except select.error, e:
+                    if e[0] != errno.EINTR:
+                        raise
+                    readable = []
+                # The queries are expired against the time when the sockets
+                # were checked, as the answers read afterwards were already
+                # waiting by then
+                now = time.time()
+                for sock in readable:
+                    while True:
+                        try:
+                            data, address = sock.recvfrom(65535)
+                        except socket.error:
+                            break
+                        try:
+                            response = DNS.Lib.DnsResult(DNS.Lib.Munpacker(data), {})
+                        except Exception:
+                            continue
+                        query = inFlight.get(response.header["id"])
+                        # Discarding the answers that do not match the query
+                        if query == None or address[:2] != query[2]:
+                            continue
+                        if not response.questions or response.questions[0]["qname"].lower().rstrip(".") != query[0][0]:
+                            continue
+                        del inFlight[response.header["id"]]
+                        window = min(maxInFlight, window + (1.0 if window < threshold else 1.0 / window))
+                        answer = self._getAnswers(response, rtype)
+                        if answer != None:
+                            resolved.append((query[0], answer))
+                        elif query[1] < retries:
+                            queue.append((query[0], query[1] + 1))
+                        else:
+                            failed.append((query[0], query[2][0] + ": " + response.header["status"]))
+
+                # Sending again the queries not answered in time
+                while deadlines and deadlines[0][0] <= now:
+                    deadline, tid, query = heapq.heappop(deadlines)
+                    if inFlight.get(tid) is not query:
+                        # Already answered
+                        continue
+                    del inFlight[tid]
+                    if query[4] > reduced:
+                        # Only once for the queries sent at the same time
+                        window = max(MIN_WINDOW, window / 2)
+                        threshold = window
+                        reduced = now
+                    if query[1] < retries:
+                        queue.append((query[0], query[1] + 1))
+                    else:
+                        failed.append((query[0], query[2][0] + ": Timeout"))
+                while deadlines and inFlight.get(deadlines[0][1]) is not deadlines[0][2]:
+                    heapq.heappop(deadlines)
+
+                with self._lock:
+                    self.stats["lookups"] += len(resolved)
+                    self.stats["failures"] += len(failed)
+                    for key, (answers, ttl) in resolved:
+                        if not answers:
+                            self.stats["negative"] += 1
+                        if ttl > 0:
+                            self._records[key] = now + ttl, answers
+                            toStore.append((key, now + ttl, answers))
+                if len(toStore) >= BATCH_SIZE:
+                    self._storeMany(toStore)
+                    toStore = []
+
+                for key, (answers, ttl) in resolved:
+                    for name in keys[key]:
+                        yield name, list(answers), None
+                for key, error in failed:
+                    for name in keys[key]:
+                        yield name, None, ResolverError("'" + name + "' (" + rtype + ") could not be resolved: " + error)
+        finally:
+            for sock in sockets.values():
+                sock.close()
+            self._storeMany(toStore)
+
+    def getStats(self):
+        """
+            Getting the usage of the cache by this process.
+
+            :return:    A dictionary with the counters and the hit rate, the
+                share of the requests answered without querying the name
+                servers.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+        hits = stats["memory_hits"] + stats["disk_hits"] + stats["shared"]
+        stats["hit_rate"] = float(hits) / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def clear(self):
+        """
+            Removing all the answers cached.
+        """
+        with self._lock:
+            self._records = {}
+        if self.path != False and os.path.exists(self.path):
+            conn = self._connect()
+            conn.execute("DELETE FROM records")
+            conn.commit()
+
+
+# Resolver of this process
+_RESOLVER = {"resolver": None}
+
+
+def getResolver(nameservers=None, ttl=None, negativeTtl=None, path=None):
+    """
+        Recovering the resolver of this process. The settings provided are
+        applied to it and the rest are kept.
+
+        :param nameservers: List of name servers as host or host:port.
+        :param ttl: Maximum seconds during which an answer is cached.
+        :param negativeTtl: Seconds during which a name that does not exist is
+            cached.
+        :param path:    The path to the sqlite file. If provided, the resolver
+            of this process is replaced by a new one using it.
+
+        :return:    The <Resolver>.
+    """
+    if _RESOLVER["resolver"] == None or (path != None and path != _RESOLVER["resolver"].path):
+        _RESOLVER["resolver"] = Resolver(path=path)
+    resolver = _RESOLVER["resolver"]
+    if nameservers != None:
+        resolver.nameservers = nameservers
+    if ttl != None:
+        resolver.ttl = ttl
+    if negativeTtl != None:
+        resolver.negativeTtl = negativeTtl
+    return resolver
+
+
+def getStatsSummary(stats):
+    """
+        Describing the usage of the cache in a line.
+
+        :param stats:   The dictionary returned by <Resolver.getStats>.
+
+        :return:    A string.
+    """
+    return str(stats["requests"]) + " DNS request(s), " + str(stats["lookups"]) + " sent to the name servers (" + str(stats["negative"]) + " not found, " + str(stats["failures"]) + " failed), " + "%.1f" % (stats["hit_rate"] * 100) + "% answered from the cache."
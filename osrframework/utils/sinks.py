@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import csv
+import json
+import threading
+
+# Extensions of the stream files written next to the output files
+STREAM_EXTENSIONS = {
+    "csv": ".stream.csv",
+    "jsonl": ".stream.jsonl"
+}
+
+
+class Sink():
+    """
+        Base class of the writers that store each entity as soon as it is
+        found.
+
+        The entities are written and flushed one by one, so the results are
+        not lost if the program is stopped and do not need to be kept in
+        memory until the end of the run to be exported.
+    """
+    def __init__(self, fPath):
+        """
+            Creating the sink. A previous file with the same path is emptied.
+
+            :param fPath:   The path to the output file.
+        """
+        self.fPath = fPath
+        # Number of entities written
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(fPath, "wb")
+        self._start()
+
+    def _start(self):
+        """
+            Writing the contents needed at the beginning of the file.
+        """
+        pass
+
+    def _write(self, entity):
+        """
+            Writing an entity in the file.
+
+            :param entity:  An i3visio entity.
+        """
+        raise NotImplementedError("The sinks must implement _write.")
+
+    def write(self, entity):
+        """
+            Storing an entity.
+
+            :param entity:  An i3visio entity with its `value`, `type` and
+                `attributes`.
+        """
+        with self._lock:
+            self._write(entity)
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        """
+            Closing the output file.
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class JsonLinesSink(Sink):
+    """
+        Sink that writes each entity as a JSON object in its own line.
+    """
+    def _write(self, entity):
+        self._file.write(json.dumps(entity, sort_keys=True) + "\n")
+
+
+class CsvSink(Sink):
+    """
+        Sink that writes a CSV row for each attribute of the entities.
+
+        As the attributes of the entities are not known in advance, the file
+        uses a fixed set of columns: the number of the entity, its value and
+        the type and value of each attribute. The types are written as in the
+        tabular exports, e. g. i3visio_platform.
+    """
+    COLUMNS = ["_id", "value", "attribute", "attribute_value"]
+
+    def _start(self):
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(self.COLUMNS)
+
+    def _write(self, entity):
+        for a in entity.get("attributes", []):
+            header = a["type"]
+            if header.startswith("@"):
+                header = header.replace("@", "_")
+            else:
+                header = header.replace("i3visio.", "i3visio_")
+            row = [self.count + 1, entity["value"], header, a["value"]]
+            self._writer.writerow([unicode(cell).encode("utf-8") for cell in row])
+
+
+# Classes of the sinks that can be selected
+SINKS = {
+    "csv": CsvSink,
+    "jsonl": JsonLinesSink
+}
+
+
+class SinkGroup():
+    """
+        Set of sinks that receive the same entities.
+    """
+    def __init__(self, sinks=[]):
+        """
+            Creating the group.
+
+            :param sinks:   A list of <Sink> objects.
+        """
+        self.sinks = list(sinks)
+
+    def write(self, entity):
+        """
+            Storing an entity in all the sinks.
+
+            :param entity:  An i3visio entity.
+        """
+        for sink in self.sinks:
+            sink.write(entity)
+
+    def writeAll(self, entities):
+        """
+            Storing a list of entities in all the sinks.
+
+            :param entities:    A list of i3visio entities.
+        """
+        for entity in entities:
+            self.write(entity)
+
+    def getPath(self, streamFormat):
+        """
+            Recovering the path of the sink of a format.
+
+            :param streamFormat:    One of the keys of SINKS.
+
+            :return:    The path to the file or None if the format was not
+                selected.
+        """
+        for sink in self.sinks:
+            if isinstance(sink, SINKS[streamFormat]):
+                return sink.fPath
+        return None
+
+    def close(self):
+        """
+            Closing all the sinks.
+        """
+        for sink in self.sinks:
+            sink.close()
+
+
+def getSinks(fileHeader, streamFormats=["jsonl"]):
+    """
+        Opening the sinks of a run next to the output files.
+
+        :param fileHeader:  The header of the output files. The streams are
+            stored as <fileHeader>.stream.<format>.
+        :param streamFormats:   A list with the formats to be streamed.
+
+        :return:    A <SinkGroup>.
+    """
+    return SinkGroup([SINKS[f](fileHeader + STREAM_EXTENSIONS[f]) for f in streamFormats])
+
+
+def readJsonLines(fPath):
+    """
+        Generator that recovers the entities stored by a <JsonLinesSink>.
+
+        :param fPath:   The path to the file.
+
+        :return:    The entities in the order in which they were written. A
+            line left incomplete by a crash is ignored.
+    """
+    with open(fPath, "r") as iF:
+        for line in iF:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
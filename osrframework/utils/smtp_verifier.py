@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import logging
+import smtplib
+import socket
+
+import osrframework.utils.resolver as resolver
+import osrframework.utils.task_runner as task_runner
+
+# Outcomes of the verification of an email
+FOUND = "found"
+NOT_FOUND = "not_found"
+UNKNOWN = "unknown"
+
+# Words used by the servers when a mailbox does not exist
+NOT_FOUND_WORDS = [
+    "does not exist",
+    "doesn't exist",
+    "rejected",
+    "disabled",
+    "discontinued",
+    "unavailable",
+    "unknown",
+    "invalid",
+    "doesn't handle",
+    "no such user",
+    "not found"
+]
+
+
+def getMXHosts(domain):
+    """
+        Resolving the mail servers of a domain.
+
+        :param domain:  The domain of the emails.
+
+        :return:    A list with the hosts of the MX records sorted by
+            preference. If the domain has no MX records, the domain itself is
+            returned as its implicit mail server.
+    """
+    try:
+        hosts = resolver.getResolver().resolve(domain, "MX")
+    except (resolver.ResolverError, IOError, socket.error):
+        hosts = []
+    return hosts or [domain]
+
+
+def classifyResponse(code, message):
+    """
+        Getting the outcome of the answer of a server to a RCPT TO command.
+
+        :param code:    The SMTP code.
+        :param message: The text of the answer.
+
+        :return:    FOUND, NOT_FOUND or UNKNOWN.
+    """
+    if code in [250, 251]:
+        return FOUND
+    if code in [550, 551, 553]:
+        return NOT_FOUND
+    if code >= 500 and any(w in str(message).lower() for w in NOT_FOUND_WORDS):
+        return NOT_FOUND
+    return UNKNOWN
+
+
+class SMTPVerifier():
+    """
+        Verifier of the existence of emails that reuses the SMTP sessions.
+
+        The emails are grouped by domain and the MX records of each domain are
+        resolved once. The emails of each mail server are then checked by a
+        few sessions at the same time, each of them sending many RCPT TO
+        commands after a single connection, HELO and MAIL FROM. When a server
+        refuses more recipients in the same transaction, the transaction is
+        reset; if it closes the session, a new one is opened.
+    """
+    def __init__(self, fromHost="example.com", fromEmail="verify@example.com", port=0, timeout=10, sessionsPerHost=2, rcptPerSession=50, maxReconnections=3, getMX=getMXHosts):
+        """
+            Creating a verifier.
+
+            :param fromHost:    The host announced in the HELO command.
+            :param fromEmail:   The sender of the MAIL FROM command.
+            :param port:    The port of the mail servers. If 0, the standard
+                port is used unless the host is given as host:port.
+            :param timeout: Seconds to wait for each answer of the servers.
+            :param sessionsPerHost: Maximum number of sessions opened at the
+                same time with the same mail server. At least 1.
+            :param rcptPerSession:  Maximum number of RCPT TO commands sent in
+                each transaction. At least 1.
+            :param maxReconnections:    Number of times that a session closed
+                by the server is opened again before giving up.
+            :param getMX:   Function that receives a domain and returns the
+                list of its mail servers sorted by preference.
+        """
+        self.fromHost = fromHost
+        self.fromEmail = fromEmail
+        self.port = port
+        self.timeout = timeout
+        self.sessionsPerHost = max(1, sessionsPerHost)
+        self.rcptPerSession = max(1, rcptPerSession)
+        self.maxReconnections = maxReconnections
+        self.getMX = getMX
+
+    def getTasks(self, emails, nThreads=16):
+        """
+            Grouping the emails in the batches to be verified by each session.
+
+            :param emails:  The list of emails.
+            :param nThreads:    Number of MX lookups launched at once.
+
+            :return:    A list of tuples (mail server, list of emails).
+        """
+        domains = collections.OrderedDict()
+        for email in emails:
+            domains.setdefault(email.split("@")[1].lower(), []).append(email)
+
+        # Resolving each domain once
+        runner = task_runner.TaskRunner(lambda domain: (domain, self.getMX(domain)), nThreads=nThreads, useThreads=True)
+        mx = dict(runner.run([(domain,) for domain in domains.keys()]))
+
+        # Several domains may share their mail servers
+        hosts = collections.OrderedDict()
+        for domain, domainEmails in domains.items():
+            servers = mx.get(domain) or [domain]
+            hosts.setdefault(servers[0], []).extend(domainEmails)
+
+        tasks = []
+        for host, hostEmails in hosts.items():
+            # Splitting the emails between the sessions of each server
+            size = min(self.rcptPerSession, (len(hostEmails) + self.sessionsPerHost - 1) / self.sessionsPerHost)
+            for i in range(0, len(hostEmails), size):
+                tasks.append((host, hostEmails[i:i + size]))
+        return tasks
+
+    def _openSession(self, host):
+        """
+            Opening a session and starting a transaction.
+
+            :param host:    The mail server.
+
+            :return:    A <smtplib.SMTP> ready to receive RCPT TO commands or
+                None if the server did not accept the session.
+        """
+        session = smtplib.SMTP(local_hostname=self.fromHost, timeout=self.timeout)
+        try:
+            code, message = session.connect(host, self.port)
+            if code != 220:
+                raise smtplib.SMTPException("Unexpected banner: " + str(code))
+            code, message = session.helo(self.fromHost)
+            if code != 250:
+                raise smtplib.SMTPException("HELO refused: " + str(code))
+            code, message = session.mail(self.fromEmail)
+            if code != 250:
+                raise smtplib.SMTPException("MAIL FROM refused: " + str(code))
+        except (smtplib.SMTPException, socket.error), e:
+            logging.getLogger("osrframework.utils").debug("The session with " + host + " could not be opened: " + str(e))
+            # smtplib only creates the socket once the host is reached
+            if getattr(session, "sock", None) != None:
+                session.close()
+            return None
+        return session
+
+    def verifyBatch(self, host, emails):
+        """
+            Verifying a list of emails handled by the same server.
+
+            :param host:    The mail server.
+            :param emails:  The list of emails.
+
+            :return:    A list of tuples (email, outcome, SMTP code), one per
+                email. The code is None if the email could not be checked.
+        """
+        results = []
+        pending = collections.deque(emails)
+        session = None
+        # Sessions closed or refused in a row
+        failures = 0
+        sent = 0
+        while len(pending) > 0:
+            if session == None:
+                if failures > self.maxReconnections:
+                    break
+                session = self._openSession(host)
+                sent = 0
+                if session == None:
+                    failures += 1
+                    continue
+
+            try:
+                if sent >= self.rcptPerSession:
+                    # Starting a new transaction in the same session
+                    session.rset()
+                    session.mail(self.fromEmail)
+                    sent = 0
+                code, message = session.rcpt(pending[0])
+            except (smtplib.SMTPException, socket.error):
+                # The server closed the session: opening a new one
+                session.close()
+                session = None
+                failures += 1
+                continue
+
+            if code == 452 and sent > 0:
+                # Too many recipients in this transaction
+                sent = self.rcptPerSession
+                continue
+            if code == 421:
+                # The server is closing the session
+                session.close()
+                session = None
+                failures += 1
+                continue
+
+            results.append((pending.popleft(), classifyResponse(code, message), code))
+            sent += 1
+            failures = 0
+
+        if session != None:
+            try:
+                session.quit()
+            except (smtplib.SMTPException, socket.error):
+                session.close()
+
+        # The emails that could not be checked
+        for email in pending:
+            results.append((email, UNKNOWN, None))
+        return results
+
+    def getRunner(self, nThreads=16, secondsBeforeTimeout=None):
+        """
+            Creating the runner of the batches returned by getTasks.
+
+            :param nThreads:    Maximum number of sessions opened at once.
+            :param secondsBeforeTimeout:    Deadline of the whole verification.
+
+            :return:    A <task_runner.TaskRunner> that limits the sessions
+                opened with each server.
+        """
+        return task_runner.TaskRunner(self.verifyBatch, nThreads=nThreads, secondsBeforeTimeout=secondsBeforeTimeout, useThreads=True, getKey=lambda parameters: parameters[0], maxPerKey=self.sessionsPerHost)
+
+    def verify(self, emails, nThreads=16):
+        """
+            Verifying a list of emails.
+
+            :param emails:  The list of emails.
+            :param nThreads:    Maximum number of sessions opened at once.
+
+            :return:    A dictionary where the keys are the emails and the
+                values their outcome: FOUND, NOT_FOUND or UNKNOWN.
+        """
+        res = {}
+        for results in self.getRunner(nThreads).run(self.getTasks(emails, nThreads)):
+            for email, outcome, code in results:
+                res[email] = outcome
+        return res
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import logging
+import Queue
+import signal
+import time
+import traceback
+
+# global issues for multiprocessing
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+
+def launchTask(function, index, args):
+    """
+    Function run by the workers to launch each and every task.
+
+    Args:
+    -----
+        function: The function to be called.
+        index: The position of the task in the list of tasks.
+        args: A tuple with the parameters of the function.
+
+    Returns:
+    --------
+        tuple: The index of the task and the value returned by the function.
+            If the function crashed, the value is None.
+    """
+    try:
+        return index, function(*args)
+    except Exception as e:
+        logger = logging.getLogger("osrframework.utils")
+        logger.error("The task " + str(index) + " crashed:\n" + traceback.format_exc())
+        return index, None
+
+
+class TaskRunner():
+    """
+        Utility that launches tasks in a pool and yields their results as
+        soon as they are completed.
+
+        The tasks are sent to the workers as they become free. If a key is
+        given for the tasks, e. g. the host that they query, the runner takes
+        them from each key in turns and limits how many of them run at the
+        same time, so a long list of tasks for the same key does not keep the
+        rest waiting.
+    """
+    def __init__(self, function, nThreads=16, secondsBeforeTimeout=None, useThreads=False, getKey=None, maxPerKey=0):
+        """
+            Creating a new runner.
+
+            :param function:    Function to be called for each task. It must be
+                defined at module level so as to be sent to the processes.
+            :param nThreads:    Maximum number of tasks running at the same time.
+                If 0, one worker per task will be used.
+            :param secondsBeforeTimeout:    Global deadline in seconds for the
+                whole list of tasks. If None, the runner waits for all of them.
+            :param useThreads:  Whether to use a pool of threads instead of a
+                pool of processes.
+            :param getKey:  Function that receives the parameters of a task
+                and returns the key used to interleave the tasks. If None, the
+                tasks are launched in order.
+            :param maxPerKey:   Maximum number of tasks with the same key
+                running at the same time. If 0, there is no limit.
+        """
+        self.function = function
+        self.nThreads = nThreads
+        self.secondsBeforeTimeout = secondsBeforeTimeout
+        self.useThreads = useThreads
+        self.getKey = getKey
+        self.maxPerKey = maxPerKey
+        # Whether the deadline stopped the last run
+        self.timedOut = False
+
+        self._pool = None
+        self._tasks = []
+        self._pendingIndexes = set()
+        # Indexes of the tasks not sent yet grouped by key, in turn order
+        self._waiting = collections.OrderedDict()
+        # Number of tasks of each key being run and key of each of them
+        self._running = {}
+        self._keys = {}
+
+    def _createPool(self, nThreads):
+        """
+            Creating the pool where the workers ignore <Ctrl + C>, which is
+            captured by the main process.
+
+            :param nThreads:    Number of workers of the pool.
+
+            :return:    The pool.
+        """
+        if self.useThreads:
+            return ThreadPool(nThreads)
+
+        # Example catched from: https://stackoverflow.com/questions/11312525/catch-ctrlc-sigint-and-exit-multiprocesses-gracefully-in-python
+        try:
+            original_sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+            pool = Pool(nThreads)
+            signal.signal(signal.SIGINT, original_sigint_handler)
+        except ValueError:
+            # To avoid: ValueError: signal only works in main thread
+            pool = Pool(nThreads)
+        return pool
+
+    def run(self, tasks):
+        """
+            Generator that launches the tasks and yields their results in the
+            same order in which they are completed.
+
+            The main process blocks on a completion queue instead of polling
+            the results, so it does not consume CPU while waiting. If the
+            deadline is reached, the pending tasks are cancelled and the
+            generator stops. The KeyboardInterrupt is raised again after
+            terminating the workers.
+
+            No more than nThreads tasks are sent to the pool at once so that
+            the next task can be chosen from the key whose turn it is.
+
+            :param tasks:   List of tuples with the parameters of each task.
+
+            :return:    The values returned by the function. The tasks that
+                crashed are not yielded.
+        """
+        self._tasks = list(tasks)
+        self._pendingIndexes = set(range(len(self._tasks)))
+        self.timedOut = False
+
+        self._waiting = collections.OrderedDict()
+        self._running = {}
+        self._keys = {}
+        for i, args in enumerate(self._tasks):
+            if self.getKey != None:
+                key = self.getKey(args)
+            else:
+                key = None
+            self._waiting.setdefault(key, collections.deque()).append(i)
+
+        if len(self._tasks) == 0:
+            return
+
+        nThreads = self.nThreads
+        if nThreads <= 0 or nThreads > len(self._tasks):
+            nThreads = len(self._tasks)
+
+        if self.secondsBeforeTimeout != None:
+            deadline = time.time() + self.secondsBeforeTimeout
+        else:
+            deadline = None
+
+        completed = Queue.Queue()
+        self._pool = self._createPool(nThreads)
+        try:
+            self._submit(completed, nThreads)
+
+            while len(self._pendingIndexes) > 0:
+                # Waits without a timeout cannot be interrupted in Python 2
+                wait = 1
+                if deadline != None:
+                    wait = min(wait, deadline - time.time())
+                    if wait <= 0:
+                        self.timedOut = True
+                        break
+                try:
+                    index, result = completed.get(timeout=wait)
+                except Queue.Empty:
+                    continue
+
+                self._pendingIndexes.discard(index)
+                key = self._keys.pop(index)
+                self._running[key] -= 1
+                self._submit(completed, nThreads)
+                if result != None:
+                    yield result
+        except (KeyboardInterrupt, GeneratorExit):
+            self.terminate()
+            raise
+
+        if self.timedOut:
+            self.terminate()
+        else:
+            self._pool.close()
+            self._pool.join()
+
+    def _submit(self, completed, nThreads):
+        """
+            Sending tasks to the pool while there are free workers.
+
+            The keys are visited in turns: the next task is taken from the
+            first key in the queue that has not reached maxPerKey, which is
+            then moved to the end of the queue.
+
+            :param completed:   Queue where the results are put.
+            :param nThreads:    Maximum number of tasks running at once.
+        """
+        while len(self._keys) < nThreads and len(self._waiting) > 0:
+            for chosen in self._waiting:
+                if self.maxPerKey <= 0 or self._running.get(chosen, 0) < self.maxPerKey:
+                    break
+            else:
+                # All the keys waiting have reached their limit
+                return
+
+            indexes = self._waiting.pop(chosen)
+            index = indexes.popleft()
+            if len(indexes) > 0:
+                self._waiting[chosen] = indexes
+            self._running[chosen] = self._running.get(chosen, 0) + 1
+            self._keys[index] = chosen
+            # The callback is run by a thread of the main process
+            self._pool.apply_async(launchTask, args=(self.function, index, self._tasks[index]), callback=completed.put)
+
+    def getPending(self):
+        """
+            Recovering the tasks that have not been completed yet.
+
+            :return:    A list with the parameters of the pending tasks.
+        """
+        return [ self._tasks[i] for i in sorted(self._pendingIndexes) ]
+
+    def terminate(self):
+        """
+            Stopping the workers without waiting for the pending tasks.
+        """
+        if self._pool != None:
+            self._pool.terminate()
+            self._pool.join()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import json
+
+# Outcomes of a check
+FOUND = "found"
+NOT_FOUND = "not_found"
+ERROR = "error"
+
+# Failures of the requests that are timeouts, as classified by the browser
+TIMEOUTS = ["connect_timeout", "read_timeout"]
+
+# Phases of the requests whose seconds are recorded
+PHASES = ["dns", "connect", "ttfb", "download"]
+
+
+def getRecord(platform, nick, data, stats, start, end, status="DONE"):
+    """
+        Building the telemetry record of a check.
+
+        :param platform:    The name of the platform.
+        :param nick:    The query checked.
+        :param data:    The entities found.
+        :param stats:   The stats filled by <Browser.recoverURL>, which are
+            empty if the platform did not use the browser.
+        :param start:   Time when the check started.
+        :param end: Time when the check finished.
+        :param status:  "DONE" or "ERROR" if the check raised an exception.
+
+        :return:    A dictionary that can be serialized as json.
+    """
+    reason = stats.get("outcome")
+    if status != "DONE" or reason not in [None, "ok", "not_found"]:
+        outcome = ERROR
+    elif data:
+        outcome = FOUND
+    else:
+        outcome = NOT_FOUND
+
+    record = {
+        "platform": platform,
+        "nick": nick,
+        "time": round(start, 3),
+        "seconds": round(end - start, 4),
+        "outcome": outcome,
+        "reason": reason,
+        "status": stats.get("status"),
+        "attempts": stats.get("attempts", 0),
+        "retries": stats.get("retries", 0),
+        "failures": stats.get("failures", []),
+        "bytes": stats.get("bytes", 0),
+        "cached": stats.get("cached", False)
+    }
+    for phase in PHASES:
+        record[phase] = round(stats.get(phase, 0.0), 4)
+    return record
+
+
+def _getPercentile(values, percentile):
+    """
+        Recovering a percentile of a list of values.
+
+        :param values:  The sorted list of values.
+        :param percentile:  A number between 0 and 100.
+
+        :return:    The value of the percentile (nearest rank) or None if the
+            list is empty.
+    """
+    if not values:
+        return None
+    index = int(round(percentile / 100.0 * (len(values) - 1)))
+    return values[index]
+
+
+def getSummary(records):
+    """
+        Aggregating the telemetry records by platform.
+
+        :param records: List of records as returned by getRecord.
+
+        :return:    A dictionary where the keys are the platforms and the
+            values dictionaries with the number of checks of each outcome,
+            the timeouts, the retries, the mean, p50, p95 and max seconds of
+            the checks, the mean seconds of each phase and the bytes read.
+    """
+    byPlatform = {}
+    for record in records:
+        byPlatform.setdefault(record["platform"], []).append(record)
+
+    summary = {}
+    for platform, platformRecords in byPlatform.items():
+        seconds = sorted([r["seconds"] for r in platformRecords])
+        checks = len(platformRecords)
+        s = {
+            "checks": checks,
+            FOUND: len([r for r in platformRecords if r["outcome"] == FOUND]),
+            NOT_FOUND: len([r for r in platformRecords if r["outcome"] == NOT_FOUND]),
+            ERROR: len([r for r in platformRecords if r["outcome"] == ERROR]),
+            "timeouts": len([r for r in platformRecords if r["reason"] in TIMEOUTS]),
+            "retries": sum([r["retries"] for r in platformRecords]),
+            "mean_seconds": sum(seconds) / checks,
+            "p50_seconds": _getPercentile(seconds, 50),
+            "p95_seconds": _getPercentile(seconds, 95),
+            "max_seconds": seconds[-1],
+            "bytes": sum([r["bytes"] for r in platformRecords])
+        }
+        for phase in PHASES:
+            s["mean_" + phase] = sum([r[phase] for r in platformRecords]) / checks
+        summary[platform] = s
+    return summary
+
+
+def getSummaryTable(summary):
+    """
+        Showing the summary of the platforms as a table, slowest first.
+
+        :param summary: Dictionary as returned by getSummary.
+
+        :return:    A unicode representation of the table.
+    """
+    import pyexcel as pe
+    import pyexcel.ext.text as text
+
+    rows = [["Platform", "Checks", "Found", "Not found", "Errors", "Timeouts", "Retries", "Mean (s)", "P95 (s)", "DNS (s)", "Connect (s)", "TTFB (s)", "Download (s)", "KB"]]
+    for platform in sorted(summary.keys(), key=lambda p: summary[p]["mean_seconds"], reverse=True):
+        s = summary[platform]
+        row = [platform, s["checks"], s[FOUND], s[NOT_FOUND], s[ERROR], s["timeouts"], s["retries"]]
+        row += ["%.3f" % s[k] for k in ["mean_seconds", "p95_seconds", "mean_dns", "mean_connect", "mean_ttfb", "mean_download"]]
+        row.append(s["bytes"] / 1024)
+        rows.append(row)
+
+    sheet = pe.Sheet(rows)
+    sheet.name = "Telemetry of the platforms"
+    sheet.name_columns_by_row(0)
+    text.TABLEFMT = "grid"
+    return unicode(sheet)
+
+
+def writeRecords(records, fPath):
+    """
+        Writing the telemetry records as a json-lines file.
+
+        :param records: List of records as returned by getRecord.
+        :param fPath:   The path to the file, which is overwritten.
+    """
+    with open(fPath, "w") as oF:
+        for record in records:
+            oF.write(json.dumps(record, sort_keys=True) + "\n")
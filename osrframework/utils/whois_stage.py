@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+#
+################################################################################
+#
+#    Copyright 2017 Félix Brezo and Yaiza Rubio (i3visio, contacto@i3visio.com)
+#
+#    This file is part of OSRFramework. You can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+################################################################################
+
+import collections
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import Queue
+
+import osrframework.utils.configuration as configuration
+
+# File under appPathData where the whois info is stored
+WHOIS_CACHE_FILE = "whois_cache.sqlite"
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS whois (domain TEXT PRIMARY KEY, info TEXT, checked REAL) WITHOUT ROWID"
+]
+
+# Words used by the whois servers when they refuse to answer more queries
+THROTTLE_WORDS = [
+    "limit exceeded",
+    "rate limit",
+    "too many",
+    "exceeded the maximum",
+    "query limit",
+    "try again later",
+    "quota",
+    # The answer of python-whois when the server closes the connection
+    "socket not responding"
+]
+
+
+class WhoisThrottledError(Exception):
+    """
+        Raised by the lookups when the whois server refuses to answer.
+    """
+    pass
+
+
+def isThrottled(text):
+    """
+        Checking if the answer of a whois server is a refusal.
+
+        :param text:    The text returned by the server.
+
+        :return:    Whether the server is throttling the queries.
+    """
+    text = unicode(text).lower()
+    return any(w in text for w in THROTTLE_WORDS)
+
+
+def getWhoisServer(domain):
+    """
+        Getting the whois server queried for a domain.
+
+        :param domain:  The domain.
+
+        :return:    The host of the whois server.
+    """
+    # It is only imported if --whois is used
+    import whois
+
+    return whois.NICClient().choose_server(domain) or domain.split(".")[-1]
+
+
+class WhoisCache():
+    """
+        Store of the whois info of the domains.
+
+        The whois info of a domain rarely changes, so it is kept for days
+        instead of querying the registries, which limit the queries of each
+        client, in every run. The answers of the throttled lookups are never
+        stored.
+    """
+    def __init__(self, path=None):
+        """
+            Opening the store.
+
+            :param path:    The path to the sqlite file. By default,
+                whois_cache.sqlite under appPathData.
+        """
+        if path == None:
+            path = os.path.join(configuration.getConfigPath()["appPathData"], WHOIS_CACHE_FILE)
+        self.path = path
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self):
+        """
+            Opening the sqlite file.
+
+            :return:    A <sqlite3.Connection>.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous = OFF")
+        return conn
+
+    def get(self, domain, ttl, now=None):
+        """
+            Recovering the whois info of a domain stored during the TTL.
+
+            :param domain:  The domain.
+            :param ttl: Seconds during which the info is valid.
+            :param now: The current time.
+
+            :return:    The list of i3visio attributes or None if it is not
+                stored.
+        """
+        now = now or time.time()
+        if ttl <= 0:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT info FROM whois WHERE domain = ? AND checked >= ?", (domain.lower(), now - ttl)).fetchone()
+        finally:
+            conn.close()
+        if row == None:
+            return None
+        return json.loads(row[0])
+
+    def put(self, domain, info, now=None):
+        """
+            Storing the whois info of a domain.
+
+            :param domain:  The domain.
+            :param info:    The list of i3visio attributes.
+            :param now: The time of the lookup.
+        """
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO whois (domain, info, checked) VALUES (?, ?, ?)", (domain.lower(), json.dumps(info), now))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def purge(self, ttl, now=None):
+        """
+            Removing the info older than a TTL.
+
+            :param ttl: Seconds during which the info is kept.
+            :param now: The current time.
+
+            :return:    The number of domains removed.
+        """
+        now = now or time.time()
+        conn = self._connect()
+        try:
+            removed = conn.execute("DELETE FROM whois WHERE checked < ?", (now - ttl, )).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return removed
+
+
+# Store of this process
+_CACHE = {"cache": None}
+
+
+def getWhoisCache(path=None):
+    """
+        Recovering the whois cache of this process.
+
+        :param path:    The path to the sqlite file. If provided, the cache of
+            this process is moved to it.
+
+        :return:    The <WhoisCache>.
+    """
+    if _CACHE["cache"] == None or (path != None and path != _CACHE["cache"].path):
+        _CACHE["cache"] = WhoisCache(path)
+    return _CACHE["cache"]
+
+
+class WhoisStage():
+    """
+        Stage of a pipeline that recovers the whois info of the domains
+        submitted to it in the background.
+
+        The lookups are run by a pool of threads that takes them from each
+        whois server in turns, with a limit of lookups running at the same
+        time against the same server. If a server throttles the queries, it
+        is left alone for a while, doubling the pause each time, and only one
+        lookup at a time is sent to it afterwards. The domains that are still
+        refused after some retries, or whose lookup failed, are returned
+        without whois info. The info of the successful lookups is stored in a
+        <WhoisCache> and the domains found there are returned without any
+        lookup.
+    """
+    def __init__(self, lookup, nThreads=8, maxPerServer=2, cache=None, ttl=30 * 24 * 3600, retries=3, backoff=10, getServer=getWhoisServer):
+        """
+            Starting the stage.
+
+            :param lookup:  Function that receives a domain and returns its
+                whois info as a list of i3visio attributes. It must raise a
+                <WhoisThrottledError> if the server refused to answer.
+            :param nThreads:    Number of lookups running at the same time.
+            :param maxPerServer:    Maximum number of lookups running at the
+                same time against the same server.
+            :param cache:   The <WhoisCache> or None to disable it.
+            :param ttl: Seconds during which the cached info is valid.
+            :param retries: Times that a throttled lookup is tried again.
+            :param backoff: Seconds of the first pause of a server that
+                throttles the queries.
+            :param getServer:   Function that receives a domain and returns
+                the whois server that will be queried.
+        """
+        self.lookup = lookup
+        self.maxPerServer = maxPerServer
+        self.cache = cache
+        self.ttl = ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.getServer = getServer
+
+        self._condition = threading.Condition()
+        # Lookups waiting as [domain, payload, attempts] by server, in turns
+        self._waiting = collections.OrderedDict()
+        # Lookups running, lookups allowed and end of the pause of each server
+        self._running = collections.Counter()
+        self._limits = {}
+        self._pausedUntil = {}
+        self._throttles = collections.Counter()
+        self._pending = 0
+        self._closed = False
+        self._results = Queue.Queue()
+        self.stats = {
+            "submitted": 0,
+            "cached": 0,
+            "lookups": 0,
+            "throttled": 0,
+            "given_up": 0,
+            "failed": 0
+        }
+
+        self._threads = []
+        for i in range(max(1, nThreads)):
+            t = threading.Thread(target=self._work)
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, domain, payload=None):
+        """
+            Adding a domain to the stage.
+
+            :param domain:  The domain.
+            :param payload: Anything that is returned with its result.
+        """
+        with self._condition:
+            self.stats["submitted"] += 1
+            self._pending += 1
+
+        info = self.cache.get(domain, self.ttl) if self.cache != None else None
+        if info != None:
+            with self._condition:
+                self.stats["cached"] += 1
+            self._results.put((domain, payload, info))
+            return
+
+        server = self.getServer(domain)
+        with self._condition:
+            self._waiting.setdefault(server, collections.deque()).append([domain, payload, 0])
+            self._condition.notify()
+
+    def _next(self):
+        """
+            Taking the next lookup from the server whose turn it is. It must be
+            called holding the condition.
+
+            :return:    A tuple (server, lookup) or None if no server can be
+                queried now, and the seconds until the first pause ends.
+        """
+        now = time.time()
+        wait = None
+        for server in list(self._waiting.keys()):
+            pausedUntil = self._pausedUntil.get(server, 0)
+            if pausedUntil > now:
+                wait = min(wait or pausedUntil - now, pausedUntil - now)
+                continue
+            if self._running[server] >= self._limits.get(server, self.maxPerServer):
+                continue
+            lookups = self._waiting.pop(server)
+            item = lookups.popleft()
+            if lookups:
+                # Moving the server to the end of the turns
+                self._waiting[server] = lookups
+            return (server, item), None
+        return None, wait
+
+    def _work(self):
+        """
+            Loop of the threads that run the lookups.
+        """
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        return
+                    task, wait = self._next()
+                    if task != None:
+                        break
+                    self._condition.wait(wait)
+                server, item = task
+                self._running[server] += 1
+
+            domain, payload, attempts = item
+            throttled = failed = False
+            try:
+                info = self.lookup(domain)
+            except WhoisThrottledError:
+                throttled = True
+            except Exception as e:
+                # Timeouts, resets and unparseable answers are not cached so
+                # that the next runs try again
+                logging.getLogger("osrframework.utils").debug("The whois info of " + domain + " could not be recovered: " + str(e))
+                info = []
+                failed = True
+
+            with self._condition:
+                self._running[server] -= 1
+                self.stats["lookups"] += 1
+                if failed:
+                    self.stats["failed"] += 1
+                if throttled:
+                    self.stats["throttled"] += 1
+                    self._throttles[server] += 1
+                    # Leaving the server alone and querying it one at a time
+                    self._pausedUntil[server] = time.time() + self.backoff * 2 ** (self._throttles[server] - 1)
+                    self._limits[server] = 1
+                    if attempts < self.retries:
+                        item[2] += 1
+                        self._waiting.setdefault(server, collections.deque()).appendleft(item)
+                        self._condition.notify_all()
+                        continue
+                    self.stats["given_up"] += 1
+                    info = []
+                self._condition.notify_all()
+
+            if not throttled and not failed and self.cache != None:
+                try:
+                    self.cache.put(domain, info)
+                except sqlite3.Error as e:
+                    logging.getLogger("osrframework.utils").warning("The whois info of " + domain + " could not be cached: " + str(e))
+            self._results.put((domain, payload, info))
+
+    def getResults(self, block=False, timeout=None):
+        """
+            Recovering the lookups completed since the last call.
+
+            :param block:   Whether to wait for at least one of them if there
+                are lookups pending.
+            :param timeout: Maximum seconds to wait.
+
+            :return:    A list of tuples (domain, payload, info).
+        """
+        results = []
+        try:
+            if block and self.getPending() > 0:
+                results.append(self._results.get(True, timeout))
+            while True:
+                results.append(self._results.get_nowait())
+        except Queue.Empty:
+            pass
+        with self._condition:
+            self._pending -= len(results)
+        return results
+
+    def getPending(self):
+        """
+            Counting the domains whose result has not been recovered yet.
+
+            :return:    The number of domains.
+        """
+        with self._condition:
+            return self._pending
+
+    def close(self, timeout=1):
+        """
+            Stopping the threads.
+
+            :param timeout: Maximum seconds to wait for the lookups running.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        deadline = time.time() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.time()))
+
+
+def getStatsSummary(stats):
+    """
+        Describing the work of a stage in a line.
+
+        :param stats:   The stats of a <WhoisStage>.
+
+        :return:    A string.
+    """
+    return str(stats["submitted"]) + " domain(s), " + str(stats["cached"]) + " answered from the cache, " + str(stats["lookups"]) + " lookup(s) (" + str(stats["throttled"]) + " throttled, " + str(stats["given_up"]) + " given up, " + str(stats["failed"]) + " failed)."
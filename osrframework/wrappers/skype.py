@@ -29,10 +29,8 @@ import urllib2
 
 import osrframework.utils.browser as browser
 import osrframework.utils.general as general
-import osrframework.thirdparties.skype.checkInSkype as skype
 from osrframework.utils.platforms import Platform
 
-import Skype4Py
 
 class Skype(Platform):
     """
@@ -115,7 +113,7 @@ class Skype(Platform):
         self.foundFields = {}
 
 
-    def processData(self, uri=None, data=None, mode=None):
+    def extractEntities(self, uri=None, data=None, mode=None):
         '''
             Method that process the data in a Skype User.
 
@@ -135,24 +133,30 @@ class Skype(Platform):
             aux["attributes"] = {}
 
             info.append(aux)
-        return json.dumps(info)
+        return info
 
-    def getInfo(self, query=None, process = False, mode="usufy"):
+    def query(self, query=None, process = False, mode="usufy", qURI=None, stats=None):
         '''
             Method that checks the presence of a given query and recovers the first list of complains.
 
             :param query: Phone number to verify.
             :param proces:  Calling the processing function.
             :param mode:    Mode to be executed.
+            :param qURI:    Not used, as no URL is requested.
+            :param stats:   A dictionary to be filled with the attempts and the
+                outcome of the query, as in <Browser.recoverURL>.
 
-            :return:    Python structure for the html processed.
+            :return:    A list of the entities found.
         '''
         # Defining variables for this process
         results = []
         data = ""
+        if stats == None:
+            stats = {}
+        stats.update({"attempts": 0, "retries": 0, "failures": [], "outcome": None, "status": None, "dns": 0.0, "connect": 0.0, "ttfb": 0.0, "download": 0.0, "bytes": 0, "cached": False})
         if not self.modeIsValid(mode=mode):
             # TO-DO: InvalidModeException
-            return json.dumps(results)
+            return results
 
         try:
             logger = logging.getLogger("osrframework.wrappers")
@@ -164,6 +168,9 @@ class Skype(Platform):
                 # Instantiate Skype object, all further actions are done
                 # using this object.
 
+                # Skype4Py is only imported when Skype is queried
+                import osrframework.thirdparties.skype.checkInSkype as skype
+
                 # Dealing with UTF8
                 import codecs
                 import sys
@@ -174,12 +181,15 @@ class Skype(Platform):
                 # Search for users and display their Skype name, full name
                 # and country.
                 #print "In skype.py, before sending the query: '" + query + "'"
+                stats["attempts"] += 1
                 data = skype.checkInSkype(query)
+                stats["outcome"] = "ok"
                 #print "In skype.py, printing the 'data' variable:\n" + json.dumps(data, indent=2)
         except Exception as e:
             print(general.warning("[!] In skype.py, exception caught when checking information in Skype!\n"))
+            stats["outcome"] = "error"
             # No information was found, then we return a null entity
-            return json.dumps(results)
+            return results
 
         # Verifying if the platform exists
         if mode == "usufy":
@@ -190,4 +200,4 @@ class Skype(Platform):
             results = data
 
     	#print "In skype.py, printing the 'results' variable:\n" + json.dumps(results, indent=2)
-        return json.dumps(results)
+        return results
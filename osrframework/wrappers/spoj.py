@@ -120,11 +120,8 @@ class Spoj(Platform):
             :return: Returns True if exists.
         '''
         #try:
-        for text in self.notFoundText[mode]:
-            if text in data:
-                # This is the change with regards to the standard behaviour!
-                return True
-        return False
+        # This is the change with regards to the standard behaviour!
+        return self.getNotFoundMatcher(mode).search(data) != None
         #except:
         #    pass
         #    # TO-DO: Throw notFoundText not found for this mode.        
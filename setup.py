@@ -182,7 +182,6 @@ setup(
     long_description=long_description,
     install_requires=[
         "setuptools",
-        "mechanize",
         "Skype4Py",
         "requests",
         "python-emailahoy",